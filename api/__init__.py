@@ -12,6 +12,12 @@ from .therapist import therapists_ns
 from .bookings import bookings_ns
 from .reviews import reviews_ns
 from .notifications import notifications_ns
+from .admin import admin_ns
+from .commands import (
+    archive_partitions_command, create_partitions_command, dispatch_outbox_command, import_data_command,
+    purge_deleted_command, purge_idempotency_keys_command, reconcile_ratings_command,
+    refresh_leaderboard_command, refresh_stats_command
+)
 
 
 api = Flask(__name__)
@@ -52,4 +58,16 @@ restx_api.add_namespace(users_ns, path='/users')
 restx_api.add_namespace(therapists_ns, path='/therapists')
 restx_api.add_namespace(bookings_ns, path='/bookings')
 restx_api.add_namespace(reviews_ns, path='/reviews')
-restx_api.add_namespace(notifications_ns, path='/notifications')
\ No newline at end of file
+restx_api.add_namespace(notifications_ns, path='/notifications')
+restx_api.add_namespace(admin_ns, path='/admin')
+
+# CLI maintenance: flask --app api <command>
+api.cli.add_command(refresh_leaderboard_command)
+api.cli.add_command(reconcile_ratings_command)
+api.cli.add_command(import_data_command)
+api.cli.add_command(purge_idempotency_keys_command)
+api.cli.add_command(dispatch_outbox_command)
+api.cli.add_command(refresh_stats_command)
+api.cli.add_command(create_partitions_command)
+api.cli.add_command(archive_partitions_command)
+api.cli.add_command(purge_deleted_command)
@@ -0,0 +1,52 @@
+from datetime import timedelta
+from flask_restx import Namespace, Resource, reqparse
+from flask_jwt_extended import get_jwt, jwt_required
+from sqlalchemy.exc import SQLAlchemyError
+
+from .utils.helper import parse_datetime
+from .utils.response import success_response, error_response
+from .query.q_stats import STATS_GRANULARITIES, get_admin_stats
+
+
+admin_ns = Namespace('admin', description='Endpoint dashboard admin')
+
+stats_parser = reqparse.RequestParser()
+stats_parser.add_argument(
+    'from', type=parse_datetime, required=True, location='args',
+    help="Awal periode (YYYY-MM-DD)"
+)
+stats_parser.add_argument(
+    'to', type=parse_datetime, required=True, location='args',
+    help="Akhir periode, eksklusif (YYYY-MM-DD), maksimal 3 tahun dari 'from'"
+)
+stats_parser.add_argument(
+    'granularity', type=str, required=False, default='day', location='args',
+    help="Granularity: day, week atau month (default day)"
+)
+
+
+@admin_ns.route('/stats')
+class AdminStatsResource(Resource):
+    @jwt_required()
+    @admin_ns.expect(stats_parser)
+    def get(self):
+        """Statistik dashboard admin dari tabel rollup (booking per status, user baru, review per therapist)"""
+        claims = get_jwt()
+        if claims.get("role") != "admin":
+            return error_response("Forbidden: admin only", 403)
+        args = stats_parser.parse_args()
+        start, end, granularity = args["from"].date(), args["to"].date(), args["granularity"]
+        if granularity not in STATS_GRANULARITIES:
+            return error_response(f"granularity must be one of: {', '.join(STATS_GRANULARITIES)}", 400)
+        if end <= start:
+            return error_response("'to' must be after 'from'", 400)
+        if end - start > timedelta(days=3 * 366):
+            return error_response("Period cannot be longer than 3 years", 400)
+        try:
+            stats = get_admin_stats(start, end, granularity)
+            if stats is None:
+                return error_response("Failed to fetch stats", 500)
+            return success_response("Admin stats fetched successfully", stats, 200)
+        except SQLAlchemyError as e:
+            admin_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
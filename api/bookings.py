@@ -1,10 +1,17 @@
-from flask import request
+import csv
+import io
+import json
+
+from flask import Response, request, stream_with_context
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from sqlalchemy.exc import SQLAlchemyError
 
-from .utils.response import success_response, error_response
-from .query.q_bookings import create_booking, get_booking_by_id_and_role, get_bookings_by_role, soft_delete_booking_by_id, update_booking_status
+from .utils.helper import parse_datetime, parse_fields
+from .utils.schedule import RECURRENCE_STEPS, SESSION_DURATIONS, expand_recurrence
+from .utils.response import etag_headers, is_not_modified, not_modified_response, success_response, error_response
+from .query.q_bookings import BOOKING_EXPORT_COLUMNS, BOOKING_LIST_COLUMNS, BOOKING_LIST_PRESETS, BOOKING_SERIES_MAX, BOOKING_STATUSES, BOOKING_TRANSITIONS, create_booking, create_booking_series, insert_booking, get_booking_by_id_and_role, get_booking_version, get_bookings_by_role, iter_bookings_export, soft_delete_booking_by_id, update_booking_status
+from .query.q_idempotency import idempotent_response
 
 
 bookings_ns = Namespace('bookings', description='Endpoint untuk manajemen booking')
@@ -14,6 +21,38 @@ booking_model = bookings_ns.model('CreateBooking', {
     "location": fields.String(required=True, description="Lokasi booking"),
     "booking_time": fields.DateTime(required=True, description="Waktu booking (YYYY-MM-DD HH:MM:SS)"),
     "notes": fields.String(required=False, description="Catatan tambahan"),
+    "session_type": fields.String(
+        required=False,
+        description="Jenis sesi, menentukan durasi (default 60 menit)",
+        enum=list(SESSION_DURATIONS)
+    ),
+})
+
+recurrence_model = bookings_ns.model('BookingRecurrence', {
+    "start": fields.DateTime(required=True, description="Waktu sesi pertama (YYYY-MM-DDTHH:MM)"),
+    "frequency": fields.String(required=True, description="Frekuensi", enum=list(RECURRENCE_STEPS)),
+    "interval": fields.Integer(required=False, default=1, description="Setiap n hari/minggu (default 1)"),
+    "count": fields.Integer(required=True, description=f"Jumlah sesi (maks {BOOKING_SERIES_MAX})"),
+})
+
+booking_series_model = bookings_ns.model('CreateBookingSeries', {
+    "therapist_id": fields.Integer(required=True, description="ID therapist"),
+    "location": fields.String(required=True, description="Lokasi booking"),
+    "notes": fields.String(required=False, description="Catatan tambahan"),
+    "session_type": fields.String(
+        required=False,
+        description="Jenis sesi, menentukan durasi (default 60 menit)",
+        enum=list(SESSION_DURATIONS)
+    ),
+    "recurrence": fields.Nested(recurrence_model, required=False, description="Aturan recurrence"),
+    "booking_times": fields.List(
+        fields.DateTime, required=False,
+        description="Atau daftar waktu booking eksplisit (pilih salah satu dengan recurrence)"
+    ),
+    "mode": fields.String(
+        required=False, default="atomic", enum=["atomic", "partial"],
+        description="atomic: satu konflik membatalkan semua, partial: booking yang bentrok dilewati"
+    ),
 })
 
 status_parser = bookings_ns.parser()
@@ -22,12 +61,74 @@ status_parser.add_argument(
     help="Status booking (accepted, rejected, completed)", location="args"
 )
 
+booking_list_parser = bookings_ns.parser()
+booking_list_parser.add_argument(
+    "fields", type=str, required=False, location="args",
+    help="Field yang dikembalikan, pisahkan dengan koma (atau preset 'lean')"
+)
+booking_list_parser.add_argument(
+    "status_booking", type=str, required=False, location="args",
+    help="Filter status booking (pending, accepted, rejected, completed)"
+)
+booking_list_parser.add_argument(
+    "from", type=parse_datetime, required=False, location="args",
+    help="Booking mulai dari waktu ini (YYYY-MM-DDTHH:MM)"
+)
+booking_list_parser.add_argument(
+    "to", type=parse_datetime, required=False, location="args",
+    help="Booking sebelum waktu ini (YYYY-MM-DDTHH:MM)"
+)
+booking_list_parser.add_argument(
+    "therapist_id", type=int, required=False, location="args",
+    help="Filter berdasarkan therapist"
+)
+booking_list_parser.add_argument(
+    "user_id", type=int, required=False, location="args",
+    help="Filter berdasarkan user"
+)
+booking_list_parser.add_argument(
+    "limit", type=int, required=False, location="args",
+    help="Jumlah booking per halaman (default 50, maks 200)"
+)
+booking_list_parser.add_argument(
+    "cursor", type=str, required=False, location="args",
+    help="Cursor halaman berikutnya (ambil dari meta.next_cursor)"
+)
+
+# format export -> (mimetype, ekstensi file)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+booking_export_parser = bookings_ns.parser()
+booking_export_parser.add_argument(
+    "format", type=str, required=False, default="csv", location="args",
+    help="Format export: csv atau ndjson (default csv)"
+)
+booking_export_parser.add_argument(
+    "from", type=parse_datetime, required=False, location="args",
+    help="Booking mulai dari waktu ini (YYYY-MM-DDTHH:MM)"
+)
+booking_export_parser.add_argument(
+    "to", type=parse_datetime, required=False, location="args",
+    help="Booking sebelum waktu ini (YYYY-MM-DDTHH:MM)"
+)
+
+def booking_created_response(new_booking):
+    if not new_booking:
+        return error_response("Failed to create booking", 400)
+    if "error" in new_booking:
+        return error_response(new_booking["error"], 409)
+    return success_response("Booking created successfully", new_booking, 201)
+
+
 @bookings_ns.route('')
 class BookingsResource(Resource):
     @jwt_required()
     @bookings_ns.expect(booking_model)
     def post(self):
-        """Buat booking baru (user only)"""
+        """Buat booking baru (user only), mendukung header Idempotency-Key"""
         claims = get_jwt()
         user_id = get_jwt_identity()
         
@@ -38,44 +139,192 @@ class BookingsResource(Resource):
         payload = request.get_json()
         if not payload:
             return error_response("No input data provided", 400)
+        if payload.get("session_type") and payload["session_type"] not in SESSION_DURATIONS:
+            return error_response(f"session_type must be one of: {', '.join(SESSION_DURATIONS)}", 400)
 
         try:
-            new_booking = create_booking(user_id, payload)
-            if not new_booking:
-                return error_response("Failed to create booking", 400)
-            return success_response("Booking created successfully", new_booking, 201)
+            key = request.headers.get("Idempotency-Key")
+            if key:
+                return idempotent_response(
+                    user_id, "POST /bookings", key, payload,
+                    lambda connection: booking_created_response(insert_booking(connection, user_id, payload))
+                )
+            return booking_created_response(create_booking(user_id, payload))
         except SQLAlchemyError as e:
             bookings_ns.logger.error(f"Database error: {str(e)}")
             return error_response("Internal server error", 500)
         
     @jwt_required()
+    @bookings_ns.expect(booking_list_parser)
     def get(self):
-        """List semua booking (admin bisa lihat semua, user hanya miliknya, therapist hanya yang masuk ke dia)"""
+        """List booking per halaman dengan filter (admin bisa lihat semua, user hanya miliknya, therapist hanya yang masuk ke dia)"""
         claims = get_jwt()
         user_id = get_jwt_identity()
         role = claims.get("role")
+        args = booking_list_parser.parse_args()
+        try:
+            fields = parse_fields(args.get("fields"), BOOKING_LIST_COLUMNS, BOOKING_LIST_PRESETS)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        if args.get("status_booking") and args["status_booking"] not in BOOKING_STATUSES:
+            return error_response(f"status_booking must be one of: {', '.join(BOOKING_STATUSES)}", 400)
+        if args.get("from") and args.get("to") and args["from"] >= args["to"]:
+            return error_response("'to' must be after 'from'", 400)
+        try:
+            bookings, next_cursor = get_bookings_by_role(
+                role, user_id,
+                fields=fields,
+                status_booking=args.get("status_booking"),
+                date_from=args.get("from"),
+                date_to=args.get("to"),
+                therapist_id=args.get("therapist_id"),
+                filter_user_id=args.get("user_id"),
+                limit=args.get("limit"),
+                cursor=args.get("cursor")
+            )
+            return success_response("Bookings retrieved successfully", bookings, 200, meta={"next_cursor": next_cursor})
+        except ValueError:
+            return error_response("Invalid cursor", 400)
+        except SQLAlchemyError as e:
+            bookings_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+def _series_booking_times(payload):
+    """Ambil list waktu booking dari recurrence atau booking_times, raise ValueError jika tidak valid"""
+    recurrence = payload.get("recurrence")
+    booking_times = payload.get("booking_times")
+    if bool(recurrence) == bool(booking_times):
+        raise ValueError("Provide either recurrence or booking_times")
+    if recurrence:
+        frequency = recurrence.get("frequency")
+        if frequency not in RECURRENCE_STEPS:
+            raise ValueError(f"recurrence.frequency must be one of: {', '.join(RECURRENCE_STEPS)}")
         try:
-            bookings = get_bookings_by_role(role, user_id)
-            return success_response("Bookings retrieved successfully", bookings, 200)
+            interval = int(recurrence.get("interval") or 1)
+            count = int(recurrence.get("count") or 0)
+        except (TypeError, ValueError):
+            raise ValueError("recurrence.interval and recurrence.count must be integers")
+        if interval < 1 or not 1 <= count <= BOOKING_SERIES_MAX:
+            raise ValueError(f"recurrence.interval must be >= 1 and count between 1 and {BOOKING_SERIES_MAX}")
+        start = parse_datetime(recurrence.get("start"))
+        return expand_recurrence(start, frequency, interval, count)
+    if not isinstance(booking_times, list) or len(booking_times) > BOOKING_SERIES_MAX:
+        raise ValueError(f"booking_times must be a list of at most {BOOKING_SERIES_MAX} items")
+    return sorted({parse_datetime(value) for value in booking_times})
+
+
+@bookings_ns.route('/series')
+class BookingSeriesResource(Resource):
+    @jwt_required()
+    @bookings_ns.expect(booking_series_model)
+    def post(self):
+        """Buat beberapa booking sekaligus dari recurrence atau daftar waktu (user only)"""
+        claims = get_jwt()
+        user_id = get_jwt_identity()
+        if claims.get("role") != "user":
+            return error_response("Forbidden: only user can create booking", 403)
+
+        payload = request.get_json()
+        if not payload:
+            return error_response("No input data provided", 400)
+        if not payload.get("therapist_id") or not payload.get("location"):
+            return error_response("therapist_id and location are required", 400)
+        if payload.get("session_type") and payload["session_type"] not in SESSION_DURATIONS:
+            return error_response(f"session_type must be one of: {', '.join(SESSION_DURATIONS)}", 400)
+        mode = payload.get("mode") or "atomic"
+        if mode not in ("atomic", "partial"):
+            return error_response("mode must be atomic or partial", 400)
+        try:
+            booking_times = _series_booking_times(payload)
+        except (TypeError, ValueError) as e:
+            return error_response(str(e) or "Invalid booking time", 400)
+
+        try:
+            series = create_booking_series(user_id, payload, booking_times, atomic=(mode == "atomic"))
+            if not series:
+                return error_response("Failed to create bookings", 400)
+            if "error" in series:
+                return error_response(series["error"], 409, data={"conflicts": series["conflicts"]})
+            if not series["created"]:
+                return error_response("All bookings conflict with existing bookings", 409, data=series)
+            return success_response("Bookings created successfully", series, 201)
         except SQLAlchemyError as e:
             bookings_ns.logger.error(f"Database error: {str(e)}")
             return error_response("Internal server error", 500)
 
 
+def _export_chunks(export_format, batches):
+    """Ubah tiap batch baris jadi satu chunk text (CSV dengan header, atau NDJSON)"""
+    try:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(BOOKING_EXPORT_COLUMNS)
+            for batch in batches:
+                for row in batch:
+                    writer.writerow(["" if row[col] is None else row[col] for col in BOOKING_EXPORT_COLUMNS])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            for batch in batches:
+                yield "".join(
+                    json.dumps({col: row[col] for col in BOOKING_EXPORT_COLUMNS}, default=str) + "\n"
+                    for row in batch
+                )
+    except SQLAlchemyError as e:
+        # header 200 sudah terkirim, response hanya bisa diputus
+        bookings_ns.logger.error(f"Database error during export: {str(e)}")
+
+
+@bookings_ns.route('/export')
+class BookingExportResource(Resource):
+    @jwt_required()
+    @bookings_ns.expect(booking_export_parser)
+    def get(self):
+        """Export booking sebagai CSV/NDJSON yang di-stream (admin only)"""
+        claims = get_jwt()
+        if claims.get("role") != "admin":
+            return error_response("Forbidden: only admin can export bookings", 403)
+        args = booking_export_parser.parse_args()
+        export_format = (args.get("format") or "csv").lower()
+        if export_format not in EXPORT_FORMATS:
+            return error_response(f"format must be one of: {', '.join(EXPORT_FORMATS)}", 400)
+        if args.get("from") and args.get("to") and args["from"] >= args["to"]:
+            return error_response("'to' must be after 'from'", 400)
+
+        batches = iter_bookings_export(date_from=args.get("from"), date_to=args.get("to"))
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        return Response(
+            stream_with_context(_export_chunks(export_format, batches)),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename=bookings.{extension}"}
+        )
+
+
 @bookings_ns.route('/<int:id_booking>')
 @bookings_ns.param('id_booking', 'ID booking yang ingin diambil')
 class BookingDetailResource(Resource):
     @jwt_required()
     def get(self, id_booking):
-        """Detail booking tertentu (admin, user, therapist)"""
+        """Detail booking tertentu (admin, user, therapist), mendukung If-None-Match"""
         claims = get_jwt()
         user_id = get_jwt_identity()
         role = claims.get("role")
         try:
+            etag = get_booking_version(id_booking, role, user_id)
+            if is_not_modified(etag):
+                return not_modified_response(etag)
             booking = get_booking_by_id_and_role(id_booking, role, user_id)
             if not booking:
                 return error_response("Booking not found or forbidden", 404)
-            return success_response("Booking detail retrieved successfully", booking, 200)
+            return success_response(
+                "Booking detail retrieved successfully", booking, 200,
+                headers=etag_headers(etag) if etag else None
+            )
         except SQLAlchemyError as e:
             bookings_ns.logger.error(f"Database error: {str(e)}")
             return error_response("Internal server error", 500)
@@ -112,11 +361,15 @@ class BookingStatusResource(Resource):
 
         if not new_status:
             return error_response("status_booking is required", 400)
+        if new_status not in BOOKING_TRANSITIONS:
+            return error_response(f"status_booking must be one of: {', '.join(BOOKING_TRANSITIONS)}", 400)
 
         try:
             updated = update_booking_status(id_booking, role, user_id, new_status)
             if not updated:
                 return error_response("Booking not found or forbidden", 404)
+            if "error" in updated:
+                return error_response(updated["error"], 409)
             return success_response("Booking status updated successfully", updated, 200)
         except SQLAlchemyError as e:
             bookings_ns.logger.error(f"Database error: {str(e)}")
@@ -0,0 +1,196 @@
+import time
+
+import click
+
+from .query.q_idempotency import purge_expired_idempotency_keys
+from .query.q_import import import_data
+from .query.q_maintenance import (
+    PARTITION_MONTHS_AHEAD, PURGE_RETENTION_DAYS, archive_booking_partitions, create_booking_partitions,
+    purge_soft_deleted
+)
+from .query.q_notifications import BROADCAST_CHUNK_DEFAULT, dispatch_broadcast_chunk
+from .query.q_outbox import OUTBOX_BATCH_DEFAULT, dispatch_outbox
+from .query.q_reviews import reconcile_rating_aggregates
+from .query.q_stats import refresh_admin_stats
+from .query.q_therapist import refresh_leaderboard
+
+
+@click.command("refresh-leaderboard")
+def refresh_leaderboard_command():
+    """Full refresh rank_score leaderboard therapist (jalankan terjadwal, misal via cron)."""
+    result = refresh_leaderboard()
+    if result is None:
+        raise click.ClickException("Failed to refresh leaderboard")
+    click.echo(
+        f"Leaderboard refreshed: {result['updated']} therapist updated "
+        f"(prior mean={result['mean_rating']:.4f}, weight={result['weight']:.2f})"
+    )
+
+
+@click.command("reconcile-ratings")
+@click.option("--dry-run", is_flag=True, help="Hanya laporkan drift, tanpa memperbaiki.")
+def reconcile_ratings_command(dry_run):
+    """Cocokkan rating_sum/total_reviews therapist dengan tabel reviews."""
+    drift = reconcile_rating_aggregates(apply=not dry_run)
+    if drift is None:
+        raise click.ClickException("Failed to reconcile rating aggregates")
+    for row in drift:
+        click.echo(
+            f"therapist {row['therapist_id']}: total {row['stored_total']} -> {row['actual_total']}, "
+            f"sum {row['stored_sum']} -> {row['actual_sum']}"
+        )
+    action = "found" if dry_run else "fixed"
+    click.echo(f"{len(drift)} therapist with drift {action}")
+
+
+@click.command("import-data")
+@click.option("--users", type=click.Path(exists=True, dir_okay=False), help="File CSV/NDJSON user (client).")
+@click.option("--therapists", type=click.Path(exists=True, dir_okay=False), help="File CSV/NDJSON therapist.")
+@click.option("--bookings", type=click.Path(exists=True, dir_okay=False), help="File CSV/NDJSON booking.")
+@click.option("--reviews", type=click.Path(exists=True, dir_okay=False), help="File CSV/NDJSON review.")
+@click.option("--dry-run", is_flag=True, help="Validasi & laporkan saja, transaksi di-rollback.")
+def import_data_command(users, therapists, bookings, reviews, dry_run):
+    """Import data historis klinik lewat COPY ke staging table lalu merge set-based."""
+    files = {"users": users, "therapists": therapists, "bookings": bookings, "reviews": reviews}
+    if not any(files.values()):
+        raise click.UsageError("Provide at least one of --users, --therapists, --bookings, --reviews")
+    try:
+        report = import_data(files, dry_run=dry_run)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if report is None:
+        raise click.ClickException("Import failed, transaction rolled back")
+    for entity, result in report.items():
+        click.echo(
+            f"{entity}: loaded {result['loaded']}, inserted {result['inserted']}, "
+            f"skipped existing {result['skipped_existing']}, rejected {result['rejected']}, "
+            f"invalid lines {result['invalid_lines']}"
+        )
+        for reject in result["reject_samples"]:
+            click.echo(f"  row {reject['row']}: {reject['error']}")
+    if dry_run:
+        click.echo("Dry run: nothing was written")
+        return
+    # agregat rating & leaderboard dihitung ulang sekali di akhir, bukan per review
+    if report.get("reviews", {}).get("inserted"):
+        drift = reconcile_rating_aggregates(apply=True)
+        leaderboard = refresh_leaderboard()
+        if drift is None or leaderboard is None:
+            raise click.ClickException("Data imported, but recomputing rating aggregates failed")
+        click.echo(f"Rating aggregates recomputed for {len(drift)} therapist")
+    # rollup dashboard admin ikut diperbarui untuk bucket historis yang baru diisi
+    stats = refresh_admin_stats()
+    if stats is None:
+        raise click.ClickException("Data imported, but refreshing admin stats failed")
+    click.echo(
+        f"Stats refreshed: {stats['bookings']} booking day, {stats['users']} user day, "
+        f"{stats['reviews']} therapist week recomputed"
+    )
+
+
+@click.command("purge-idempotency-keys")
+def purge_idempotency_keys_command():
+    """Hapus Idempotency-Key yang sudah expired (jalankan terjadwal, misal via cron)."""
+    deleted = purge_expired_idempotency_keys()
+    if deleted is None:
+        raise click.ClickException("Failed to purge idempotency keys")
+    click.echo(f"{deleted} expired idempotency key purged")
+
+
+@click.command("dispatch-outbox")
+@click.option("--batch-size", type=int, default=OUTBOX_BATCH_DEFAULT, show_default=True, help="Event per batch.")
+@click.option("--chunk-size", type=int, default=BROADCAST_CHUNK_DEFAULT, show_default=True,
+              help="Penerima broadcast per chunk.")
+@click.option("--watch", is_flag=True, help="Jalan terus sebagai proses dispatcher, polling outbox.")
+@click.option("--interval", type=float, default=1.0, show_default=True, help="Jeda polling (detik) saat outbox kosong.")
+def dispatch_outbox_command(batch_size, chunk_size, watch, interval):
+    """Kirim event outbox booking/review dan job broadcast menjadi notifikasi."""
+    total_events = total_notifications = total_broadcast = 0
+    while True:
+        # outbox dan broadcast ditangani terpisah: yang satu gagal tidak menahan yang lain
+        failed = []
+        result = dispatch_outbox(batch_size)
+        if result is None:
+            failed.append("outbox events")
+        else:
+            total_events += result["events"]
+            total_notifications += result["notifications"]
+        # satu chunk broadcast per putaran, supaya broadcast besar tidak menahan event outbox
+        broadcast = dispatch_broadcast_chunk(chunk_size)
+        if broadcast is None:
+            failed.append("broadcast chunk")
+        else:
+            total_broadcast += broadcast.get("sent", 0)
+        if failed:
+            if not watch:
+                raise click.ClickException(f"Failed to dispatch {' and '.join(failed)}")
+            click.echo(f"Failed to dispatch {' and '.join(failed)}, retrying", err=True)
+        outbox_busy = result is not None and result["events"] >= batch_size
+        if not outbox_busy and not broadcast:
+            if not watch:
+                break
+            time.sleep(interval)
+    click.echo(
+        f"{total_events} event dispatched, {total_notifications} notification created, "
+        f"{total_broadcast} broadcast notification sent"
+    )
+
+
+@click.command("refresh-stats")
+@click.option("--full", is_flag=True, help="Hitung ulang semua bucket, bukan hanya yang berubah sejak refresh terakhir.")
+def refresh_stats_command(full):
+    """Refresh rollup dashboard admin secara incremental (jalankan terjadwal, misal via cron)."""
+    report = refresh_admin_stats(full=full)
+    if report is None:
+        raise click.ClickException("Failed to refresh admin stats")
+    click.echo(
+        f"Stats refreshed: {report['bookings']} booking day, {report['users']} user day, "
+        f"{report['reviews']} therapist week recomputed"
+    )
+
+
+@click.command("create-partitions")
+@click.option("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD, show_default=True,
+              help="Jumlah bulan ke depan yang partisinya disiapkan.")
+def create_partitions_command(months_ahead):
+    """Siapkan partisi bulanan bookings (jalankan terjadwal, misal bulanan via cron)."""
+    partitions = create_booking_partitions(months_ahead)
+    if partitions is None:
+        raise click.ClickException("Failed to create booking partitions")
+    click.echo(f"Partitions ready: {', '.join(partitions)}")
+
+
+@click.command("archive-partitions")
+@click.option("--before", type=click.DateTime(formats=["%Y-%m", "%Y-%m-%d"]), required=True,
+              help="Archive partisi bulan sebelum tanggal ini (YYYY-MM).")
+@click.option("--archive-dir", type=click.Path(file_okay=False), default="archive", show_default=True,
+              help="Folder tujuan file .csv.gz.")
+@click.option("--dry-run", is_flag=True, help="Hanya tampilkan partisi yang akan di-archive.")
+def archive_partitions_command(before, archive_dir, dry_run):
+    """Archive partisi bookings lama ke file gzip lalu detach & drop partisinya."""
+    archived = archive_booking_partitions(before.date(), archive_dir, dry_run=dry_run)
+    if archived is None:
+        raise click.ClickException("Failed to archive booking partitions")
+    for partition in archived:
+        if partition["skipped"]:
+            click.echo(f"{partition['partition']}: skipped, {partition['skipped']}")
+        elif dry_run:
+            click.echo(f"{partition['partition']}: would be archived")
+        else:
+            click.echo(f"{partition['partition']}: {partition['rows']} rows -> {partition['file']}")
+    done = sum(1 for partition in archived if not partition["skipped"])
+    click.echo(f"{done} partition {'found' if dry_run else 'archived'}, {len(archived) - done} skipped")
+
+
+@click.command("purge-deleted")
+@click.option("--retention-days", type=int, default=PURGE_RETENTION_DAYS, show_default=True,
+              help="Row soft delete yang lebih tua dari ini dihapus permanen.")
+@click.option("--dry-run", is_flag=True, help="Hanya hitung row yang akan dihapus.")
+def purge_deleted_command(retention_days, dry_run):
+    """Hapus permanen row soft delete bookings, reviews dan notifications per batch."""
+    report = purge_soft_deleted(retention_days, dry_run=dry_run)
+    if report is None:
+        raise click.ClickException("Failed to purge soft-deleted rows")
+    action = "would be purged" if dry_run else "purged"
+    for table, count in report.items():
+        click.echo(f"{table}: {count} rows {action}")
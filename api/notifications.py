@@ -1,10 +1,15 @@
-from flask import request
+import json
+import queue
+
+from flask import Response, request, stream_with_context
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from sqlalchemy.exc import SQLAlchemyError
 
+from .utils.listener import notification_listener
 from .utils.response import success_response, error_response
-from .query.q_notifications import create_notification, get_notifications_by_user, mark_notification_as_read
+from .query.q_notifications import BROADCAST_ROLES, NOTIFICATION_BULK_MAX, NOTIFICATION_PAGE_MAX, create_broadcast, create_notification, dismiss_notifications, get_broadcast, get_latest_notification_id, get_notification_stream_page, get_notifications_by_user, get_unread_count, mark_notification_as_read, mark_notifications_as_read
+from .query.q_therapist import THERAPIST_STATUSES
 
 
 notifications_ns = Namespace('notifications', description='Endpoint Notifikasi User/Terapis')
@@ -14,6 +19,37 @@ notification_model = notifications_ns.model('Notification', {
     "message": fields.String(required=True, description="Isi notifikasi")
 })
 
+notification_bulk_model = notifications_ns.model('NotificationBulk', {
+    "ids": fields.List(
+        fields.Integer, required=False,
+        description=f"Daftar ID notifikasi (maks {NOTIFICATION_BULK_MAX})"
+    ),
+    "up_to_id": fields.Integer(required=False, description="Atau semua notifikasi dengan id <= nilai ini")
+})
+
+broadcast_model = notifications_ns.model('NotificationBroadcast', {
+    "message": fields.String(required=True, description="Isi notifikasi"),
+    "role": fields.String(required=True, description="Target penerima", enum=list(BROADCAST_ROLES)),
+    "status_therapist": fields.String(
+        required=False, description="Opsional untuk role therapist: hanya therapist dengan status ini",
+        enum=list(THERAPIST_STATUSES)
+    )
+})
+
+notification_list_parser = notifications_ns.parser()
+notification_list_parser.add_argument(
+    "limit", type=int, required=False, location="args",
+    help="Jumlah notifikasi per halaman (default 20, maks 100)"
+)
+notification_list_parser.add_argument(
+    "before_id", type=int, required=False, location="args",
+    help="Halaman notifikasi lebih lama dari id ini (ambil dari meta.next_before_id)"
+)
+notification_list_parser.add_argument(
+    "since_id", type=int, required=False, location="args",
+    help="Notifikasi yang lebih baru dari id ini"
+)
+
 @notifications_ns.route('')
 class NotificationResource(Resource):
     @jwt_required()
@@ -36,17 +72,236 @@ class NotificationResource(Resource):
             return error_response("Internal server error", 500)
 
     @jwt_required()
+    @notifications_ns.expect(notification_list_parser)
     def get(self):
-        """List notifikasi untuk user/terapis saat ini"""
+        """List notifikasi untuk user/terapis saat ini per halaman (since_id / before_id)"""
         user_id = get_jwt_identity()
+        args = notification_list_parser.parse_args()
+        if args.get("since_id") is not None and args.get("before_id") is not None:
+            return error_response("Use either since_id or before_id, not both", 400)
         try:
-            notifications = get_notifications_by_user(user_id)
-            return success_response("Notifications retrieved successfully", notifications, 200)
+            page = get_notifications_by_user(
+                user_id,
+                limit=args.get("limit"),
+                since_id=args.get("since_id"),
+                before_id=args.get("before_id")
+            )
+            if page is None:
+                return error_response("Failed to fetch notifications", 500)
+            notifications, meta = page
+            return success_response("Notifications retrieved successfully", notifications, 200, meta=meta)
         except SQLAlchemyError as e:
             notifications_ns.logger.error(f"Database error: {str(e)}")
             return error_response("Internal server error", 500)
         
         
+# detik tanpa notifikasi sebelum komentar keepalive dikirim (menjaga koneksi di proxy)
+STREAM_KEEPALIVE_SECONDS = 25
+STREAM_RETRY_MS = 3000
+
+
+def _notification_events(user_id, last_id):
+    """
+    Generator SSE: kirim notifikasi setelah last_id, lalu tunggu sinyal listener.
+    Id notifikasi dialokasikan sebelum commit, jadi id yang lebih kecil bisa commit belakangan.
+    Jaminan: tidak ada notifikasi yang terlewat. Default kolom id (migration 016) meminta xid
+    sebelum nextval, sehingga transaksi yang memegang id <= id terbesar di snapshot S pasti
+    punya xid < S.xmax. Cursor (floor) baru maju ke id terbesar yang terlihat di S setelah
+    snapshot berikutnya punya xmin >= S.xmax, yaitu semua transaksi itu sudah selesai;
+    notifikasi di atas floor di-scan ulang dan di-dedupe lewat `sent`.
+    Field id SSE berisi floor, sehingga resume bisa mengulang notifikasi terbaru
+    (at-least-once, client dedupe lewat id_notification).
+    """
+    signal = notification_listener.subscribe(user_id)
+    floor, sent, pending = last_id, set(), None
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            # kejar semua notifikasi di atas floor, urut dari yang terlama
+            after_id = floor
+            while True:
+                page = get_notification_stream_page(user_id, after_id, NOTIFICATION_PAGE_MAX)
+                if not page:
+                    break
+                notifications, snapshot = page
+                page_start = after_id
+                for notification in notifications:
+                    after_id = notification["id_notification"]
+                    if after_id in sent:
+                        continue
+                    sent.add(after_id)
+                    yield f"id: {floor}\nevent: notification\ndata: {json.dumps(notification)}\n\n"
+                # floor hanya maju dari halaman yang mulai di floor, dan tidak melewati id yang
+                # belum ter-scan di pass ini (halaman penuh berarti masih ada lanjutannya)
+                if pending and page_start == floor and snapshot["xmin"] >= pending[0]:
+                    covered = after_id if len(notifications) == NOTIFICATION_PAGE_MAX else pending[1]
+                    floor = max(floor, min(pending[1], covered))
+                    sent = {notification_id for notification_id in sent if notification_id > floor}
+                    pending = None
+                if pending is None and notifications:
+                    # kandidat floor = id terbesar yang terlihat di snapshot ini
+                    pending = (snapshot["xmax"], notifications[-1]["id_notification"])
+                if len(notifications) < NOTIFICATION_PAGE_MAX:
+                    break
+            # keepalive tidak memicu query, database hanya dibaca saat listener memberi sinyal
+            while True:
+                try:
+                    signal.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                    break
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+    finally:
+        notification_listener.unsubscribe(user_id, signal)
+
+
+@notifications_ns.route('/stream')
+class NotificationStreamResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Stream notifikasi baru (Server-Sent Events), resume lewat header Last-Event-ID"""
+        user_id = get_jwt_identity()
+        last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+        if last_event_id:
+            try:
+                last_id = int(last_event_id)
+            except ValueError:
+                return error_response("Invalid Last-Event-ID", 400)
+        else:
+            last_id = get_latest_notification_id(user_id)
+            if last_id is None:
+                return error_response("Failed to open notification stream", 500)
+        return Response(
+            stream_with_context(_notification_events(user_id, last_id)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+
+@notifications_ns.route('/broadcast')
+class NotificationBroadcastResource(Resource):
+    @jwt_required()
+    @notifications_ns.expect(broadcast_model)
+    def post(self):
+        """Broadcast notifikasi ke role/segmen user, diproses di background (admin only)"""
+        claims = get_jwt()
+        if claims.get("role") != "admin":
+            return error_response("Forbidden: only admin can broadcast notification", 403)
+
+        payload = request.get_json()
+        if not payload or not payload.get("message") or not payload.get("role"):
+            return error_response("message and role are required", 400)
+        role, status_therapist = payload["role"], payload.get("status_therapist")
+        if role not in BROADCAST_ROLES:
+            return error_response(f"role must be one of: {', '.join(BROADCAST_ROLES)}", 400)
+        if status_therapist and (role != "therapist" or status_therapist not in THERAPIST_STATUSES):
+            return error_response(
+                f"status_therapist requires role therapist and one of: {', '.join(THERAPIST_STATUSES)}", 400
+            )
+
+        try:
+            broadcast = create_broadcast(get_jwt_identity(), payload["message"], role, status_therapist)
+            if not broadcast:
+                return error_response("Failed to create broadcast", 500)
+            return success_response("Broadcast queued", broadcast, 202)
+        except SQLAlchemyError as e:
+            notifications_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+@notifications_ns.route('/broadcast/<int:id_broadcast>')
+@notifications_ns.param('id_broadcast', 'ID job broadcast')
+class NotificationBroadcastDetailResource(Resource):
+    @jwt_required()
+    def get(self, id_broadcast):
+        """Status dan progress job broadcast (admin only)"""
+        claims = get_jwt()
+        if claims.get("role") != "admin":
+            return error_response("Forbidden: admin only", 403)
+        try:
+            broadcast = get_broadcast(id_broadcast)
+            if not broadcast:
+                return error_response("Broadcast not found", 404)
+            return success_response("Broadcast retrieved successfully", broadcast, 200)
+        except SQLAlchemyError as e:
+            notifications_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+@notifications_ns.route('/unread-count')
+class NotificationUnreadCountResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Jumlah notifikasi belum dibaca (badge) untuk user/terapis saat ini"""
+        user_id = get_jwt_identity()
+        try:
+            count = get_unread_count(user_id)
+            if count is None:
+                return error_response("Failed to fetch unread count", 500)
+            return success_response("Unread count retrieved successfully", {"unread_count": count}, 200)
+        except SQLAlchemyError as e:
+            notifications_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+def parse_bulk_payload(payload):
+    """Validasi body bulk read/dismiss, return (ids, up_to_id) atau raise ValueError"""
+    if not payload:
+        raise ValueError("No input data provided")
+    ids, up_to_id = payload.get("ids"), payload.get("up_to_id")
+    if bool(ids) == (up_to_id is not None):
+        raise ValueError("Provide either ids or up_to_id")
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) > NOTIFICATION_BULK_MAX:
+            raise ValueError(f"ids must be a list of at most {NOTIFICATION_BULK_MAX} items")
+        if not all(isinstance(value, int) for value in ids):
+            raise ValueError("ids must be integers")
+    elif not isinstance(up_to_id, int):
+        raise ValueError("up_to_id must be an integer")
+    return ids, up_to_id
+
+
+@notifications_ns.route('/read')
+class NotificationBulkReadResource(Resource):
+    @jwt_required()
+    @notifications_ns.expect(notification_bulk_model)
+    def put(self):
+        """Tandai banyak notifikasi sudah dibaca (ids atau up_to_id)"""
+        user_id = get_jwt_identity()
+        try:
+            ids, up_to_id = parse_bulk_payload(request.get_json(silent=True))
+        except ValueError as e:
+            return error_response(str(e), 400)
+        try:
+            updated = mark_notifications_as_read(user_id, ids=ids, up_to_id=up_to_id)
+            if updated is None:
+                return error_response("Failed to update notifications", 500)
+            return success_response("Notifications marked as read", {"updated": updated}, 200)
+        except SQLAlchemyError as e:
+            notifications_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+@notifications_ns.route('/dismiss')
+class NotificationBulkDismissResource(Resource):
+    @jwt_required()
+    @notifications_ns.expect(notification_bulk_model)
+    def put(self):
+        """Hapus (soft delete) banyak notifikasi sekaligus (ids atau up_to_id)"""
+        user_id = get_jwt_identity()
+        try:
+            ids, up_to_id = parse_bulk_payload(request.get_json(silent=True))
+        except ValueError as e:
+            return error_response(str(e), 400)
+        try:
+            dismissed = dismiss_notifications(user_id, ids=ids, up_to_id=up_to_id)
+            if dismissed is None:
+                return error_response("Failed to dismiss notifications", 500)
+            return success_response("Notifications dismissed", {"dismissed": dismissed}, 200)
+        except SQLAlchemyError as e:
+            notifications_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
 @notifications_ns.route('/<int:id_notification>/read')
 @notifications_ns.param('id_notification', 'ID notifikasi yang akan ditandai sudah dibaca')
 class NotificationReadResource(Resource):
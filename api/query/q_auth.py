@@ -4,6 +4,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from ..utils.config import get_connection
+from .q_therapist import therapist_cache
 
 def get_login(payload):
     engine = get_connection()
@@ -78,6 +79,7 @@ def register_user(payload):
         print(f"Error occurred: {str(e)}")
         return None
     
+@therapist_cache.invalidates
 def register_therapist(payload):
     engine = get_connection()
     try:
@@ -105,12 +107,12 @@ def register_therapist(payload):
                     "phone": payload.get('phone')
                 }
             ).mappings().fetchone()
-            # Insert ke therapist_profiles
+            # Insert ke therapist_profiles, rank_score awal = prior leaderboard (belum ada review)
             connection.execute(
                 text("""
                     INSERT INTO therapist_profiles (user_id, bio, experience_years, specialization, 
-                        average_rating, total_reviews, status_therapist, status, created_at, updated_at)
-                    VALUES (:user_id, '', 0, '', 0.0, 0, 'available', 1, NOW(), NOW())
+                        average_rating, total_reviews, rank_score, status_therapist, status, created_at, updated_at)
+                    VALUES (:user_id, '', 0, '', 0.0, 0, COALESCE((SELECT mean_rating FROM leaderboard_prior WHERE id = 1), 0), 'available', 1, NOW(), NOW())
                 """),
                 {"user_id": user_result["id"]}
             )
@@ -1,104 +1,326 @@
+from datetime import datetime, timedelta
 from sqlalchemy import text
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
 
 from ..utils.config import get_connection
+from ..utils.helper import clamp_limit, decode_cursor, encode_cursor, format_row, make_etag, select_columns
+from ..utils.schedule import DEFAULT_SESSION_MINUTES, SESSION_DURATIONS
+from .q_outbox import enqueue_event
 
 
-def create_booking(user_id, payload):
-    engine = get_connection()
+# SQLSTATE exclusion_violation dari constraint bookings_no_overlap
+EXCLUSION_VIOLATION = "23P01"
+
+BOOKING_STATUSES = ("pending", "accepted", "rejected", "completed")
+# status tujuan -> status asal yang diizinkan
+BOOKING_TRANSITIONS = {
+    "accepted": ("pending",),
+    "rejected": ("pending", "accepted"),
+    "completed": ("accepted",),
+}
+BOOKING_PAGE_DEFAULT = 50
+BOOKING_PAGE_MAX = 200
+BOOKING_SERIES_MAX = 52
+
+
+def insert_booking(connection, user_id, payload):
+    """
+    Insert booking di transaksi milik pemanggil (dipakai create_booking & request idempotent).
+    Insert dibungkus savepoint sehingga bentrok jadwal tidak membatalkan transaksi luar.
+    Input yang ditolak database (therapist_id tidak dikenal, booking_time tidak valid) return None,
+    sama seperti create_booking tanpa Idempotency-Key, supaya kedua jalur menjawab 400.
+    """
+    session_type = payload.get("session_type")
+    query = text("""
+        INSERT INTO bookings (user_id, therapist_id, location, booking_time, session_type, duration_minutes,
+                              status_booking, notes, status, created_at, updated_at)
+        VALUES (:user_id, :therapist_id, :location, :booking_time, :session_type, :duration_minutes,
+                'pending', :notes, 1, NOW(), NOW())
+        RETURNING id, user_id, therapist_id, location, booking_time, session_type, duration_minutes,
+                  status_booking, notes, status, created_at, updated_at;
+    """)
     try:
-        with engine.begin() as connection:
-            query = text("""
-                INSERT INTO bookings (user_id, therapist_id, location, booking_time, status_booking, notes, status, created_at, updated_at)
-                VALUES (:user_id, :therapist_id, :location, :booking_time, 'pending', :notes, 1, NOW(), NOW())
-                RETURNING id, user_id, therapist_id, location, booking_time, status_booking, notes, status, created_at, updated_at;
-            """)
+        with connection.begin_nested():
             result = connection.execute(query, {
                 "user_id": user_id,
                 "therapist_id": payload["therapist_id"],
                 "location": payload["location"],
                 "booking_time": payload["booking_time"],
+                "session_type": session_type,
+                "duration_minutes": SESSION_DURATIONS.get(session_type, DEFAULT_SESSION_MINUTES),
                 "notes": payload.get("notes", None),
             }).mappings().fetchone()
+    except IntegrityError as e:
+        # bentrok dengan booking aktif lain di constraint bookings_no_overlap
+        if getattr(e.orig, "pgcode", None) == EXCLUSION_VIOLATION:
+            return {"error": "Therapist already has a booking at that time"}
+        print(f"Error occurred: {str(e)}")
+        return None
+    except DataError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
 
-            if result:
-                return {
-                    "id_booking": result["id"],
-                    "user_id": result["user_id"],
-                    "therapist_id": result["therapist_id"],
-                    "location": result["location"],
-                    "booking_time": str(result["booking_time"]),
-                    "status_booking": result["status_booking"],
-                    "notes": result["notes"],
-                    "status": result["status"],
-                    "created_at": str(result["created_at"]),
-                    "updated_at": str(result["updated_at"]),
-                }
-            return None
+    if result:
+        enqueue_event(connection, "booking.created", {
+            "booking_id": result["id"],
+            "user_id": result["user_id"],
+            "therapist_id": result["therapist_id"],
+            "booking_time": result["booking_time"],
+        })
+        return {
+            "id_booking": result["id"],
+            "user_id": result["user_id"],
+            "therapist_id": result["therapist_id"],
+            "location": result["location"],
+            "booking_time": str(result["booking_time"]),
+            "session_type": result["session_type"],
+            "duration_minutes": result["duration_minutes"],
+            "status_booking": result["status_booking"],
+            "notes": result["notes"],
+            "status": result["status"],
+            "created_at": str(result["created_at"]),
+            "updated_at": str(result["updated_at"]),
+        }
+    return None
+
+def create_booking(user_id, payload):
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            return insert_booking(connection, user_id, payload)
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
         return None
 
-def get_bookings_by_role(role, user_id):
+def create_booking_series(user_id, payload, booking_times, atomic=True):
+    """
+    Buat banyak booking (series/bulk) untuk satu therapist dengan satu INSERT multi-row.
+    Konflik dicek set-wise: di dalam satu partisi bulan oleh constraint no-overlap lewat
+    ON CONFLICT DO NOTHING, lintas partisi oleh NOT EXISTS di bawah advisory lock therapist
+    yang sama dengan trigger bookings_cross_month_guard. Overlap antar booking di series
+    itu sendiri disaring lebih dulu. Waktu yang tidak ter-insert = konflik.
+    atomic=True: satu konflik membatalkan semuanya, False: yang bentrok dilewati.
+    """
+    session_type = payload.get("session_type")
+    duration = timedelta(minutes=SESSION_DURATIONS.get(session_type, DEFAULT_SESSION_MINUTES))
+    candidates = []
+    for value in sorted(booking_times):
+        if not candidates or value >= candidates[-1] + duration:
+            candidates.append(value)
     engine = get_connection()
     try:
         with engine.connect() as connection:
-            base_query = """
-                SELECT 
-                    b.id, b.user_id, u.name AS user_name, b.therapist_id, tu.name AS therapist_name, b.location,
-                    b.booking_time, b.status_booking, b.notes, b.status, b.created_at, b.updated_at, r.id AS id_review
+            with connection.begin() as transaction:
+                connection.execute(
+                    text("SELECT pg_advisory_xact_lock(hashtext('bookings_no_overlap'), :therapist_id)"),
+                    {"therapist_id": payload["therapist_id"]}
+                )
+                result = connection.execute(
+                    text("""
+                        INSERT INTO bookings (user_id, therapist_id, location, booking_time, session_type, duration_minutes,
+                                              status_booking, notes, status, created_at, updated_at)
+                        SELECT :user_id, :therapist_id, :location, t.booking_time, :session_type, :duration_minutes,
+                               'pending', :notes, 1, NOW(), NOW()
+                        FROM unnest(CAST(:booking_times AS timestamp[])) AS t(booking_time)
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM bookings b
+                            WHERE b.therapist_id = :therapist_id AND b.status = 1
+                              AND b.status_booking IN ('pending', 'accepted')
+                              AND b.booking_time >= t.booking_time - interval '1 day'
+                              AND b.booking_time < t.booking_time + :duration_minutes * interval '1 minute'
+                              AND tsrange(b.booking_time, b.booking_time + b.duration_minutes * interval '1 minute')
+                                  && tsrange(t.booking_time, t.booking_time + :duration_minutes * interval '1 minute')
+                        )
+                        ON CONFLICT DO NOTHING
+                        RETURNING id, user_id, therapist_id, location, booking_time, session_type, duration_minutes,
+                                  status_booking, notes, status, created_at, updated_at;
+                    """),
+                    {
+                        "user_id": user_id,
+                        "therapist_id": payload["therapist_id"],
+                        "location": payload["location"],
+                        "booking_times": candidates,
+                        "session_type": session_type,
+                        "duration_minutes": int(duration.total_seconds() // 60),
+                        "notes": payload.get("notes", None),
+                    }
+                ).mappings().all()
+
+                inserted = {row["booking_time"] for row in result}
+                conflicts = [str(value) for value in booking_times if value not in inserted]
+                if conflicts and atomic:
+                    transaction.rollback()
+                    return {"error": "Some bookings conflict with existing bookings", "conflicts": conflicts}
+
+                if result:
+                    enqueue_event(connection, "booking.series_created", {
+                        "booking_ids": [row["id"] for row in result],
+                        "user_id": user_id,
+                        "therapist_id": payload["therapist_id"],
+                        "count": len(result),
+                        "first_booking_time": min(row["booking_time"] for row in result),
+                    })
+                created = [
+                    {
+                        "id_booking": row["id"],
+                        "user_id": row["user_id"],
+                        "therapist_id": row["therapist_id"],
+                        "location": row["location"],
+                        "booking_time": str(row["booking_time"]),
+                        "session_type": row["session_type"],
+                        "duration_minutes": row["duration_minutes"],
+                        "status_booking": row["status_booking"],
+                        "notes": row["notes"],
+                        "status": row["status"],
+                        "created_at": str(row["created_at"]),
+                        "updated_at": str(row["updated_at"]),
+                    }
+                    for row in sorted(result, key=lambda row: row["booking_time"])
+                ]
+                return {"created": created, "conflicts": conflicts}
+    except IntegrityError as e:
+        # sisa race yang lolos pengecekan di atas tetap ditolak database
+        if getattr(e.orig, "pgcode", None) == EXCLUSION_VIOLATION:
+            return {"error": "Some bookings conflict with existing bookings", "conflicts": []}
+        print(f"Error occurred: {str(e)}")
+        return None
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+# Allow-list fields= untuk list booking: nama field -> (ekspresi SQL, formatter)
+BOOKING_LIST_COLUMNS = {
+    "id_booking": ("b.id", None),
+    "user_id": ("b.user_id", None),
+    "id_review": ("r.id", None),
+    "user_name": ("u.name", None),
+    "therapist_id": ("b.therapist_id", None),
+    "therapist_name": ("tu.name", None),
+    "location": ("b.location", None),
+    "booking_time": ("b.booking_time", str),
+    "session_type": ("b.session_type", None),
+    "duration_minutes": ("b.duration_minutes", None),
+    "status_booking": ("b.status_booking", None),
+    "notes": ("b.notes", None),
+    "status": ("b.status", None),
+    "created_at": ("b.created_at", str),
+    "updated_at": ("b.updated_at", str),
+}
+BOOKING_LIST_PRESETS = {
+    "lean": ["id_booking", "id_review", "user_name", "therapist_name", "booking_time", "status_booking"],
+}
+
+
+def get_bookings_by_role(role, user_id, fields=None, status_booking=None, date_from=None, date_to=None,
+                         therapist_id=None, filter_user_id=None, limit=None, cursor=None):
+    """
+    List booking per halaman, urut booking_time terbaru lalu id (keyset, tanpa OFFSET).
+    User hanya melihat booking miliknya dan therapist hanya booking yang masuk ke dia,
+    filter therapist_id/user_id tetap bisa dipakai untuk mempersempit.
+    """
+    fields = fields or list(BOOKING_LIST_COLUMNS)
+    limit = clamp_limit(limit, BOOKING_PAGE_DEFAULT, BOOKING_PAGE_MAX)
+    params = {"limit": limit + 1}
+    if cursor:
+        # cursor = (booking_time, id) dari baris terakhir halaman sebelumnya
+        cursor_time, cursor_id = decode_cursor(cursor, 2)
+        try:
+            params["cursor_time"] = datetime.fromisoformat(cursor_time)
+            params["cursor_id"] = int(cursor_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            # join users tetap dipakai karena ikut memfilter user/therapist yang aktif,
+            # join reviews hanya jika id_review diminta
+            query = f"""
+                SELECT
+                    {select_columns(fields, BOOKING_LIST_COLUMNS)},
+                    b.booking_time AS sort_time, b.id AS sort_id
                 FROM bookings b
                 JOIN users u 
                     ON b.user_id = u.id AND u.status = 1
                 JOIN users tu 
                     ON b.therapist_id = tu.id AND tu.status = 1
+            """
+            if "id_review" in fields:
+                query += """
                 LEFT JOIN reviews r 
                     ON r.booking_id = b.id AND r.status = 1
-                WHERE b.status = 1
-            """
-            params = {}
+                """
+            query += " WHERE b.status = 1"
             if role == "admin":
                 # Admin → lihat semua booking
-                query = base_query
+                pass
             elif role == "user":
                 # User → hanya booking miliknya
-                query = base_query + " AND b.user_id = :user_id"
+                query += " AND b.user_id = :user_id"
                 params["user_id"] = user_id
             elif role == "therapist":
                 # Therapist → hanya booking yang masuk ke dia
-                query = base_query + " AND b.therapist_id = :user_id"
+                query += " AND b.therapist_id = :user_id"
                 params["user_id"] = user_id
             else:
-                return []
-            result = connection.execute(text(query), params).mappings().fetchall()
-            bookings = []
-            for row in result:
-                bookings.append({
-                    "id_booking": row["id"],
-                    "user_id": row["user_id"],
-                    "id_review": row["id_review"],  # ✅ tambahkan ID review
-                    "user_name": row["user_name"],
-                    "therapist_id": row["therapist_id"],
-                    "therapist_name": row["therapist_name"],
-                    "location": row["location"],
-                    "booking_time": str(row["booking_time"]),
-                    "status_booking": row["status_booking"],
-                    "notes": row["notes"],
-                    "status": row["status"],
-                    "created_at": str(row["created_at"]),
-                    "updated_at": str(row["updated_at"])
-                })
-            return bookings
+                return [], None
+
+            # filter opsional
+            if status_booking:
+                query += " AND b.status_booking = :status_booking"
+                params["status_booking"] = status_booking
+            if date_from:
+                query += " AND b.booking_time >= :date_from"
+                params["date_from"] = date_from
+            if date_to:
+                query += " AND b.booking_time < :date_to"
+                params["date_to"] = date_to
+            if therapist_id:
+                query += " AND b.therapist_id = :therapist_id"
+                params["therapist_id"] = therapist_id
+            if filter_user_id:
+                query += " AND b.user_id = :filter_user_id"
+                params["filter_user_id"] = filter_user_id
+            # keyset: lanjut tepat setelah baris terakhir
+            if cursor:
+                query += " AND (b.booking_time, b.id) < (:cursor_time, :cursor_id)"
+
+            query += """
+                ORDER BY b.booking_time DESC, b.id DESC
+                LIMIT :limit
+            """
+            result = connection.execute(text(query), params).mappings().all()
+
+            # ambil limit + 1 baris untuk tahu apakah masih ada halaman berikutnya
+            next_cursor = None
+            if len(result) > limit:
+                result = result[:limit]
+                last = result[-1]
+                next_cursor = encode_cursor(last["sort_time"], last["sort_id"])
+
+            return [format_row(row, fields, BOOKING_LIST_COLUMNS) for row in result], next_cursor
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
-        return []
+        return [], None
+
 
+def get_booking_time(connection, id_booking):
+    """
+    booking_time sebuah booking dari booking_keys (migration 017). Dipakai sebagai filter
+    tambahan supaya lookup by id hanya membaca satu partisi bookings. None jika tidak ada.
+    """
+    return connection.execute(
+        text("SELECT booking_time FROM booking_keys WHERE id = :id_booking"),
+        {"id_booking": id_booking}
+    ).scalar()
 
 def get_booking_by_id_and_role(id_booking, role, user_id):
     engine = get_connection()
     try:
         with engine.connect() as connection:
             print(f"Fetching booking with ID {id_booking} for role {role} and user_id {user_id}")
+            booking_time = get_booking_time(connection, id_booking)
+            if booking_time is None:
+                return None
             base_query = """
                 SELECT 
                     b.id, b.user_id, u.name AS user_name,
@@ -108,9 +330,9 @@ def get_booking_by_id_and_role(id_booking, role, user_id):
                 FROM bookings b
                 JOIN users u ON b.user_id = u.id AND u.status = 1
                 JOIN users t ON b.user_id = t.id AND t.status = 1
-                WHERE b.status = 1 AND b.id = :id_booking
+                WHERE b.status = 1 AND b.id = :id_booking AND b.booking_time = :booking_time
             """
-            params = {"id_booking": id_booking}
+            params = {"id_booking": id_booking, "booking_time": booking_time}
             # role based filter
             if role == "admin":
                 query = base_query
@@ -143,18 +365,57 @@ def get_booking_by_id_and_role(id_booking, role, user_id):
         print(f"Error occurred: {str(e)}")
         return None
 
+def get_booking_version(id_booking, role, user_id):
+    """
+    Lookup ringan untuk ETag detail booking, dengan filter role dan join user aktif yang sama
+    seperti detail, sehingga 304 hanya terjadi jika GET biasa akan menjawab 200
+    """
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            booking_time = get_booking_time(connection, id_booking)
+            if booking_time is None:
+                return None
+            query = """
+                SELECT b.id, b.updated_at
+                FROM bookings b
+                JOIN users u ON b.user_id = u.id AND u.status = 1
+                JOIN users t ON b.user_id = t.id AND t.status = 1
+                WHERE b.status = 1 AND b.id = :id_booking AND b.booking_time = :booking_time
+            """
+            params = {"id_booking": id_booking, "booking_time": booking_time}
+            if role == "user":
+                query += " AND b.user_id = :user_id"
+                params["user_id"] = user_id
+            elif role == "therapist":
+                query += " AND b.therapist_id = :user_id"
+                params["user_id"] = user_id
+            elif role != "admin":
+                return None
+            row = connection.execute(text(query), params).mappings().fetchone()
+            if not row:
+                return None
+            return make_etag("booking", row["id"], row["updated_at"])
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
 def soft_delete_booking_by_id(id_booking, role, user_id):
     engine = get_connection()
     try:
         with engine.begin() as connection:
+            booking_time = get_booking_time(connection, id_booking)
+            if booking_time is None:
+                return None
+            params = {"id_booking": id_booking, "booking_time": booking_time}
             # Cek dulu apakah booking ada dan sesuai role
             base_query = """
                 SELECT b.id, b.user_id, t.user_id AS therapist_user_id
                 FROM bookings b
                 JOIN therapist_profiles t ON b.therapist_id = t.id AND t.status = 1
-                WHERE b.id = :id_booking AND b.status = 1
+                WHERE b.id = :id_booking AND b.booking_time = :booking_time AND b.status = 1
             """
-            row = connection.execute(text(base_query), {"id_booking": id_booking}).mappings().fetchone()
+            row = connection.execute(text(base_query), params).mappings().fetchone()
             if not row:
                 return None
             # Role-based access
@@ -168,11 +429,11 @@ def soft_delete_booking_by_id(id_booking, role, user_id):
                 text("""
                     UPDATE bookings
                     SET status = 0, updated_at = NOW()
-                    WHERE id = :id_booking
+                    WHERE id = :id_booking AND booking_time = :booking_time
                     RETURNING id, user_id, therapist_id, location, booking_time,
                               status_booking, notes, status, created_at, updated_at;
                 """),
-                {"id_booking": id_booking}
+                params
             ).mappings().fetchone()
             if deleted:
                 return {
@@ -193,42 +454,49 @@ def soft_delete_booking_by_id(id_booking, role, user_id):
         return None
     
 def update_booking_status(id_booking, role, user_id, new_status):
+    """
+    Transisi status booking dalam satu UPDATE bersyarat: hanya berhasil jika status
+    sekarang termasuk BOOKING_TRANSITIONS[new_status] (dan milik therapist pemanggil).
+    Query cek ulang hanya dijalankan saat gagal, untuk membedakan 404 dan 409.
+    """
+    if role not in ("admin", "therapist"):
+        return None  # user tidak boleh ubah status booking
     engine = get_connection()
     try:
         with engine.begin() as connection:
-            # Cek booking
-            row = connection.execute(
-                text("""
-                    SELECT b.id, b.user_id, b.therapist_id AS therapist_user_id
-                    FROM bookings b
-                    JOIN users t ON b.therapist_id = t.id AND t.status = 1
-                    WHERE b.id = :id_booking AND b.status = 1
-                """),
-                {"id_booking": id_booking}
-            ).mappings().fetchone()
-            if not row:
+            booking_time = get_booking_time(connection, id_booking)
+            if booking_time is None:
                 return None
-            # Role-based access:
-            # - Therapist hanya bisa update booking miliknya
-            # - Admin bisa update semua
-            # print(f"Booking row: {row}")
-            # print(f"Role: {role}, User ID: {user_id}, Therapist User ID: {row['therapist_user_id']}")
-            if role == "therapist" and int(row["therapist_user_id"]) != int(user_id):
-                return None
-            if role == "user":
-                return None  # user tidak boleh ubah status booking
-            # Update status booking
-            updated = connection.execute(
-                text("""
-                    UPDATE bookings
-                    SET status_booking = :new_status, updated_at = NOW()
-                    WHERE id = :id_booking
-                    RETURNING id, user_id, therapist_id, location, booking_time,
-                              status_booking, notes, status, created_at, updated_at;
-                """),
-                {"id_booking": id_booking, "new_status": new_status}
-            ).mappings().fetchone()
+            query = """
+                UPDATE bookings b
+                SET status_booking = :new_status, updated_at = NOW()
+                WHERE b.id = :id_booking AND b.booking_time = :booking_time AND b.status = 1
+                  AND b.status_booking = ANY(:allowed_from)
+                  AND EXISTS (SELECT 1 FROM users t WHERE t.id = b.therapist_id AND t.status = 1)
+            """
+            params = {
+                "id_booking": id_booking,
+                "booking_time": booking_time,
+                "new_status": new_status,
+                "allowed_from": list(BOOKING_TRANSITIONS[new_status]),
+            }
+            # Therapist hanya bisa update booking miliknya, admin bisa update semua
+            if role == "therapist":
+                query += " AND b.therapist_id = :caller"
+                params["caller"] = user_id
+            query += """
+                RETURNING b.id, b.user_id, b.therapist_id, b.location, b.booking_time,
+                          b.status_booking, b.notes, b.status, b.created_at, b.updated_at;
+            """
+            updated = connection.execute(text(query), params).mappings().fetchone()
             if updated:
+                enqueue_event(connection, "booking.status_changed", {
+                    "booking_id": updated["id"],
+                    "user_id": updated["user_id"],
+                    "therapist_id": updated["therapist_id"],
+                    "booking_time": updated["booking_time"],
+                    "status_booking": updated["status_booking"],
+                })
                 return {
                     "id_booking": updated["id"],
                     "user_id": updated["user_id"],
@@ -241,7 +509,157 @@ def update_booking_status(id_booking, role, user_id, new_status):
                     "created_at": str(updated["created_at"]),
                     "updated_at": str(updated["updated_at"])
                 }
-            return None
+
+            # gagal: booking tidak ada / bukan milik therapist (404) atau status tidak valid (409)
+            current = connection.execute(
+                text("""
+                    SELECT b.status_booking, b.therapist_id
+                    FROM bookings b
+                    JOIN users t ON b.therapist_id = t.id AND t.status = 1
+                    WHERE b.id = :id_booking AND b.booking_time = :booking_time AND b.status = 1
+                """),
+                {"id_booking": id_booking, "booking_time": booking_time}
+            ).mappings().fetchone()
+            if not current:
+                return None
+            if role == "therapist" and int(current["therapist_id"]) != int(user_id):
+                return None
+            return {
+                "error": f"Cannot change booking status from {current['status_booking']} to {new_status}"
+            }
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+# Kolom export booking (urutan = urutan kolom CSV)
+BOOKING_EXPORT_COLUMNS = (
+    "id_booking", "user_id", "user_name", "therapist_id", "therapist_name", "location",
+    "booking_time", "session_type", "duration_minutes", "status_booking", "notes",
+    "created_at", "updated_at",
+)
+BOOKING_EXPORT_BATCH = 1000
+
+
+def iter_bookings_export(date_from=None, date_to=None):
+    """
+    Generator export booking (admin) per batch BOOKING_EXPORT_BATCH baris.
+    Dibaca lewat server-side cursor (stream_results) sehingga memori tetap konstan
+    berapapun jumlah barisnya. Koneksi dipegang selama generator belum selesai.
+    """
+    query = """
+        SELECT
+            b.id AS id_booking, b.user_id, u.name AS user_name,
+            b.therapist_id, tu.name AS therapist_name, b.location,
+            b.booking_time, b.session_type, b.duration_minutes, b.status_booking, b.notes,
+            b.created_at, b.updated_at
+        FROM bookings b
+        JOIN users u ON b.user_id = u.id
+        JOIN users tu ON b.therapist_id = tu.id
+        WHERE b.status = 1
+    """
+    params = {}
+    if date_from:
+        query += " AND b.booking_time >= :date_from"
+        params["date_from"] = date_from
+    if date_to:
+        query += " AND b.booking_time < :date_to"
+        params["date_to"] = date_to
+    query += " ORDER BY b.booking_time, b.id"
+
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            result = connection.execution_options(
+                stream_results=True, yield_per=BOOKING_EXPORT_BATCH
+            ).execute(text(query), params).mappings()
+            for batch in result.partitions():
+                yield batch
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        raise
+
+
+def get_agenda_version(therapist_id, date_from, date_to):
+    """
+    ETag agenda: jumlah & updated_at terakhir booking di window, berubah setiap ada
+    booking baru, update status atau soft delete di rentang tersebut. updated_at terakhir
+    user pemesan ikut dihitung karena nama user ditampilkan di agenda.
+    """
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(
+                text("""
+                    SELECT COUNT(*) AS total, MAX(b.updated_at) AS last_updated,
+                           MAX(u.updated_at) AS users_updated
+                    FROM bookings b
+                    JOIN users u ON b.user_id = u.id
+                    WHERE b.status = 1 AND b.therapist_id = :therapist_id
+                      AND b.booking_time >= :date_from AND b.booking_time < :date_to
+                """),
+                {"therapist_id": therapist_id, "date_from": date_from, "date_to": date_to}
+            ).mappings().fetchone()
+            return make_etag(
+                "agenda", therapist_id, date_from, date_to,
+                row["total"], row["last_updated"], row["users_updated"]
+            )
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def get_therapist_agenda(therapist_id, date_from, date_to):
+    """
+    Agenda therapist per hari dalam window [date_from, date_to): jumlah booking per status
+    dan daftar booking hari itu, di-group di SQL dari satu range query
+    (index therapist_id, booking_time). Hari tanpa booking tetap muncul dengan count 0.
+    """
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            result = connection.execute(
+                text("""
+                    SELECT
+                        b.booking_time::date AS day,
+                        COUNT(*) AS total,
+                        COUNT(*) FILTER (WHERE b.status_booking = 'pending') AS pending,
+                        COUNT(*) FILTER (WHERE b.status_booking = 'accepted') AS accepted,
+                        COUNT(*) FILTER (WHERE b.status_booking = 'rejected') AS rejected,
+                        COUNT(*) FILTER (WHERE b.status_booking = 'completed') AS completed,
+                        json_agg(json_build_object(
+                            'id_booking', b.id,
+                            'user_id', b.user_id,
+                            'user_name', u.name,
+                            'location', b.location,
+                            'booking_time', b.booking_time::text,
+                            'session_type', b.session_type,
+                            'duration_minutes', b.duration_minutes,
+                            'status_booking', b.status_booking,
+                            'notes', b.notes
+                        ) ORDER BY b.booking_time, b.id) AS bookings
+                    FROM bookings b
+                    JOIN users u ON b.user_id = u.id
+                    WHERE b.status = 1 AND b.therapist_id = :therapist_id
+                      AND b.booking_time >= :date_from AND b.booking_time < :date_to
+                    GROUP BY b.booking_time::date
+                    ORDER BY day
+                """),
+                {"therapist_id": therapist_id, "date_from": date_from, "date_to": date_to}
+            ).mappings().all()
+            by_day = {row["day"]: row for row in result}
+
+            agenda = []
+            day = date_from.date()
+            last_day = (date_to - timedelta(microseconds=1)).date()
+            while day <= last_day:
+                row = by_day.get(day)
+                agenda.append({
+                    "date": str(day),
+                    "total": row["total"] if row else 0,
+                    "counts": {status: row[status] if row else 0 for status in BOOKING_STATUSES},
+                    "bookings": row["bookings"] if row else []
+                })
+                day += timedelta(days=1)
+            return agenda
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
         return None
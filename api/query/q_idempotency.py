@@ -0,0 +1,154 @@
+import hashlib
+import json
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..utils.config import get_connection
+from ..utils.response import error_response
+
+
+IDEMPOTENCY_TTL_HOURS = 24
+IDEMPOTENCY_KEY_MAX = 255
+IDEMPOTENCY_PURGE_BATCH = 5000
+
+
+class _UnstoredResponse(Exception):
+    """Response non-2xx: transaksi (termasuk claim key) di-rollback, response tidak disimpan"""
+
+    def __init__(self, body, status):
+        super().__init__(status)
+        self.body = body
+        self.status = status
+
+
+def request_fingerprint(payload):
+    """Hash payload request, untuk mendeteksi key yang dipakai ulang dengan body berbeda"""
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def run_idempotent(user_id, endpoint, key, request_hash, write, after_commit=None):
+    """
+    Jalankan write(connection) -> (body, status) sekali per (user_id, endpoint, key).
+
+    Key di-claim dengan INSERT di transaksi yang sama dengan write, sehingga request
+    duplikat yang datang bersamaan menunggu di primary key sampai transaksi pertama
+    selesai, lalu me-replay response yang tersimpan tanpa menjalankan write lagi.
+    Key yang sudah expired di-claim ulang. after_commit dipanggil setelah write commit
+    (mis. invalidasi cache). Hanya response 2xx yang disimpan: response lain (mis. 409 bentrok
+    jadwal) membatalkan claim, jadi retry dengan key yang sama dijalankan ulang.
+
+    Return (body, status, replayed) atau None jika terjadi error database.
+    """
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            claimed = connection.execute(
+                text("""
+                    INSERT INTO idempotency_keys AS k
+                        (user_id, endpoint, key, request_hash, response_status, response_body, created_at, expires_at)
+                    VALUES (:user_id, :endpoint, :key, :request_hash, 0, '{}'::jsonb, NOW(),
+                            NOW() + :ttl_hours * interval '1 hour')
+                    ON CONFLICT (user_id, endpoint, key) DO UPDATE
+                    SET request_hash = EXCLUDED.request_hash,
+                        response_status = 0,
+                        response_body = '{}'::jsonb,
+                        created_at = EXCLUDED.created_at,
+                        expires_at = EXCLUDED.expires_at
+                    WHERE k.expires_at < NOW()
+                    RETURNING 1
+                """),
+                {
+                    "user_id": user_id,
+                    "endpoint": endpoint,
+                    "key": key,
+                    "request_hash": request_hash,
+                    "ttl_hours": IDEMPOTENCY_TTL_HOURS,
+                }
+            ).fetchone()
+
+            if not claimed:
+                # key sudah dipakai: replay response tersimpan
+                stored = connection.execute(
+                    text("""
+                        SELECT request_hash, response_status, response_body
+                        FROM idempotency_keys
+                        WHERE user_id = :user_id AND endpoint = :endpoint AND key = :key
+                    """),
+                    {"user_id": user_id, "endpoint": endpoint, "key": key}
+                ).mappings().fetchone()
+                if stored["request_hash"] != request_hash:
+                    return {
+                        "status": "error",
+                        "message": "Idempotency-Key was already used with a different request",
+                        "data": None
+                    }, 422, False
+                return stored["response_body"], stored["response_status"], True
+
+            body, status = write(connection)
+            if not 200 <= status < 300:
+                raise _UnstoredResponse(body, status)
+            connection.execute(
+                text("""
+                    UPDATE idempotency_keys
+                    SET response_status = :status, response_body = CAST(:body AS jsonb)
+                    WHERE user_id = :user_id AND endpoint = :endpoint AND key = :key
+                """),
+                {
+                    "user_id": user_id,
+                    "endpoint": endpoint,
+                    "key": key,
+                    "status": status,
+                    "body": json.dumps(body, default=str),
+                }
+            )
+        if after_commit:
+            after_commit()
+        return body, status, False
+    except _UnstoredResponse as response:
+        return response.body, response.status, False
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def idempotent_response(user_id, endpoint, key, payload, write, after_commit=None):
+    """
+    Response untuk POST dengan header Idempotency-Key: write(connection) -> (body, status)
+    hanya dijalankan sekali per key, retry menerima response yang sama
+    dengan header Idempotent-Replayed: true.
+    """
+    if len(key) > IDEMPOTENCY_KEY_MAX:
+        return error_response(f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX} characters", 400)
+    result = run_idempotent(
+        user_id, endpoint, key, request_fingerprint(payload), write, after_commit=after_commit
+    )
+    if result is None:
+        return error_response("Internal server error", 500)
+    body, status, replayed = result
+    if replayed:
+        return body, status, {"Idempotent-Replayed": "true"}
+    return body, status
+
+def purge_expired_idempotency_keys():
+    """Hapus key yang sudah expired per batch supaya tidak menahan lock lama"""
+    engine = get_connection()
+    deleted = 0
+    try:
+        while True:
+            with engine.begin() as connection:
+                count = connection.execute(
+                    text("""
+                        DELETE FROM idempotency_keys
+                        WHERE ctid IN (
+                            SELECT ctid FROM idempotency_keys
+                            WHERE expires_at < NOW()
+                            LIMIT :batch
+                        )
+                    """),
+                    {"batch": IDEMPOTENCY_PURGE_BATCH}
+                ).rowcount
+            deleted += count
+            if count < IDEMPOTENCY_PURGE_BATCH:
+                return deleted
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
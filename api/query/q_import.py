@@ -0,0 +1,511 @@
+import csv
+import io
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..utils.config import get_connection
+from ..utils.schedule import DEFAULT_SESSION_MINUTES
+
+
+# Kolom yang diterima per file import (header CSV / key NDJSON)
+IMPORT_COLUMNS = {
+    "users": ("name", "email", "phone", "password_hash", "created_at"),
+    "therapists": (
+        "name", "email", "phone", "password_hash", "bio", "experience_years",
+        "specialization", "status_therapist", "working_hours", "created_at"
+    ),
+    "bookings": (
+        "user_email", "therapist_email", "location", "booking_time",
+        "status_booking", "notes", "created_at"
+    ),
+    "reviews": ("user_email", "therapist_email", "booking_time", "rating", "comment", "created_at"),
+}
+# Urutan merge mengikuti foreign key: users -> therapists -> bookings -> reviews
+IMPORT_ORDER = ("users", "therapists", "bookings", "reviews")
+# Kolom hasil resolve/parse yang diisi secara set-based sebelum merge
+RESOLVED_COLUMNS = {
+    "users": "created_ts timestamp",
+    "therapists": "created_ts timestamp, experience_value integer, working_hours_json jsonb",
+    "bookings": "created_ts timestamp, booking_ts timestamp, user_id integer, therapist_id integer",
+    "reviews": (
+        "created_ts timestamp, booking_ts timestamp, rating_value integer, "
+        "user_id integer, therapist_id integer, booking_id integer"
+    ),
+}
+THERAPIST_STATUSES = ("available", "busy", "off")
+BOOKING_STATUSES = ("pending", "accepted", "rejected", "completed")
+# Password hash tidak valid: user hasil import wajib reset password sebelum bisa login
+UNUSABLE_PASSWORD = "!"
+REJECT_SAMPLE = 20
+
+# Fungsi bantu staging. Parser "aman": nilai tidak valid jadi NULL, bukan membatalkan transaksi
+_SAFE_CAST_FUNCTIONS = [
+    """
+    CREATE OR REPLACE FUNCTION pg_temp.import_ts(value text) RETURNS timestamp LANGUAGE plpgsql AS $$
+    BEGIN
+        RETURN NULLIF(btrim(value), '')::timestamp;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION pg_temp.import_int(value text) RETURNS integer LANGUAGE plpgsql AS $$
+    BEGIN
+        RETURN NULLIF(btrim(value), '')::integer;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION pg_temp.import_jsonb(value text) RETURNS jsonb LANGUAGE plpgsql AS $$
+    BEGIN
+        RETURN NULLIF(btrim(value), '')::jsonb;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END $$
+    """,
+    # row_id booking aktif yang bentrok dengan booking aktif sebelumnya (urut waktu) milik
+    # therapist yang sama di file; semua baris import memakai durasi yang sama, jadi cukup
+    # membandingkan dengan akhir booking terakhir yang diterima
+    """
+    CREATE OR REPLACE FUNCTION pg_temp.import_booking_overlaps(duration integer)
+    RETURNS SETOF bigint LANGUAGE plpgsql AS $$
+    DECLARE
+        item record;
+        current_therapist integer;
+        last_end timestamp;
+    BEGIN
+        FOR item IN
+            SELECT row_id, therapist_id, booking_ts FROM import_bookings
+            WHERE error IS NULL
+              AND COALESCE(NULLIF(btrim(status_booking), ''), 'completed') IN ('pending', 'accepted')
+            ORDER BY therapist_id, booking_ts, row_id
+        LOOP
+            IF item.therapist_id IS DISTINCT FROM current_therapist THEN
+                current_therapist := item.therapist_id;
+                last_end := NULL;
+            END IF;
+            IF last_end IS NOT NULL AND item.booking_ts < last_end THEN
+                RETURN NEXT item.row_id;
+            ELSE
+                last_end := item.booking_ts + duration * interval '1 minute';
+            END IF;
+        END LOOP;
+    END $$
+    """,
+]
+
+# Validasi & resolve foreign key, masing-masing satu UPDATE untuk seluruh staging table
+_VALIDATIONS = {
+    "users": [
+        """
+        UPDATE import_users SET error = 'name and email are required'
+        WHERE error IS NULL AND (NULLIF(btrim(name), '') IS NULL OR NULLIF(btrim(email), '') IS NULL)
+        """,
+        """
+        UPDATE import_users SET error = 'duplicate email in file'
+        WHERE error IS NULL AND row_id IN (
+            SELECT row_id FROM (
+                SELECT row_id, row_number() OVER (PARTITION BY btrim(email) ORDER BY row_id) AS rn
+                FROM import_users WHERE error IS NULL
+            ) d WHERE rn > 1
+        )
+        """,
+        "UPDATE import_users SET created_ts = pg_temp.import_ts(created_at) WHERE error IS NULL",
+    ],
+    "therapists": [
+        """
+        UPDATE import_therapists SET error = 'name and email are required'
+        WHERE error IS NULL AND (NULLIF(btrim(name), '') IS NULL OR NULLIF(btrim(email), '') IS NULL)
+        """,
+        """
+        UPDATE import_therapists SET error = 'duplicate email in file'
+        WHERE error IS NULL AND (
+            row_id IN (
+                SELECT row_id FROM (
+                    SELECT row_id, row_number() OVER (PARTITION BY btrim(email) ORDER BY row_id) AS rn
+                    FROM import_therapists WHERE error IS NULL
+                ) d WHERE rn > 1
+            )
+            OR btrim(email) IN (SELECT btrim(email) FROM import_users WHERE error IS NULL)
+        )
+        """,
+        """
+        UPDATE import_therapists SET error = 'invalid status_therapist'
+        WHERE error IS NULL AND NULLIF(btrim(status_therapist), '') IS NOT NULL
+          AND btrim(status_therapist) <> ALL(:therapist_statuses)
+        """,
+        """
+        UPDATE import_therapists
+        SET created_ts = pg_temp.import_ts(created_at),
+            experience_value = COALESCE(pg_temp.import_int(experience_years), 0),
+            working_hours_json = CASE
+                WHEN NULLIF(btrim(working_hours), '') IS NULL THEN NULL
+                ELSE COALESCE(pg_temp.import_jsonb(working_hours), to_jsonb(btrim(working_hours)))
+            END
+        WHERE error IS NULL
+        """,
+    ],
+    "bookings": [
+        """
+        UPDATE import_bookings
+        SET booking_ts = pg_temp.import_ts(booking_time), created_ts = pg_temp.import_ts(created_at)
+        """,
+        """
+        UPDATE import_bookings i SET user_id = u.id
+        FROM users u
+        WHERE u.email = btrim(i.user_email) AND u.role = 'user' AND u.status = 1
+        """,
+        """
+        UPDATE import_bookings i SET therapist_id = u.id
+        FROM users u
+        WHERE u.email = btrim(i.therapist_email) AND u.role = 'therapist' AND u.status = 1
+        """,
+        """
+        UPDATE import_bookings SET error = CASE
+            WHEN user_id IS NULL THEN 'unknown user_email'
+            WHEN therapist_id IS NULL THEN 'unknown therapist_email'
+            WHEN booking_ts IS NULL THEN 'invalid booking_time'
+            WHEN NULLIF(btrim(location), '') IS NULL THEN 'location is required'
+            WHEN COALESCE(NULLIF(btrim(status_booking), ''), 'completed') <> ALL(:booking_statuses)
+                THEN 'invalid status_booking'
+        END
+        WHERE error IS NULL
+        """,
+        """
+        UPDATE import_bookings SET error = 'duplicate booking in file'
+        WHERE error IS NULL AND row_id IN (
+            SELECT row_id FROM (
+                SELECT row_id, row_number() OVER (
+                    PARTITION BY user_id, therapist_id, booking_ts ORDER BY row_id
+                ) AS rn
+                FROM import_bookings WHERE error IS NULL
+            ) d WHERE rn > 1
+        )
+        """,
+        # booking aktif tidak boleh overlap (constraint bookings_no_overlap), cek sebelum merge
+        # supaya satu baris bentrok tidak membatalkan seluruh import.
+        # 1) terhadap booking yang sudah ada: batas booking_time (durasi maks 1 hari) membuat
+        #    lookup per baris hanya membaca partisi bulan terkait dan index no-overlap-nya
+        """
+        UPDATE import_bookings i SET error = 'overlaps another active booking'
+        WHERE i.error IS NULL
+          AND COALESCE(NULLIF(btrim(i.status_booking), ''), 'completed') IN ('pending', 'accepted')
+          AND EXISTS (
+              SELECT 1 FROM bookings b
+              WHERE b.therapist_id = i.therapist_id AND b.status = 1
+                AND b.status_booking IN ('pending', 'accepted')
+                AND b.booking_time >= i.booking_ts - interval '1 day'
+                AND b.booking_time < i.booking_ts + :default_duration * interval '1 minute'
+                AND tsrange(b.booking_time, b.booking_time + b.duration_minutes * interval '1 minute')
+                    && tsrange(i.booking_ts, i.booking_ts + :default_duration * interval '1 minute')
+          )
+        """,
+        # 2) antar baris file: satu scan terurut (therapist_id, booking_ts), baris hanya ditolak
+        #    jika bentrok dengan baris yang diterima, bukan dengan baris yang sudah ditolak
+        """
+        UPDATE import_bookings SET error = 'overlaps another active booking'
+        WHERE row_id IN (SELECT pg_temp.import_booking_overlaps(:default_duration))
+        """,
+    ],
+    "reviews": [
+        """
+        UPDATE import_reviews
+        SET booking_ts = pg_temp.import_ts(booking_time),
+            created_ts = pg_temp.import_ts(created_at),
+            rating_value = pg_temp.import_int(rating)
+        """,
+        """
+        UPDATE import_reviews i SET user_id = u.id
+        FROM users u
+        WHERE u.email = btrim(i.user_email) AND u.role = 'user' AND u.status = 1
+        """,
+        """
+        UPDATE import_reviews i SET therapist_id = u.id
+        FROM users u
+        WHERE u.email = btrim(i.therapist_email) AND u.role = 'therapist' AND u.status = 1
+        """,
+        """
+        UPDATE import_reviews i SET booking_id = b.id
+        FROM bookings b
+        WHERE b.user_id = i.user_id AND b.therapist_id = i.therapist_id
+          AND b.booking_time = i.booking_ts AND b.status = 1
+        """,
+        """
+        UPDATE import_reviews i SET error = CASE
+            WHEN user_id IS NULL THEN 'unknown user_email'
+            WHEN therapist_id IS NULL THEN 'unknown therapist_email'
+            WHEN booking_ts IS NULL THEN 'invalid booking_time'
+            WHEN booking_id IS NULL THEN 'booking not found'
+            WHEN rating_value IS NULL OR rating_value NOT BETWEEN 1 AND 5 THEN 'rating must be between 1 and 5'
+        END
+        WHERE error IS NULL
+        """,
+        """
+        UPDATE import_reviews SET error = 'duplicate review in file'
+        WHERE error IS NULL AND row_id IN (
+            SELECT row_id FROM (
+                SELECT row_id, row_number() OVER (PARTITION BY booking_id ORDER BY row_id) AS rn
+                FROM import_reviews WHERE error IS NULL
+            ) d WHERE rn > 1
+        )
+        """,
+    ],
+}
+
+# Merge staging -> tabel utama. Data yang sudah ada dilewati sehingga import aman diulang.
+# updated_at = NOW() supaya row historis (created_at lama) tetap terdeteksi refresh rollup stats.
+_MERGES = {
+    "users": """
+        INSERT INTO users (name, email, password, phone, role, status, created_at, updated_at)
+        SELECT btrim(i.name), btrim(i.email), COALESCE(NULLIF(i.password_hash, ''), :unusable_password),
+               NULLIF(btrim(i.phone), ''), 'user', 1, COALESCE(i.created_ts, NOW()), NOW()
+        FROM import_users i
+        WHERE i.error IS NULL
+          AND NOT EXISTS (SELECT 1 FROM users u WHERE u.email = btrim(i.email) AND u.status = 1)
+    """,
+    "therapists": """
+        WITH new_users AS (
+            INSERT INTO users (name, email, password, phone, role, status, created_at, updated_at)
+            SELECT btrim(i.name), btrim(i.email), COALESCE(NULLIF(i.password_hash, ''), :unusable_password),
+                   NULLIF(btrim(i.phone), ''), 'therapist', 1, COALESCE(i.created_ts, NOW()), NOW()
+            FROM import_therapists i
+            WHERE i.error IS NULL
+              AND NOT EXISTS (SELECT 1 FROM users u WHERE u.email = btrim(i.email) AND u.status = 1)
+            RETURNING id, email
+        )
+        INSERT INTO therapist_profiles
+            (user_id, bio, experience_years, specialization, status_therapist, working_hours,
+             average_rating, total_reviews, rank_score, status, created_at, updated_at)
+        SELECT nu.id, i.bio, i.experience_value, i.specialization,
+               COALESCE(NULLIF(btrim(i.status_therapist), ''), 'available'),
+               CAST(i.working_hours_json {working_hours_cast}),
+               0.0, 0, COALESCE((SELECT mean_rating FROM leaderboard_prior WHERE id = 1), 0), 1,
+               COALESCE(i.created_ts, NOW()), NOW()
+        FROM new_users nu
+        JOIN import_therapists i ON btrim(i.email) = nu.email AND i.error IS NULL
+    """,
+    "bookings": """
+        INSERT INTO bookings
+            (user_id, therapist_id, location, booking_time, status_booking, notes, status, created_at, updated_at)
+        SELECT i.user_id, i.therapist_id, btrim(i.location), i.booking_ts,
+               COALESCE(NULLIF(btrim(i.status_booking), ''), 'completed'), i.notes, 1,
+               COALESCE(i.created_ts, NOW()), NOW()
+        FROM import_bookings i
+        WHERE i.error IS NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM bookings b
+              WHERE b.user_id = i.user_id AND b.therapist_id = i.therapist_id
+                AND b.booking_time = i.booking_ts AND b.status = 1
+          )
+    """,
+    "reviews": """
+        INSERT INTO reviews (booking_id, user_id, therapist_id, rating, comment, status, created_at, updated_at)
+        SELECT i.booking_id, i.user_id, i.therapist_id, i.rating_value, i.comment, 1,
+               COALESCE(i.created_ts, NOW()), NOW()
+        FROM import_reviews i
+        WHERE i.error IS NULL
+          AND NOT EXISTS (SELECT 1 FROM reviews r WHERE r.booking_id = i.booking_id AND r.status = 1)
+    """,
+}
+
+
+def _is_ndjson(path):
+    return path.lower().endswith((".ndjson", ".jsonl"))
+
+class _CopySource:
+    """File-like minimal (read) di atas iterator string, supaya baris yang sudah dicek tetap di-stream ke COPY"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def _decoded_lines(source, state):
+    """Decode file per baris; baris yang bukan UTF-8 valid dihitung invalid, bukan membatalkan import"""
+    for raw in source:
+        state["line"] += 1
+        try:
+            yield raw.decode("utf-8")
+        except UnicodeDecodeError:
+            state["invalid"] += 1
+
+def _csv_records(lines, width, state):
+    """
+    Normalisasi record CSV untuk COPY. Record yang rusak (jumlah kolom salah, quoting rusak,
+    karakter NUL) tetap masuk staging dengan kolom error terisi, jadi muncul di reject_samples.
+    """
+    reader = csv.reader(lines)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    while True:
+        try:
+            row = next(reader)
+            error = None
+            if not any(field.strip() for field in row):
+                continue
+            if len(row) != width:
+                error = f"expected {width} columns, got {len(row)}"
+            elif any("\x00" in field for field in row):
+                error = "invalid character"
+        except StopIteration:
+            return
+        except csv.Error as e:
+            error = f"malformed CSV ({e})"
+        if error:
+            row = [None] * width
+            error = f"line {state['line']}: {error}"
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row + [error])
+        yield buffer.getvalue()
+
+def _ndjson_lines(lines, state):
+    # control char mentah & marker "\." tidak mungkin ada di JSON valid, tapi bisa merusak COPY
+    for line in lines:
+        doc = line.rstrip("\r\n")
+        if doc.strip() == "\\." or any(char in doc for char in "\x00\x01\x02"):
+            state["invalid"] += 1
+            continue
+        yield doc + "\n"
+
+def _copy_file(connection, entity, path):
+    """
+    Stream satu file ke staging table import_<entity> (semua kolom text) lewat COPY.
+    CSV: header dipakai sebagai daftar kolom; record dengan jumlah kolom salah masuk staging
+    sebagai reject. NDJSON: tiap baris masuk sebagai satu dokumen lalu dipecah ke kolom staging
+    dengan satu INSERT ... SELECT.
+    Return jumlah baris yang tidak bisa di-load sama sekali (bukan UTF-8 / bukan JSON valid).
+    """
+    columns = IMPORT_COLUMNS[entity]
+    state = {"line": 0, "invalid": 0}
+    cursor = connection.connection.cursor()
+    with open(path, "rb") as source:
+        if _is_ndjson(path):
+            # QUOTE/DELIMITER memakai control char yang tidak mungkin muncul mentah di JSON valid
+            cursor.copy_expert(
+                "COPY import_raw (doc) FROM STDIN WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')",
+                _CopySource(_ndjson_lines(_decoded_lines(source, state), state))
+            )
+            connection.execute(text(f"""
+                INSERT INTO import_{entity} ({", ".join(columns)})
+                SELECT {", ".join(f"doc ->> '{column}'" for column in columns)}
+                FROM (SELECT pg_temp.import_jsonb(doc) AS doc FROM import_raw) raw
+                WHERE jsonb_typeof(doc) = 'object'
+            """))
+            invalid = connection.execute(text("""
+                SELECT COUNT(*) FROM import_raw
+                WHERE NULLIF(btrim(doc), '') IS NOT NULL
+                  AND jsonb_typeof(pg_temp.import_jsonb(doc)) IS DISTINCT FROM 'object'
+            """)).scalar()
+            connection.execute(text("TRUNCATE import_raw"))
+            return invalid + state["invalid"]
+        lines = _decoded_lines(source, state)
+        header = [column.strip().lower() for column in next(csv.reader([next(lines, "")]), [])]
+        unknown = [column for column in header if column not in columns]
+        if not header or unknown:
+            raise ValueError(f"{path}: unknown columns {unknown}, allowed: {', '.join(columns)}")
+        cursor.copy_expert(
+            f"COPY import_{entity} ({', '.join(header)}, error) FROM STDIN WITH (FORMAT csv)",
+            _CopySource(_csv_records(lines, len(header), state))
+        )
+        return state["invalid"]
+
+def import_data(files, dry_run=False):
+    """
+    Import data historis dari file CSV/NDJSON.
+    files = dict entity -> path (users, therapists, bookings, reviews), boleh sebagian.
+    Semua entity di-load ke staging dengan COPY, divalidasi & di-resolve secara set-based,
+    lalu di-merge dalam satu transaksi. dry_run=True membatalkan transaksi setelah laporan dibuat.
+    Return laporan per entity, None kalau import gagal (error database / file tidak bisa dibaca).
+    Raise ValueError untuk header file yang tidak dikenal.
+    """
+    engine = get_connection()
+    report = {}
+    try:
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            for statement in _SAFE_CAST_FUNCTIONS:
+                connection.execute(text(statement))
+            connection.execute(text("CREATE TEMP TABLE import_raw (doc text) ON COMMIT DROP"))
+            for entity in IMPORT_ORDER:
+                connection.execute(text(f"""
+                    CREATE TEMP TABLE import_{entity} (
+                        row_id bigserial PRIMARY KEY,
+                        {", ".join(f"{column} text" for column in IMPORT_COLUMNS[entity])},
+                        {RESOLVED_COLUMNS[entity]},
+                        error text
+                    ) ON COMMIT DROP
+                """))
+
+            invalid_lines = {}
+            for entity in IMPORT_ORDER:
+                if files.get(entity):
+                    invalid_lines[entity] = _copy_file(connection, entity, files[entity])
+                    # statistik staging untuk planner (temp table tidak di-analyze autovacuum)
+                    connection.execute(text(f"ANALYZE import_{entity}"))
+
+            # tipe kolom working_hours bisa json/jsonb/text, ikuti tipe di database
+            working_hours_type = connection.execute(text("""
+                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = 'therapist_profiles'::regclass AND attname = 'working_hours'
+            """)).scalar() or "text"
+            working_hours_cast = (
+                f"AS {working_hours_type}" if working_hours_type in ("json", "jsonb")
+                else "#>> '{}' AS text"
+            )
+            params = {
+                "therapist_statuses": list(THERAPIST_STATUSES),
+                "booking_statuses": list(BOOKING_STATUSES),
+                "unusable_password": UNUSABLE_PASSWORD,
+                "default_duration": DEFAULT_SESSION_MINUTES,
+            }
+
+            # entity diproses berurutan karena bookings/reviews me-resolve id hasil merge sebelumnya
+            for entity in IMPORT_ORDER:
+                if not files.get(entity):
+                    continue
+                for statement in _VALIDATIONS[entity]:
+                    connection.execute(text(statement), params)
+                merge = _MERGES[entity]
+                if entity == "therapists":
+                    merge = merge.replace("{working_hours_cast}", working_hours_cast)
+                inserted = connection.execute(text(merge), params).rowcount
+                counts = connection.execute(text(f"""
+                    SELECT COUNT(*) AS loaded, COUNT(*) FILTER (WHERE error IS NOT NULL) AS rejected
+                    FROM import_{entity}
+                """)).mappings().fetchone()
+                rejects = connection.execute(text(f"""
+                    SELECT row_id, error FROM import_{entity}
+                    WHERE error IS NOT NULL ORDER BY row_id LIMIT :sample
+                """), {"sample": REJECT_SAMPLE}).mappings().all()
+                valid = counts["loaded"] - counts["rejected"]
+                report[entity] = {
+                    "loaded": counts["loaded"] + invalid_lines.get(entity, 0),
+                    "invalid_lines": invalid_lines.get(entity, 0),
+                    "rejected": counts["rejected"],
+                    "inserted": inserted,
+                    "skipped_existing": valid - inserted,
+                    "reject_samples": [{"row": row["row_id"], "error": row["error"]} for row in rejects],
+                }
+
+            if dry_run:
+                transaction.rollback()
+            else:
+                transaction.commit()
+            return report
+    except (SQLAlchemyError, psycopg2.Error, OSError, UnicodeDecodeError) as e:
+        print(f"Error occurred: {str(e)}")
+        return None
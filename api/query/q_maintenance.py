@@ -0,0 +1,173 @@
+import gzip
+import os
+from datetime import date
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..utils.config import get_connection
+
+
+PARTITION_MONTHS_AHEAD = 3
+PURGE_RETENTION_DAYS = 90
+PURGE_BATCH = 5000
+
+# tabel soft delete -> kolom waktu perubahan terakhir untuk retention
+# (notifications tidak punya updated_at, jadi pakai created_at)
+PURGE_TABLES = {
+    "bookings": "updated_at",
+    "reviews": "updated_at",
+    "notifications": "created_at",
+}
+
+# syarat tambahan per tabel: booking yang masih dirujuk review tidak ikut di-purge,
+# karena FK reviews.booking_id tidak bisa dipasang ke tabel bookings yang dipartisi
+PURGE_CONDITIONS = {
+    "bookings": "AND NOT EXISTS (SELECT 1 FROM reviews r WHERE r.booking_id = bookings.id)",
+}
+
+# kolom kunci untuk DELETE per batch: bookings memakai (id, booking_time) supaya setiap
+# row dihapus lewat primary key partisinya sendiri, bukan probe ke semua partisi
+PURGE_KEYS = {
+    "bookings": ("id", "booking_time"),
+}
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def create_booking_partitions(months_ahead=PARTITION_MONTHS_AHEAD):
+    """Pastikan partisi bookings bulan ini sampai months_ahead bulan ke depan sudah ada"""
+    this_month = date.today().replace(day=1)
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            return [
+                connection.execute(
+                    text("SELECT create_bookings_partition(:month)"),
+                    {"month": _add_months(this_month, offset)}
+                ).scalar()
+                for offset in range(months_ahead + 1)
+            ]
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def archive_booking_partitions(before, archive_dir, dry_run=False):
+    """
+    Archive partisi bookings yang seluruh rentangnya sebelum bulan `before`:
+    isi partisi di-COPY ke <archive_dir>/<partisi>.csv.gz, lalu partisi di-detach dan di-drop.
+    Satu transaksi per partisi; partisi hanya di-drop setelah file archive selesai ditulis.
+    Partisi yang booking-nya masih dirujuk review aktif dilewati (tidak ada FK reviews.booking_id
+    ke bookings yang dipartisi, jadi drop akan meninggalkan review tanpa booking).
+    Return list {"partition", "rows", "file", "skipped"}.
+    """
+    engine = get_connection()
+    archived = []
+    try:
+        with engine.connect() as connection:
+            partitions = connection.execute(
+                text("""
+                    SELECT c.relname AS name
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'bookings'::regclass
+                      AND c.relname ~ '^bookings_[0-9]{4}_[0-9]{2}$'
+                      AND to_date(substring(c.relname from 10), 'YYYY_MM') < date_trunc('month', CAST(:before AS date))
+                    ORDER BY c.relname
+                """),
+                {"before": before}
+            ).scalars().all()
+        if not dry_run:
+            os.makedirs(archive_dir, exist_ok=True)
+        for name in partitions:
+            path = os.path.join(archive_dir, f"{name}.csv.gz")
+            with engine.begin() as connection:
+                # kunci partisi supaya tidak ada write baru selama di-archive; EXCLUSIVE juga
+                # menunggu insert_review yang sedang memegang FOR SHARE pada booking partisi ini
+                if not dry_run:
+                    connection.execute(text(f'LOCK TABLE "{name}" IN EXCLUSIVE MODE'))
+                referenced = connection.execute(
+                    text(f"""
+                        SELECT EXISTS (
+                            SELECT 1 FROM "{name}" b
+                            JOIN reviews r ON r.booking_id = b.id AND r.status = 1
+                        )
+                    """)
+                ).scalar()
+                if referenced:
+                    archived.append({
+                        "partition": name, "rows": None, "file": None,
+                        "skipped": "bookings still referenced by active reviews"
+                    })
+                    continue
+                if dry_run:
+                    archived.append({"partition": name, "rows": None, "file": None, "skipped": None})
+                    continue
+                cursor = connection.connection.cursor()
+                with gzip.open(path, "wt", encoding="utf-8", newline="") as target:
+                    cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', target)
+                rows = cursor.rowcount
+                connection.execute(text(f'ALTER TABLE bookings DETACH PARTITION "{name}"'))
+                connection.execute(text(f'DROP TABLE "{name}"'))
+                # DROP tidak memicu trigger booking_keys, bersihkan rentang partisi ini
+                connection.execute(
+                    text("""
+                        DELETE FROM booking_keys
+                        WHERE booking_time >= to_date(:month, 'YYYY_MM')
+                          AND booking_time < to_date(:month, 'YYYY_MM') + interval '1 month'
+                    """),
+                    {"month": name[len("bookings_"):]}
+                )
+            archived.append({"partition": name, "rows": rows, "file": path, "skipped": None})
+        return archived
+    except (SQLAlchemyError, psycopg2.Error, OSError) as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def purge_soft_deleted(retention_days=PURGE_RETENTION_DAYS, dry_run=False):
+    """
+    Hard delete row soft delete (status = 0) yang lebih tua dari retention, per batch
+    PURGE_BATCH supaya lock dan WAL per transaksi tetap kecil. Return jumlah per tabel.
+    """
+    engine = get_connection()
+    report = {}
+    try:
+        for table, column in PURGE_TABLES.items():
+            condition = PURGE_CONDITIONS.get(table, "")
+            keys = PURGE_KEYS.get(table, ("id",))
+            if dry_run:
+                with engine.connect() as connection:
+                    report[table] = connection.execute(
+                        text(f"""
+                            SELECT COUNT(*) FROM {table}
+                            WHERE status = 0 AND {column} < NOW() - :retention_days * interval '1 day'
+                            {condition}
+                        """),
+                        {"retention_days": retention_days}
+                    ).scalar()
+                continue
+            report[table] = 0
+            while True:
+                with engine.begin() as connection:
+                    deleted = connection.execute(
+                        text(f"""
+                            DELETE FROM {table} t
+                            USING (
+                                SELECT {", ".join(keys)} FROM {table}
+                                WHERE status = 0 AND {column} < NOW() - :retention_days * interval '1 day'
+                                {condition}
+                                LIMIT :batch
+                            ) d
+                            WHERE {" AND ".join(f"t.{key} = d.{key}" for key in keys)}
+                        """),
+                        {"retention_days": retention_days, "batch": PURGE_BATCH}
+                    ).rowcount
+                report[table] += deleted
+                if deleted < PURGE_BATCH:
+                    break
+        return report
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
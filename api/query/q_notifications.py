@@ -2,6 +2,36 @@ from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
 from ..utils.config import get_connection
+from ..utils.helper import clamp_limit
+
+
+NOTIFICATION_PAGE_DEFAULT = 20
+NOTIFICATION_PAGE_MAX = 100
+NOTIFICATION_BULK_MAX = 500
+BROADCAST_CHUNK_DEFAULT = 1000
+# target broadcast -> role user yang menerima
+BROADCAST_ROLES = {
+    "user": ("user",),
+    "therapist": ("therapist",),
+    "all": ("user", "therapist"),
+}
+
+# Insert multi-row notifikasi dari array user_ids/messages sekaligus menaikkan
+# counter unread tiap penerima, dalam satu statement
+INSERT_NOTIFICATIONS_SQL = """
+    WITH inserted AS (
+        INSERT INTO notifications (user_id, message, is_read, status, created_at)
+        SELECT n.user_id, n.message, 0, 1, NOW()
+        FROM unnest(CAST(:user_ids AS integer[]), CAST(:messages AS text[])) AS n(user_id, message)
+        RETURNING id, user_id, message, is_read, status, created_at
+    ), counted AS (
+        INSERT INTO notification_counters AS c (user_id, unread_count, updated_at)
+        SELECT user_id, COUNT(*), NOW() FROM inserted GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET unread_count = c.unread_count + EXCLUDED.unread_count, updated_at = NOW()
+    )
+    SELECT id, user_id, message, is_read, status, created_at FROM inserted
+"""
 
 
 def create_notification(payload):
@@ -9,12 +39,8 @@ def create_notification(payload):
     try:
         with engine.begin() as connection:
             result = connection.execute(
-                text("""
-                    INSERT INTO notifications (user_id, message, is_read, status, created_at)
-                    VALUES (:user_id, :message, 0, 1, NOW())
-                    RETURNING id, user_id, message, is_read, status, created_at;
-                """),
-                {"user_id": payload["user_id"], "message": payload["message"]}
+                text(INSERT_NOTIFICATIONS_SQL),
+                {"user_ids": [payload["user_id"]], "messages": [payload["message"]]}
             ).mappings().fetchone()
             if result:
                 return {
@@ -30,19 +56,45 @@ def create_notification(payload):
         print(f"Error occurred: {str(e)}")
         return None
     
-def get_notifications_by_user(user_id):
+def get_notifications_by_user(user_id, limit=None, since_id=None, before_id=None):
+    """
+    Satu halaman notifikasi user, terbaru dulu (index user_id, id DESC).
+    before_id: halaman lebih lama, since_id: notifikasi yang lebih baru dari id tersebut.
+    Return (notifications, meta) dengan next_before_id / next_since_id jika masih ada.
+    """
+    limit = clamp_limit(limit, NOTIFICATION_PAGE_DEFAULT, NOTIFICATION_PAGE_MAX)
+    params = {"user_id": user_id, "limit": limit + 1}
+    if since_id is not None:
+        # ambil dari yang paling dekat since_id supaya tidak ada yang terlewat
+        page_filter, order = "AND id > :since_id", "ASC"
+        params["since_id"] = since_id
+    elif before_id is not None:
+        page_filter, order = "AND id < :before_id", "DESC"
+        params["before_id"] = before_id
+    else:
+        page_filter, order = "", "DESC"
     engine = get_connection()
     try:
         with engine.connect() as connection:
             results = connection.execute(
-                text("""
+                text(f"""
                     SELECT id, message, is_read, created_at
                     FROM notifications
-                    WHERE user_id = :user_id AND status = 1
-                    ORDER BY created_at DESC
+                    WHERE user_id = :user_id AND status = 1 {page_filter}
+                    ORDER BY id {order}
+                    LIMIT :limit
                 """),
-                {"user_id": user_id}
+                params
             ).mappings().fetchall()
+            has_more = len(results) > limit
+            results = results[:limit]
+            meta = {"next_before_id": None, "next_since_id": None}
+            if since_id is not None:
+                if has_more:
+                    meta["next_since_id"] = results[-1]["id"]
+                results = list(reversed(results))
+            elif has_more:
+                meta["next_before_id"] = results[-1]["id"]
             return [
                 {
                     "id_notification": row["id"],
@@ -51,21 +103,106 @@ def get_notifications_by_user(user_id):
                     "created_at": str(row["created_at"])
                 }
                 for row in results
-            ]
+            ], meta
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def get_unread_count(user_id):
+    """Badge unread: satu lookup primary key di notification_counters"""
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            count = connection.execute(
+                text("SELECT unread_count FROM notification_counters WHERE user_id = :user_id"),
+                {"user_id": user_id}
+            ).scalar()
+            return count or 0
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
         return None
     
+def get_latest_notification_id(user_id):
+    """Id notifikasi aktif terbaru milik user (titik awal stream tanpa Last-Event-ID)"""
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            latest = connection.execute(
+                text("SELECT MAX(id) FROM notifications WHERE user_id = :user_id AND status = 1"),
+                {"user_id": user_id}
+            ).scalar()
+            return latest or 0
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def get_notification_stream_page(user_id, after_id, limit):
+    """
+    Notifikasi aktif user dengan id > after_id (urut id ASC) untuk stream SSE, beserta xmin/xmax
+    snapshot statement yang sama. Id dialokasikan sebelum commit, jadi caller memakai snapshot
+    untuk tahu kapan semua transaksi yang mungkin membawa id lebih kecil sudah selesai.
+    Return (notifications, {"xmin", "xmax"}).
+    """
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            results = connection.execute(
+                text("""
+                    WITH snapshot AS (SELECT pg_current_snapshot() AS s)
+                    SELECT CAST(CAST(pg_snapshot_xmin(s) AS text) AS bigint) AS snapshot_xmin,
+                           CAST(CAST(pg_snapshot_xmax(s) AS text) AS bigint) AS snapshot_xmax,
+                           n.id, n.message, n.is_read, n.created_at
+                    FROM snapshot
+                    LEFT JOIN LATERAL (
+                        SELECT id, message, is_read, created_at
+                        FROM notifications
+                        WHERE user_id = :user_id AND status = 1 AND id > :after_id
+                        ORDER BY id
+                        LIMIT :limit
+                    ) n ON true
+                    ORDER BY n.id
+                """),
+                {"user_id": user_id, "after_id": after_id, "limit": limit}
+            ).mappings().fetchall()
+            snapshot = {"xmin": results[0]["snapshot_xmin"], "xmax": results[0]["snapshot_xmax"]}
+            return [
+                {
+                    "id_notification": row["id"],
+                    "message": row["message"],
+                    "is_read": bool(row["is_read"]),
+                    "created_at": str(row["created_at"])
+                }
+                for row in results if row["id"] is not None
+            ], snapshot
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
 def mark_notification_as_read(id_notification, user_id):
     engine = get_connection()
     try:
         with engine.begin() as connection:
+            # counter hanya turun jika notifikasi sebelumnya belum dibaca,
+            # FOR UPDATE mencegah dua request paralel sama-sama mengurangi counter
             result = connection.execute(
                 text("""
-                    UPDATE notifications
-                    SET is_read = 1
-                    WHERE id = :id_notification AND user_id = :user_id AND status = 1
-                    RETURNING id, message, is_read, created_at
+                    WITH target AS (
+                        SELECT id, is_read AS was_read
+                        FROM notifications
+                        WHERE id = :id_notification AND user_id = :user_id AND status = 1
+                        FOR UPDATE
+                    ), updated AS (
+                        UPDATE notifications n
+                        SET is_read = 1
+                        FROM target t
+                        WHERE n.id = t.id
+                        RETURNING n.id, n.message, n.is_read, n.created_at, t.was_read
+                    ), counted AS (
+                        UPDATE notification_counters
+                        SET unread_count = GREATEST(unread_count - 1, 0), updated_at = NOW()
+                        WHERE user_id = :user_id AND EXISTS (SELECT 1 FROM updated WHERE was_read = 0)
+                    )
+                    SELECT id, message, is_read, created_at FROM updated
                 """),
                 {"id_notification": id_notification, "user_id": user_id}
             ).mappings().fetchone()
@@ -79,4 +216,236 @@ def mark_notification_as_read(id_notification, user_id):
             return None
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def _bulk_filter(ids=None, up_to_id=None):
+    """Filter bulk read/dismiss: daftar id, atau semua notifikasi sampai up_to_id"""
+    if ids:
+        return "id = ANY(:ids)", {"ids": [int(value) for value in ids]}
+    return "id <= :up_to_id", {"up_to_id": up_to_id}
+
+def mark_notifications_as_read(user_id, ids=None, up_to_id=None):
+    """
+    Tandai banyak notifikasi sudah dibaca dalam satu UPDATE, counter unread dikurangi sekali
+    sebanyak notifikasi yang benar-benar berubah. Return jumlah row yang berubah.
+    """
+    condition, params = _bulk_filter(ids, up_to_id)
+    params["user_id"] = user_id
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            return connection.execute(
+                text(f"""
+                    WITH updated AS (
+                        UPDATE notifications
+                        SET is_read = 1
+                        WHERE user_id = :user_id AND status = 1 AND is_read = 0 AND {condition}
+                        RETURNING id
+                    ), counted AS (
+                        UPDATE notification_counters
+                        SET unread_count = GREATEST(unread_count - (SELECT COUNT(*) FROM updated), 0),
+                            updated_at = NOW()
+                        WHERE user_id = :user_id AND EXISTS (SELECT 1 FROM updated)
+                    )
+                    SELECT COUNT(*) FROM updated
+                """),
+                params
+            ).scalar()
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def dismiss_notifications(user_id, ids=None, up_to_id=None):
+    """
+    Soft delete banyak notifikasi dalam satu UPDATE, counter unread dikurangi sebanyak
+    notifikasi belum dibaca yang ikut di-dismiss. Return jumlah row yang di-dismiss.
+    """
+    condition, params = _bulk_filter(ids, up_to_id)
+    params["user_id"] = user_id
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            return connection.execute(
+                text(f"""
+                    WITH dismissed AS (
+                        UPDATE notifications
+                        SET status = 0
+                        WHERE user_id = :user_id AND status = 1 AND {condition}
+                        RETURNING id, is_read
+                    ), counted AS (
+                        UPDATE notification_counters
+                        SET unread_count = GREATEST(
+                                unread_count - (SELECT COUNT(*) FROM dismissed WHERE is_read = 0), 0
+                            ),
+                            updated_at = NOW()
+                        WHERE user_id = :user_id AND EXISTS (SELECT 1 FROM dismissed WHERE is_read = 0)
+                    )
+                    SELECT COUNT(*) FROM dismissed
+                """),
+                params
+            ).scalar()
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def _broadcast_recipients_sql(status_therapist=None, bounded=False):
+    """
+    Penerima broadcast aktif setelah :last_user_id, urut id (dipakai hitung total & fan-out).
+    bounded=True membatasi ke u.id <= :max_user_id, supaya user yang daftar setelah job dibuat
+    tidak ikut dan sent_count tidak melewati total_recipients.
+    """
+    query = """
+        SELECT u.id
+        FROM users u
+    """
+    if status_therapist:
+        query += """
+        JOIN therapist_profiles tp
+            ON tp.user_id = u.id AND tp.status = 1 AND tp.status_therapist = :status_therapist
+        """
+    query += """
+        WHERE u.status = 1 AND u.role = ANY(:roles) AND u.id > :last_user_id
+    """
+    if bounded:
+        query += """
+          AND u.id <= :max_user_id
+        """
+    query += """
+        ORDER BY u.id
+    """
+    return query
+
+def _broadcast_row(row):
+    total = row["total_recipients"]
+    return {
+        "id_broadcast": row["id"],
+        "message": row["message"],
+        "target_role": row["target_role"],
+        "status_therapist": row["status_therapist"],
+        "status": row["status"],
+        "total_recipients": total,
+        "sent_count": row["sent_count"],
+        "progress": round(row["sent_count"] / total, 4) if total else 1.0,
+        "created_at": str(row["created_at"]),
+        "started_at": str(row["started_at"]) if row["started_at"] else None,
+        "finished_at": str(row["finished_at"]) if row["finished_at"] else None
+    }
+
+def create_broadcast(created_by, message, target_role, status_therapist=None):
+    """
+    Simpan job broadcast (status queued) beserta jumlah penerimanya, fan-out dilakukan
+    dispatcher di background supaya request tidak menunggu.
+    """
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            row = connection.execute(
+                text(f"""
+                    INSERT INTO notification_broadcasts
+                        (created_by, message, target_role, status_therapist, status, total_recipients,
+                         max_user_id, created_at)
+                    SELECT :created_by, :message, :target_role, :status_therapist, 'queued', COUNT(*),
+                           COALESCE(MAX(recipients.id), 0), NOW()
+                    FROM ({_broadcast_recipients_sql(status_therapist)}) recipients
+                    RETURNING *
+                """),
+                {
+                    "created_by": created_by,
+                    "message": message,
+                    "target_role": target_role,
+                    "status_therapist": status_therapist,
+                    "roles": list(BROADCAST_ROLES[target_role]),
+                    "last_user_id": 0,
+                }
+            ).mappings().fetchone()
+            return _broadcast_row(row)
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def get_broadcast(id_broadcast):
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(
+                text("SELECT * FROM notification_broadcasts WHERE id = :id_broadcast"),
+                {"id_broadcast": id_broadcast}
+            ).mappings().fetchone()
+            return _broadcast_row(row) if row else None
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def dispatch_broadcast_chunk(chunk_size=BROADCAST_CHUNK_DEFAULT):
+    """
+    Fan-out satu chunk dari job broadcast tertua yang belum selesai.
+    Job di-claim FOR UPDATE SKIP LOCKED, penerima di-insert dengan satu INSERT ... SELECT
+    (counter unread ikut naik) dan checkpoint last_user_id di-commit di transaksi yang sama,
+    jadi tiap chunk singkat dan tidak ada penerima yang dapat dobel.
+    Return {"id_broadcast", "sent", "status"}, {} jika tidak ada job, atau None jika gagal.
+    """
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            job = connection.execute(
+                text("""
+                    SELECT id, message, target_role, status_therapist, last_user_id, max_user_id
+                    FROM notification_broadcasts
+                    WHERE status IN ('queued', 'running')
+                    ORDER BY id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                """)
+            ).mappings().fetchone()
+            if not job:
+                return {}
+
+            chunk = connection.execute(
+                text(f"""
+                    WITH recipients AS (
+                        {_broadcast_recipients_sql(job["status_therapist"], bounded=True)}
+                        LIMIT :chunk_size
+                    ), inserted AS (
+                        INSERT INTO notifications (user_id, message, is_read, status, created_at)
+                        SELECT id, :message, 0, 1, NOW() FROM recipients
+                        RETURNING user_id
+                    ), counted AS (
+                        INSERT INTO notification_counters AS c (user_id, unread_count, updated_at)
+                        SELECT user_id, 1, NOW() FROM inserted
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET unread_count = c.unread_count + 1, updated_at = NOW()
+                    )
+                    SELECT COUNT(*) AS sent, MAX(user_id) AS last_user_id FROM inserted
+                """),
+                {
+                    "message": job["message"],
+                    "status_therapist": job["status_therapist"],
+                    "roles": list(BROADCAST_ROLES[job["target_role"]]),
+                    "last_user_id": job["last_user_id"],
+                    "max_user_id": job["max_user_id"],
+                    "chunk_size": chunk_size,
+                }
+            ).mappings().fetchone()
+
+            status = "running" if chunk["sent"] == chunk_size else "completed"
+            connection.execute(
+                text("""
+                    UPDATE notification_broadcasts
+                    SET sent_count = sent_count + :sent,
+                        last_user_id = COALESCE(:last_user_id, last_user_id),
+                        status = :status,
+                        started_at = COALESCE(started_at, NOW()),
+                        finished_at = CASE WHEN :status = 'completed' THEN NOW() END
+                    WHERE id = :id_broadcast
+                """),
+                {
+                    "id_broadcast": job["id"],
+                    "sent": chunk["sent"],
+                    "last_user_id": chunk["last_user_id"],
+                    "status": status,
+                }
+            )
+            return {"id_broadcast": job["id"], "sent": chunk["sent"], "status": status}
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
@@ -0,0 +1,80 @@
+import json
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..utils.config import get_connection
+from .q_notifications import INSERT_NOTIFICATIONS_SQL
+
+
+OUTBOX_BATCH_DEFAULT = 500
+
+
+def enqueue_event(connection, event_type, payload):
+    """Tulis event ke outbox di transaksi milik pemanggil, ikut commit/rollback bersama datanya"""
+    connection.execute(
+        text("""
+            INSERT INTO outbox_events (event_type, payload, created_at)
+            VALUES (:event_type, CAST(:payload AS jsonb), NOW())
+        """),
+        {"event_type": event_type, "payload": json.dumps(payload, default=str)}
+    )
+
+def build_notifications(event_type, payload):
+    """Event outbox -> list (user_id, message) notifikasi untuk pihak lain"""
+    if event_type == "booking.created":
+        return [(payload["therapist_id"], f"New booking request for {payload['booking_time']}")]
+    if event_type == "booking.series_created":
+        return [(
+            payload["therapist_id"],
+            f"New booking series: {payload['count']} sessions starting {payload['first_booking_time']}"
+        )]
+    if event_type == "booking.status_changed":
+        return [(payload["user_id"], f"Your booking on {payload['booking_time']} was {payload['status_booking']}")]
+    if event_type == "review.created":
+        return [(payload["therapist_id"], f"You received a {payload['rating']}-star review")]
+    return []
+
+def dispatch_outbox(batch_size=OUTBOX_BATCH_DEFAULT):
+    """
+    Kirim satu batch event outbox ke notifications.
+    Row di-claim dengan FOR UPDATE SKIP LOCKED sehingga beberapa dispatcher bisa jalan
+    paralel tanpa saling menunggu atau mengirim dobel. Notifikasi di-insert multi-row
+    (counter unread ikut naik) dan event ditandai dispatched di transaksi yang sama.
+    Return {"events", "notifications"} atau None jika gagal.
+    """
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            events = connection.execute(
+                text("""
+                    SELECT id, event_type, payload
+                    FROM outbox_events
+                    WHERE dispatched_at IS NULL
+                    ORDER BY id
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                """),
+                {"batch_size": batch_size}
+            ).mappings().all()
+            if not events:
+                return {"events": 0, "notifications": 0}
+
+            user_ids, messages = [], []
+            for event in events:
+                for user_id, message in build_notifications(event["event_type"], event["payload"]):
+                    user_ids.append(user_id)
+                    messages.append(message)
+
+            if user_ids:
+                connection.execute(
+                    text(INSERT_NOTIFICATIONS_SQL),
+                    {"user_ids": user_ids, "messages": messages}
+                )
+            connection.execute(
+                text("UPDATE outbox_events SET dispatched_at = NOW() WHERE id = ANY(:ids)"),
+                {"ids": [event["id"] for event in events]}
+            )
+            return {"events": len(events), "notifications": len(user_ids)}
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
@@ -1,92 +1,160 @@
+from datetime import datetime
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
 from ..utils.config import get_connection
-from ..utils.helper import serialize_row
+from ..utils.helper import clamp_limit, decode_cursor, encode_cursor, serialize_row
+from .q_bookings import get_booking_time
+from .q_outbox import enqueue_event
+from .q_therapist import therapist_cache
 
 
-def create_review(user_id, booking_id, rating, comment=None):
-    engine = get_connection()
-    try:
-        with engine.begin() as connection:
-            # Validasi booking
-            booking = connection.execute(
-                text("""
-                    SELECT id, user_id, therapist_id, status_booking
-                    FROM bookings
-                    WHERE id = :booking_id AND status = 1
-                """),
-                {"booking_id": booking_id}
-            ).mappings().fetchone()
+REVIEW_PAGE_DEFAULT = 20
+REVIEW_PAGE_MAX = 100
 
-            if not booking:
-                return None
-            if booking["user_id"] != int(user_id):
-                return None  # user tidak boleh review booking orang lain
-            if booking["status_booking"] != "completed":
-                return None  # hanya bisa review booking completed
-
-            # Cek apakah sudah ada review
-            existing = connection.execute(
-                text("SELECT id FROM reviews WHERE booking_id = :booking_id AND status = 1"),
-                {"booking_id": booking_id}
-            ).mappings().fetchone()
-            if existing:
-                return None  # sudah ada review
 
-            # Insert review baru
-            result = connection.execute(
-                text("""
-                    INSERT INTO reviews (booking_id, user_id, therapist_id, rating, comment, created_at)
-                    VALUES (:booking_id, :user_id, :therapist_id, :rating, :comment, NOW())
-                    RETURNING id, booking_id, user_id, therapist_id, rating, comment, created_at
-                """),
-                {
-                    "booking_id": booking_id,
-                    "user_id": user_id,
-                    "therapist_id": booking["therapist_id"],
-                    "rating": rating,
-                    "comment": comment
-                }
-            ).mappings().fetchone()
+def insert_review(connection, user_id, booking_id, rating, comment=None):
+    """
+    Insert review + update agregat rating di transaksi milik pemanggil
+    (dipakai create_review & request idempotent). Cache therapist dikosongkan oleh pemanggil.
+    """
+    # Validasi booking, booking_time dari booking_keys supaya hanya satu partisi yang dibaca
+    booking_time = get_booking_time(connection, booking_id)
+    if booking_time is None:
+        return None
+    booking = connection.execute(
+        text("""
+            SELECT id, user_id, therapist_id, status_booking
+            FROM bookings
+            WHERE id = :booking_id AND booking_time = :booking_time AND status = 1
+            FOR SHARE
+        """),
+        {"booking_id": booking_id, "booking_time": booking_time}
+    ).mappings().fetchone()
 
-            # Update average rating & total reviews di therapist_profiles
-            connection.execute(
-                text("""
-                    UPDATE therapist_profiles
-                    SET average_rating = (
-                        SELECT COALESCE(AVG(rating),0) FROM reviews 
-                        WHERE therapist_id = :therapist_id AND status = 1
-                    ),
-                    total_reviews = (
-                        SELECT COUNT(*) FROM reviews 
-                        WHERE therapist_id = :therapist_id AND status = 1
-                    ),
-                    updated_at = NOW()
-                    WHERE user_id = :therapist_id
-                """),
-                {"therapist_id": booking["therapist_id"]}
+    if not booking:
+        return None
+    if booking["user_id"] != int(user_id):
+        return None  # user tidak boleh review booking orang lain
+    if booking["status_booking"] != "completed":
+        return None  # hanya bisa review booking completed
+
+    # Cek apakah sudah ada review
+    existing = connection.execute(
+        text("SELECT id FROM reviews WHERE booking_id = :booking_id AND status = 1"),
+        {"booking_id": booking_id}
+    ).mappings().fetchone()
+    if existing:
+        return None  # sudah ada review
+
+    # Insert review baru
+    result = connection.execute(
+        text("""
+            INSERT INTO reviews (booking_id, user_id, therapist_id, rating, comment, created_at, updated_at)
+            VALUES (:booking_id, :user_id, :therapist_id, :rating, :comment, NOW(), NOW())
+            RETURNING id, booking_id, user_id, therapist_id, rating, comment, created_at
+        """),
+        {
+            "booking_id": booking_id,
+            "user_id": user_id,
+            "therapist_id": booking["therapist_id"],
+            "rating": rating,
+            "comment": comment
+        }
+    ).mappings().fetchone()
+
+    enqueue_event(connection, "review.created", {
+        "review_id": result["id"],
+        "booking_id": result["booking_id"],
+        "user_id": result["user_id"],
+        "therapist_id": result["therapist_id"],
+        "rating": result["rating"],
+    })
+
+    # Update agregat rating secara atomic (O(1)), rank_score ikut dihitung ulang
+    # dengan prior leaderboard terakhir. Row lock dari UPDATE ini menserialkan review paralel.
+    connection.execute(
+        text("""
+            UPDATE therapist_profiles tp
+            SET rating_sum = tp.rating_sum + :rating,
+                total_reviews = tp.total_reviews + 1,
+                average_rating = CAST(tp.rating_sum + :rating AS numeric) / (tp.total_reviews + 1),
+                rank_score = (lp.weight * lp.mean_rating + tp.rating_sum + :rating)
+                             / (lp.weight + tp.total_reviews + 1),
+                updated_at = NOW()
+            FROM leaderboard_prior lp
+            WHERE lp.id = 1 AND tp.user_id = :therapist_id
+        """),
+        {"therapist_id": booking["therapist_id"], "rating": rating}
+    )
+
+    # Histogram rating per therapist
+    connection.execute(
+        text("""
+            INSERT INTO therapist_rating_summary AS s
+                (therapist_id, rating_1, rating_2, rating_3, rating_4, rating_5, total_reviews, updated_at)
+            VALUES (
+                :therapist_id,
+                CASE WHEN :rating = 1 THEN 1 ELSE 0 END,
+                CASE WHEN :rating = 2 THEN 1 ELSE 0 END,
+                CASE WHEN :rating = 3 THEN 1 ELSE 0 END,
+                CASE WHEN :rating = 4 THEN 1 ELSE 0 END,
+                CASE WHEN :rating = 5 THEN 1 ELSE 0 END,
+                1, NOW()
             )
+            ON CONFLICT (therapist_id) DO UPDATE
+            SET rating_1 = s.rating_1 + EXCLUDED.rating_1,
+                rating_2 = s.rating_2 + EXCLUDED.rating_2,
+                rating_3 = s.rating_3 + EXCLUDED.rating_3,
+                rating_4 = s.rating_4 + EXCLUDED.rating_4,
+                rating_5 = s.rating_5 + EXCLUDED.rating_5,
+                total_reviews = s.total_reviews + 1,
+                updated_at = NOW()
+        """),
+        {"therapist_id": booking["therapist_id"], "rating": rating}
+    )
+
+    return {
+        "id_review": result["id"],
+        "booking_id": result["booking_id"],
+        "user_id": result["user_id"],
+        "therapist_id": result["therapist_id"],
+        "rating": result["rating"],
+        "comment": result["comment"],
+        "created_at": str(result["created_at"])
+    }
 
-            return {
-                "id_review": result["id"],
-                "booking_id": result["booking_id"],
-                "user_id": result["user_id"],
-                "therapist_id": result["therapist_id"],
-                "rating": result["rating"],
-                "comment": result["comment"],
-                "created_at": str(result["created_at"])
-            }
+@therapist_cache.invalidates
+def create_review(user_id, booking_id, rating, comment=None):
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            return insert_review(connection, user_id, booking_id, rating, comment)
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
         return None
 
-def get_reviews_by_therapist(therapist_id):
+def get_reviews_by_therapist(therapist_id, limit=None, cursor=None):
+    """
+    Satu halaman review therapist (keyset created_at, id) + ringkasan histogram rating.
+    Return (reviews, next_cursor, summary).
+    """
+    limit = clamp_limit(limit, REVIEW_PAGE_DEFAULT, REVIEW_PAGE_MAX)
+    params = {"therapist_id": therapist_id, "limit": limit + 1}
+    page_filter = ""
+    if cursor:
+        cursor_created, cursor_id = decode_cursor(cursor, 2)
+        try:
+            params["cursor_created"] = datetime.fromisoformat(cursor_created)
+            params["cursor_id"] = int(cursor_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        page_filter = "AND (r.created_at, r.id) < (:cursor_created, :cursor_id)"
     engine = get_connection()
     try:
         with engine.connect() as connection:
             result = connection.execute(
-                text("""
+                text(f"""
                     SELECT 
                         r.id AS id_review,
                         r.booking_id,
@@ -100,11 +168,36 @@ def get_reviews_by_therapist(therapist_id):
                     JOIN users u ON r.user_id = u.id
                     WHERE r.therapist_id = :therapist_id
                       AND r.status = 1
-                    ORDER BY r.created_at DESC
+                      {page_filter}
+                    ORDER BY r.created_at DESC, r.id DESC
+                    LIMIT :limit
                 """),
-                {"therapist_id": therapist_id}
+                params
             ).mappings().all()
-            return [serialize_row(row) for row in result]
+            next_cursor = None
+            if len(result) > limit:
+                result = result[:limit]
+                next_cursor = encode_cursor(result[-1]["created_at"], result[-1]["id_review"])
+
+            summary = connection.execute(
+                text("""
+                    SELECT rating_1, rating_2, rating_3, rating_4, rating_5, total_reviews
+                    FROM therapist_rating_summary
+                    WHERE therapist_id = :therapist_id
+                """),
+                {"therapist_id": therapist_id}
+            ).mappings().fetchone()
+            return (
+                [serialize_row(row) for row in result],
+                next_cursor,
+                {
+                    "total_reviews": summary["total_reviews"] if summary else 0,
+                    "histogram": {
+                        str(star): summary[f"rating_{star}"] if summary else 0
+                        for star in range(1, 6)
+                    }
+                }
+            )
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
         return None
@@ -136,4 +229,88 @@ def get_review_by_id(id_review):
             return None
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+@therapist_cache.invalidates
+def reconcile_rating_aggregates(apply=True):
+    """
+    Hitung ulang agregat rating semua therapist dari tabel reviews dalam satu pass
+    set-based dan laporkan therapist yang drift. Jika apply=True, drift langsung diperbaiki
+    (termasuk histogram di therapist_rating_summary).
+    """
+    query = """
+        WITH actual AS (
+            SELECT therapist_id, COUNT(*) AS total_reviews, SUM(rating) AS rating_sum
+            FROM reviews
+            WHERE status = 1
+            GROUP BY therapist_id
+        ),
+        drift AS (
+            SELECT tp.id, tp.user_id,
+                   tp.total_reviews AS stored_total, COALESCE(a.total_reviews, 0) AS actual_total,
+                   tp.rating_sum AS stored_sum, COALESCE(a.rating_sum, 0) AS actual_sum
+            FROM therapist_profiles tp
+            LEFT JOIN actual a ON a.therapist_id = tp.user_id
+            WHERE tp.total_reviews IS DISTINCT FROM COALESCE(a.total_reviews, 0)
+               OR tp.rating_sum IS DISTINCT FROM COALESCE(a.rating_sum, 0)
+        )
+    """
+    if apply:
+        query += """
+        , fixed AS (
+            UPDATE therapist_profiles tp
+            SET total_reviews = d.actual_total,
+                rating_sum = d.actual_sum,
+                average_rating = COALESCE(CAST(d.actual_sum AS numeric) / NULLIF(d.actual_total, 0), 0),
+                rank_score = (lp.weight * lp.mean_rating + d.actual_sum) / (lp.weight + d.actual_total),
+                updated_at = NOW()
+            FROM drift d, leaderboard_prior lp
+            WHERE tp.id = d.id AND lp.id = 1
+            RETURNING tp.id
+        ),
+        summary_fixed AS (
+            INSERT INTO therapist_rating_summary AS s
+                (therapist_id, rating_1, rating_2, rating_3, rating_4, rating_5, total_reviews, updated_at)
+            -- left join dari histogram yang tersimpan: therapist yang semua review-nya
+            -- sudah dihapus (status = 0) ikut di-reset ke nol
+            SELECT t.therapist_id,
+                   COUNT(r.id) FILTER (WHERE r.rating = 1), COUNT(r.id) FILTER (WHERE r.rating = 2),
+                   COUNT(r.id) FILTER (WHERE r.rating = 3), COUNT(r.id) FILTER (WHERE r.rating = 4),
+                   COUNT(r.id) FILTER (WHERE r.rating = 5), COUNT(r.id), NOW()
+            FROM (
+                SELECT therapist_id FROM therapist_rating_summary
+                UNION
+                SELECT therapist_id FROM reviews WHERE status = 1
+            ) t
+            LEFT JOIN reviews r ON r.therapist_id = t.therapist_id AND r.status = 1
+            GROUP BY t.therapist_id
+            ON CONFLICT (therapist_id) DO UPDATE
+            SET rating_1 = EXCLUDED.rating_1, rating_2 = EXCLUDED.rating_2, rating_3 = EXCLUDED.rating_3,
+                rating_4 = EXCLUDED.rating_4, rating_5 = EXCLUDED.rating_5,
+                total_reviews = EXCLUDED.total_reviews, updated_at = NOW()
+            WHERE (s.rating_1, s.rating_2, s.rating_3, s.rating_4, s.rating_5, s.total_reviews)
+                IS DISTINCT FROM (EXCLUDED.rating_1, EXCLUDED.rating_2, EXCLUDED.rating_3,
+                                  EXCLUDED.rating_4, EXCLUDED.rating_5, EXCLUDED.total_reviews)
+            RETURNING s.therapist_id
+        )
+        """
+    query += " SELECT * FROM drift ORDER BY user_id"
+    engine = get_connection()
+    try:
+        # dry run tetap read-only: connect() tanpa commit
+        with (engine.begin() if apply else engine.connect()) as connection:
+            result = connection.execute(text(query)).mappings().all()
+            return [
+                {
+                    "id_profile": row["id"],
+                    "therapist_id": row["user_id"],
+                    "stored_total": row["stored_total"],
+                    "actual_total": row["actual_total"],
+                    "stored_sum": row["stored_sum"],
+                    "actual_sum": row["actual_sum"]
+                }
+                for row in result
+            ]
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
@@ -0,0 +1,197 @@
+from datetime import timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..utils.config import get_connection
+
+
+STATS_GRANULARITIES = ("day", "week", "month")
+# row yang di-commit oleh transaksi panjang bisa punya timestamp sebelum watermark,
+# jadi setiap refresh melihat ke belakang sedikit (hitung ulang bucket aman diulang)
+STATS_WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Tiap rollup: cari bucket yang tersentuh sejak :since, hapus, lalu hitung ulang dari sumber
+_ROLLUPS = {
+    "bookings": {
+        "touched": """
+            SELECT DISTINCT booking_time::date AS day
+            FROM bookings
+            WHERE updated_at > :since
+        """,
+        "delete": "DELETE FROM stats_bookings_daily WHERE day = ANY(:days)",
+        "insert": """
+            INSERT INTO stats_bookings_daily (day, status_booking, total)
+            SELECT d.day, b.status_booking, COUNT(*)
+            FROM unnest(CAST(:days AS date[])) AS d(day)
+            JOIN bookings b
+              ON b.booking_time >= d.day AND b.booking_time < d.day + 1 AND b.status = 1
+            GROUP BY d.day, b.status_booking
+        """,
+    },
+    # signup per hari dihitung dari created_at apa pun status user sekarang: menonaktifkan
+    # user tidak boleh mengubah angka pendaftaran historis
+    "users": {
+        "touched": """
+            SELECT DISTINCT created_at::date AS day
+            FROM users
+            WHERE created_at > :since OR updated_at > :since
+        """,
+        "delete": "DELETE FROM stats_users_daily WHERE day = ANY(:days)",
+        "insert": """
+            INSERT INTO stats_users_daily (day, role, total)
+            SELECT d.day, u.role, COUNT(*)
+            FROM unnest(CAST(:days AS date[])) AS d(day)
+            JOIN users u
+              ON u.created_at >= d.day AND u.created_at < d.day + 1
+            GROUP BY d.day, u.role
+        """,
+    },
+}
+
+
+def refresh_admin_stats(full=False):
+    """
+    Refresh rollup dashboard admin secara incremental berdasarkan watermark.
+    Biaya sebanding dengan jumlah row yang berubah, bukan total histori.
+    full=True menghitung ulang semua bucket. Return jumlah bucket per rollup.
+    """
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            # lock watermark: refresher paralel menunggu, bukan menghitung dobel
+            watermark = connection.execute(
+                text("""
+                    SELECT refreshed_at - CAST(:overlap AS interval) AS since, NOW()::timestamp AS started_at
+                    FROM stats_watermarks
+                    WHERE name = 'admin_stats'
+                    FOR UPDATE
+                """),
+                {"overlap": STATS_WATERMARK_OVERLAP}
+            ).mappings().fetchone()
+            since = "-infinity" if full else watermark["since"]
+
+            report = {}
+            for name, rollup in _ROLLUPS.items():
+                days = connection.execute(text(rollup["touched"]), {"since": since}).scalars().all()
+                if days:
+                    connection.execute(text(rollup["delete"]), {"days": days})
+                    connection.execute(text(rollup["insert"]), {"days": days})
+                report[name] = len(days)
+
+            # review per therapist per minggu, bucket = (week, therapist_id)
+            buckets = connection.execute(
+                text("""
+                    SELECT DISTINCT date_trunc('week', created_at)::date AS week, therapist_id
+                    FROM reviews
+                    WHERE created_at > :since OR updated_at > :since
+                """),
+                {"since": since}
+            ).mappings().all()
+            if buckets:
+                params = {
+                    "weeks": [row["week"] for row in buckets],
+                    "therapist_ids": [row["therapist_id"] for row in buckets],
+                }
+                connection.execute(
+                    text("""
+                        DELETE FROM stats_reviews_weekly s
+                        USING unnest(CAST(:weeks AS date[]), CAST(:therapist_ids AS integer[])) AS t(week, therapist_id)
+                        WHERE s.week = t.week AND s.therapist_id = t.therapist_id
+                    """),
+                    params
+                )
+                connection.execute(
+                    text("""
+                        INSERT INTO stats_reviews_weekly (week, therapist_id, total_reviews, rating_sum)
+                        SELECT t.week, t.therapist_id, COUNT(*), SUM(r.rating)
+                        FROM unnest(CAST(:weeks AS date[]), CAST(:therapist_ids AS integer[])) AS t(week, therapist_id)
+                        JOIN reviews r
+                          ON r.therapist_id = t.therapist_id AND r.status = 1
+                         AND r.created_at >= t.week AND r.created_at < t.week + 7
+                        GROUP BY t.week, t.therapist_id
+                    """),
+                    params
+                )
+            report["reviews"] = len(buckets)
+
+            connection.execute(
+                text("UPDATE stats_watermarks SET refreshed_at = :started_at WHERE name = 'admin_stats'"),
+                {"started_at": watermark["started_at"]}
+            )
+            return report
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def get_admin_stats(date_from, date_to, granularity="day"):
+    """
+    Baca rollup untuk window [date_from, date_to) per granularity (day/week/month).
+    Rollup review disimpan per minggu, jadi granularity day dibaca per minggu.
+    """
+    review_granularity = "week" if granularity == "day" else granularity
+    params = {"date_from": date_from, "date_to": date_to}
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            bookings = connection.execute(
+                text(f"""
+                    SELECT date_trunc('{granularity}', day)::date AS period, status_booking, SUM(total) AS total
+                    FROM stats_bookings_daily
+                    WHERE day >= :date_from AND day < :date_to
+                    GROUP BY 1, 2
+                    ORDER BY 1
+                """),
+                params
+            ).mappings().all()
+            users = connection.execute(
+                text(f"""
+                    SELECT date_trunc('{granularity}', day)::date AS period, role, SUM(total) AS total
+                    FROM stats_users_daily
+                    WHERE day >= :date_from AND day < :date_to
+                    GROUP BY 1, 2
+                    ORDER BY 1
+                """),
+                params
+            ).mappings().all()
+            reviews = connection.execute(
+                text(f"""
+                    SELECT
+                        date_trunc('{review_granularity}', s.week)::date AS period,
+                        s.therapist_id, u.name AS therapist_name,
+                        SUM(s.total_reviews) AS total_reviews,
+                        ROUND(SUM(s.rating_sum)::numeric / SUM(s.total_reviews), 2) AS average_rating
+                    FROM stats_reviews_weekly s
+                    JOIN users u ON u.id = s.therapist_id
+                    WHERE s.week >= date_trunc('week', CAST(:date_from AS timestamp))::date AND s.week < :date_to
+                    GROUP BY 1, 2, 3
+                    ORDER BY 1, 2
+                """),
+                params
+            ).mappings().all()
+
+            def bucketed(rows, key):
+                periods = {}
+                for row in rows:
+                    bucket = periods.setdefault(str(row["period"]), {"period": str(row["period"]), "total": 0, "counts": {}})
+                    bucket["counts"][row[key]] = int(row["total"])
+                    bucket["total"] += int(row["total"])
+                return list(periods.values())
+
+            return {
+                "granularity": granularity,
+                "bookings": bucketed(bookings, "status_booking"),
+                "new_users": bucketed(users, "role"),
+                "reviews": [
+                    {
+                        "period": str(row["period"]),
+                        "therapist_id": row["therapist_id"],
+                        "therapist_name": row["therapist_name"],
+                        "total_reviews": int(row["total_reviews"]),
+                        "average_rating": float(row["average_rating"])
+                    }
+                    for row in reviews
+                ],
+            }
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
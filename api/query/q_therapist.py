@@ -1,59 +1,222 @@
+from datetime import datetime, timedelta
 from flask import json
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import generate_password_hash
 
+from ..utils.cache import TTLCache
 from ..utils.config import get_connection
+from ..utils.helper import (
+    clamp_limit, decode_cursor, encode_cursor, float_or_none, format_row, make_etag, select_columns, str_or_none
+)
+from ..utils.schedule import (
+    DEFAULT_SESSION_MINUTES, MAX_SESSION_MINUTES, SLOT_MINUTES, align_up, clear_range, compile_working_hours,
+    free_windows, slot_offset, slot_offset_ceil, window_mask
+)
 
 
-def get_therapists(status_therapist=None):
+THERAPIST_STATUSES = ("available", "busy", "off")
+BULK_STATUS_MAX = 500
+
+TOP_THERAPIST_DEFAULT = 10
+# bobot prior minimal (jumlah "review virtual") supaya therapist dengan sedikit review tidak langsung di puncak
+LEADERBOARD_MIN_WEIGHT = 5
+
+THERAPIST_PAGE_DEFAULT = 20
+THERAPIST_PAGE_MAX = 100
+
+# Allow-list fields= untuk list therapist: nama field -> (ekspresi SQL, formatter)
+THERAPIST_LIST_COLUMNS = {
+    "id_therapist": ("tp.id", None),
+    "user_id": ("tp.user_id", None),
+    "name": ("u.name", None),
+    "email": ("u.email", None),
+    "phone": ("u.phone", None),
+    "bio": ("tp.bio", None),
+    "experience_years": ("tp.experience_years", None),
+    "specialization": ("tp.specialization", None),
+    "average_rating": ("tp.average_rating", float_or_none),
+    "total_reviews": ("tp.total_reviews", None),
+    "status_therapist": ("tp.status_therapist", None),
+    "working_hours": ("tp.working_hours", None),
+    "created_at": ("tp.created_at", str),
+    "updated_at": ("tp.updated_at", str_or_none),
+}
+THERAPIST_LIST_PRESETS = {
+    "lean": ["id_therapist", "user_id", "name", "specialization", "average_rating", "total_reviews", "status_therapist"],
+}
+
+# Cache daftar therapist per worker, key = (status_therapist, limit, cursor, fields).
+# Semua fungsi yang mengubah data therapist wajib invalidate lewat @therapist_cache.invalidates
+therapist_cache = TTLCache(maxsize=256, ttl=60)
+# Bitmap jam kerja hasil compile, key = (id profile, updated_at) jadi otomatis basi saat profil diupdate
+working_hours_cache = TTLCache(maxsize=4096, ttl=3600)
+
+
+def get_therapists(status_therapist=None, limit=None, cursor=None, fields=None):
+    fields = fields or list(THERAPIST_LIST_COLUMNS)
+    limit = clamp_limit(limit, THERAPIST_PAGE_DEFAULT, THERAPIST_PAGE_MAX)
+    params = {"limit": limit + 1}
+    if cursor:
+        # cursor = (average_rating, created_at, id) dari baris terakhir halaman sebelumnya
+        cursor_rating, cursor_created, cursor_id = decode_cursor(cursor, 3)
+        try:
+            params["cursor_rating"] = str(cursor_rating)
+            params["cursor_created"] = datetime.fromisoformat(cursor_created)
+            params["cursor_id"] = int(cursor_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+    cache_key = (status_therapist, limit, cursor, tuple(fields))
+    cached = therapist_cache.get(cache_key)
+    if cached is not None:
+        return cached
     engine = get_connection()
     try:
         with engine.connect() as connection:
-            query = """
+            # hanya kolom yang diminta + kolom urutan untuk cursor
+            query = f"""
                 SELECT 
-                    tp.id, tp.user_id, u.name, u.email, u.phone,
-                    tp.bio, tp.experience_years, tp.specialization,
-                    tp.average_rating, tp.total_reviews,
-                    tp.status_therapist, tp.working_hours,
-                    tp.created_at, tp.updated_at
+                    {select_columns(fields, THERAPIST_LIST_COLUMNS)},
+                    COALESCE(tp.average_rating, 0) AS sort_rating,
+                    tp.created_at AS sort_created, tp.id AS sort_id
                 FROM therapist_profiles tp
                 JOIN users u ON tp.user_id = u.id
                 WHERE tp.status = 1 AND u.status = 1
             """
-            params = {}
             # filter opsional
             if status_therapist:
                 query += " AND tp.status_therapist = :status_therapist"
                 params["status_therapist"] = status_therapist
+            # keyset: lanjut tepat setelah baris terakhir, tanpa OFFSET
+            if cursor:
+                query += """
+                    AND (COALESCE(tp.average_rating, 0), tp.created_at, tp.id)
+                        < (CAST(:cursor_rating AS numeric), :cursor_created, :cursor_id)
+                """
 
-            query += " ORDER BY tp.average_rating DESC NULLS LAST, tp.created_at DESC"
+            query += """
+                ORDER BY COALESCE(tp.average_rating, 0) DESC, tp.created_at DESC, tp.id DESC
+                LIMIT :limit
+            """
 
             result = connection.execute(text(query), params).mappings().all()
 
-            return [
-                {
-                    "id_therapist": row["id"],
-                    "user_id": row["user_id"],
-                    "name": row["name"],
-                    "email": row["email"],
-                    "phone": row["phone"],
-                    "bio": row["bio"],
-                    "experience_years": row["experience_years"],
-                    "specialization": row["specialization"],
-                    "average_rating": float(row["average_rating"]) if row["average_rating"] else None,
-                    "total_reviews": row["total_reviews"],
-                    "status_therapist": row["status_therapist"],
-                    "working_hours": row["working_hours"],
-                    "created_at": str(row["created_at"]),
-                    "updated_at": str(row["updated_at"]) if row["updated_at"] else None
-                }
-                for row in result
+            # ambil limit + 1 baris untuk tahu apakah masih ada halaman berikutnya
+            next_cursor = None
+            if len(result) > limit:
+                result = result[:limit]
+                last = result[-1]
+                next_cursor = encode_cursor(last["sort_rating"], last["sort_created"], last["sort_id"])
+
+            therapists = [format_row(row, fields, THERAPIST_LIST_COLUMNS) for row in result]
+            therapist_cache.set(cache_key, (therapists, next_cursor))
+            return therapists, next_cursor
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return [], None
+
+def search_therapists(q=None, specialization=None, min_rating=None, min_experience_years=None,
+                      status_therapist=None, limit=None, cursor=None, fields=None):
+    """
+    Mode search: full-text (GIN search_vector) + filter, hasil di-rank dan
+    facet count per specialization & status_therapist dihitung dalam satu query.
+    """
+    fields = fields or list(THERAPIST_LIST_COLUMNS)
+    limit = clamp_limit(limit, THERAPIST_PAGE_DEFAULT, THERAPIST_PAGE_MAX)
+    params = {"limit": limit + 1}
+    filters = ["tp.status = 1", "u.status = 1"]
+    if q:
+        rank = "ts_rank_cd(tp.search_vector, websearch_to_tsquery('simple', :q))::float8"
+        filters.append("tp.search_vector @@ websearch_to_tsquery('simple', :q)")
+        params["q"] = q
+    else:
+        # tanpa kata kunci, rank = rating supaya urutan sama dengan list biasa
+        rank = "COALESCE(tp.average_rating, 0)::float8"
+    if specialization:
+        filters.append("lower(tp.specialization) = lower(:specialization)")
+        params["specialization"] = specialization
+    if min_rating is not None:
+        filters.append("COALESCE(tp.average_rating, 0) >= :min_rating")
+        params["min_rating"] = min_rating
+    if min_experience_years is not None:
+        filters.append("tp.experience_years >= :min_experience_years")
+        params["min_experience_years"] = min_experience_years
+    if status_therapist:
+        filters.append("tp.status_therapist = :status_therapist")
+        params["status_therapist"] = status_therapist
+    page_filter = ""
+    if cursor:
+        cursor_rank, cursor_id = decode_cursor(cursor, 2)
+        try:
+            params["cursor_rank"] = float(cursor_rank)
+            params["cursor_id"] = int(cursor_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        page_filter = "WHERE (rank, sort_id) < (:cursor_rank, :cursor_id)"
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            query = f"""
+                WITH matched AS (
+                    SELECT
+                        {select_columns(fields, THERAPIST_LIST_COLUMNS)},
+                        tp.id AS sort_id,
+                        tp.specialization AS facet_specialization,
+                        tp.status_therapist AS facet_status,
+                        {rank} AS rank
+                    FROM therapist_profiles tp
+                    JOIN users u ON tp.user_id = u.id
+                    WHERE {" AND ".join(filters)}
+                ),
+                page AS (
+                    SELECT * FROM matched
+                    {page_filter}
+                    ORDER BY rank DESC, sort_id DESC
+                    LIMIT :limit
+                ),
+                facets AS (
+                    SELECT json_build_object(
+                        'total', (SELECT COUNT(*) FROM matched),
+                        'specialization', (
+                            SELECT COALESCE(json_object_agg(key, total), CAST('{{}}' AS json))
+                            FROM (
+                                SELECT COALESCE(facet_specialization, '') AS key, COUNT(*) AS total
+                                FROM matched GROUP BY 1
+                            ) s
+                        ),
+                        'status_therapist', (
+                            SELECT COALESCE(json_object_agg(key, total), CAST('{{}}' AS json))
+                            FROM (
+                                SELECT COALESCE(facet_status, '') AS key, COUNT(*) AS total
+                                FROM matched GROUP BY 1
+                            ) s
+                        )
+                    ) AS facets
+                )
+                SELECT page.*, facets.facets
+                FROM facets
+                LEFT JOIN page ON TRUE
+                ORDER BY page.rank DESC, page.sort_id DESC
+            """
+            result = connection.execute(text(query), params).mappings().all()
+
+            facets = result[0]["facets"] if result else {}
+            rows = [row for row in result if row["sort_id"] is not None]
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1]["rank"], rows[-1]["sort_id"])
+
+            therapists = [
+                {**format_row(row, fields, THERAPIST_LIST_COLUMNS), "rank": row["rank"]}
+                for row in rows
             ]
+            return therapists, next_cursor, facets
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
-        return []
+        return [], None, {}
 
+@therapist_cache.invalidates
 def add_therapist(payload):
     engine = get_connection()
     try:
@@ -74,12 +237,13 @@ def add_therapist(payload):
             ).mappings().fetchone()
             if not user_result:
                 return None
-            # Insert ke therapist_profiles
+            # Insert ke therapist_profiles, rank_score awal = prior (tanpa review, Bayesian average = mean_rating)
             profile_result = connection.execute(
                 text("""
                     INSERT INTO therapist_profiles
-                    (user_id, bio, experience_years, specialization, status_therapist, average_rating, total_reviews, status, created_at, updated_at)
-                    VALUES (:user_id, :bio, :experience_years, :specialization, :status_therapist, 0.0, 0, 1, NOW(), NOW())
+                    (user_id, bio, experience_years, specialization, status_therapist, average_rating, total_reviews, rank_score, status, created_at, updated_at)
+                    VALUES (:user_id, :bio, :experience_years, :specialization, :status_therapist, 0.0, 0,
+                            COALESCE((SELECT mean_rating FROM leaderboard_prior WHERE id = 1), 0), 1, NOW(), NOW())
                     RETURNING id, bio, experience_years, specialization, status_therapist, average_rating, total_reviews, created_at, updated_at;
                 """),
                 {
@@ -158,6 +322,31 @@ def get_therapist_by_id(id_therapist):
         print(f"Error occurred: {str(e)}")
         return None
 
+def get_therapist_version(id_therapist):
+    """
+    Lookup ringan untuk ETag detail therapist: hanya id & updated_at, tanpa build dict
+    """
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            result = connection.execute(
+                text("""
+                    SELECT tp.id, tp.updated_at, u.updated_at AS user_updated
+                    FROM users u
+                    JOIN therapist_profiles tp ON u.id = tp.user_id AND tp.status = 1
+                    WHERE u.id = :id_therapist AND u.role = 'therapist' AND u.status = 1
+                    LIMIT 1;
+                """),
+                {"id_therapist": id_therapist}
+            ).mappings().fetchone()
+            if not result:
+                return None
+            return make_etag("therapist", result["id"], result["updated_at"], result["user_updated"])
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+@therapist_cache.invalidates
 def update_therapist_by_id(id_therapist, payload):
     engine = get_connection()
     try:
@@ -223,6 +412,7 @@ def update_therapist_by_id(id_therapist, payload):
         print(f"Error occurred: {str(e)}")
         return None
     
+@therapist_cache.invalidates
 def soft_delete_therapist_by_id(id_therapist):
     engine = get_connection()
     try:
@@ -279,6 +469,7 @@ def soft_delete_therapist_by_id(id_therapist):
         print(f"Error occurred: {str(e)}")
         return None
 
+@therapist_cache.invalidates
 def update_therapist_status(id_therapist, status_therapist):
     engine = get_connection()
     try:
@@ -313,3 +504,216 @@ def update_therapist_status(id_therapist, status_therapist):
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
         return None
+
+@therapist_cache.invalidates
+def bulk_update_therapist_status(items):
+    """
+    Update status banyak therapist dalam satu statement UPDATE ... FROM (VALUES ...).
+    items = list (id_therapist, status_therapist) tanpa id duplikat.
+    Return dict id_therapist -> row yang berhasil diupdate.
+    """
+    values = []
+    params = {}
+    for index, (id_therapist, status_therapist) in enumerate(items):
+        values.append(f"(CAST(:id_{index} AS integer), :status_{index})")
+        params[f"id_{index}"] = id_therapist
+        params[f"status_{index}"] = status_therapist
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            result = connection.execute(
+                text(f"""
+                    UPDATE therapist_profiles tp
+                    SET status_therapist = v.status_therapist, updated_at = NOW()
+                    FROM (VALUES {", ".join(values)}) AS v(id_therapist, status_therapist)
+                    WHERE tp.user_id = v.id_therapist AND tp.status = 1
+                    RETURNING tp.id, tp.user_id, tp.status_therapist, tp.updated_at;
+                """),
+                params
+            ).mappings().all()
+            return {
+                row["user_id"]: {
+                    "id_profile": row["id"],
+                    "status_therapist": row["status_therapist"],
+                    "updated_at": str(row["updated_at"])
+                }
+                for row in result
+            }
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def get_top_therapists(limit=None):
+    limit = clamp_limit(limit, TOP_THERAPIST_DEFAULT, THERAPIST_PAGE_MAX)
+    cache_key = ("top", limit)
+    cached = therapist_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            result = connection.execute(
+                text("""
+                    SELECT tp.id, tp.user_id, u.name, tp.specialization,
+                           tp.average_rating, tp.total_reviews, tp.status_therapist, tp.rank_score
+                    FROM therapist_profiles tp
+                    JOIN users u ON tp.user_id = u.id
+                    WHERE tp.status = 1 AND u.status = 1
+                    ORDER BY tp.rank_score DESC, tp.id DESC
+                    LIMIT :limit
+                """),
+                {"limit": limit}
+            ).mappings().all()
+            therapists = [
+                {
+                    "rank": index + 1,
+                    "id_therapist": row["id"],
+                    "user_id": row["user_id"],
+                    "name": row["name"],
+                    "specialization": row["specialization"],
+                    "average_rating": float(row["average_rating"]) if row["average_rating"] else None,
+                    "total_reviews": row["total_reviews"],
+                    "status_therapist": row["status_therapist"],
+                    "score": round(row["rank_score"], 4)
+                }
+                for index, row in enumerate(result)
+            ]
+            therapist_cache.set(cache_key, therapists)
+            return therapists
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+@therapist_cache.invalidates
+def refresh_leaderboard():
+    """
+    Full refresh leaderboard: hitung prior global lalu rank_score semua therapist
+    dalam satu statement. Dijalankan terjadwal lewat CLI refresh-leaderboard.
+    """
+    engine = get_connection()
+    try:
+        with engine.begin() as connection:
+            result = connection.execute(
+                text("""
+                    WITH stats AS (
+                        SELECT
+                            COALESCE(
+                                CAST(SUM(rating_sum) AS numeric) / NULLIF(SUM(total_reviews), 0), 0
+                            )::float8 AS mean_rating,
+                            GREATEST(
+                                COALESCE(AVG(total_reviews) FILTER (WHERE total_reviews > 0), 0), :min_weight
+                            )::float8 AS weight
+                        FROM therapist_profiles
+                        WHERE status = 1
+                    ),
+                    prior AS (
+                        UPDATE leaderboard_prior lp
+                        SET mean_rating = stats.mean_rating, weight = stats.weight, refreshed_at = NOW()
+                        FROM stats
+                        WHERE lp.id = 1
+                        RETURNING lp.mean_rating, lp.weight
+                    ),
+                    scored AS (
+                        UPDATE therapist_profiles tp
+                        SET rank_score = (p.weight * p.mean_rating + tp.rating_sum) / (p.weight + tp.total_reviews)
+                        FROM prior p
+                        WHERE tp.status = 1
+                          AND tp.rank_score IS DISTINCT FROM
+                              (p.weight * p.mean_rating + tp.rating_sum) / (p.weight + tp.total_reviews)
+                        RETURNING tp.id
+                    )
+                    SELECT p.mean_rating, p.weight, (SELECT COUNT(*) FROM scored) AS updated
+                    FROM prior p
+                """),
+                {"min_weight": LEADERBOARD_MIN_WEIGHT}
+            ).mappings().fetchone()
+            if not result:
+                return None
+            return {
+                "mean_rating": result["mean_rating"],
+                "weight": result["weight"],
+                "updated": result["updated"]
+            }
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+def get_available_therapists(start, end, duration_minutes):
+    """
+    Therapist yang punya slot kosong minimal `duration_minutes` di window [start, end).
+    Window maksimal satu minggu (dicek di resource).
+    """
+    window_start = align_up(start)
+    slots = slot_offset(end, window_start)
+    length = -(-duration_minutes // SLOT_MINUTES)
+    if slots < length:
+        return []
+    engine = get_connection()
+    try:
+        with engine.connect() as connection:
+            therapists = connection.execute(
+                text("""
+                    SELECT tp.id, tp.user_id, u.name, tp.specialization,
+                           tp.average_rating, tp.status_therapist,
+                           tp.working_hours, tp.updated_at
+                    FROM therapist_profiles tp
+                    JOIN users u ON tp.user_id = u.id
+                    WHERE tp.status = 1 AND u.status = 1
+                      AND tp.working_hours IS NOT NULL
+                    ORDER BY COALESCE(tp.average_rating, 0) DESC, tp.id DESC
+                """)
+            ).mappings().all()
+            # satu range query untuk semua booking aktif yang mungkin overlap dengan window
+            bookings = connection.execute(
+                text("""
+                    SELECT therapist_id, booking_time, duration_minutes
+                    FROM bookings
+                    WHERE status = 1
+                      AND status_booking IN ('pending', 'accepted')
+                      AND booking_time >= :lookback AND booking_time < :end
+                """),
+                {
+                    "lookback": window_start - timedelta(minutes=MAX_SESSION_MINUTES),
+                    "end": end
+                }
+            ).mappings().all()
+    except SQLAlchemyError as e:
+        print(f"Error occurred: {str(e)}")
+        return None
+
+    busy = {}
+    for row in bookings:
+        booking_end = row["booking_time"] + timedelta(minutes=row["duration_minutes"] or DEFAULT_SESSION_MINUTES)
+        first = max(slot_offset(row["booking_time"], window_start), 0)
+        last = min(slot_offset_ceil(booking_end, window_start), slots)
+        busy.setdefault(row["therapist_id"], []).append((first, last))
+
+    available = []
+    for row in therapists:
+        cache_key = (row["id"], row["updated_at"])
+        weekly = working_hours_cache.get(cache_key)
+        if weekly is None:
+            weekly = compile_working_hours(row["working_hours"])
+            working_hours_cache.set(cache_key, weekly)
+        mask = window_mask(weekly, window_start, slots)
+        for first, last in busy.get(row["user_id"], []):
+            mask = clear_range(mask, first, last)
+        windows = free_windows(mask, length)
+        if not windows:
+            continue
+        available.append({
+            "id_therapist": row["id"],
+            "user_id": row["user_id"],
+            "name": row["name"],
+            "specialization": row["specialization"],
+            "average_rating": float(row["average_rating"]) if row["average_rating"] else None,
+            "status_therapist": row["status_therapist"],
+            "free_windows": [
+                {
+                    "start": str(window_start + timedelta(minutes=first * SLOT_MINUTES)),
+                    "end": str(window_start + timedelta(minutes=last * SLOT_MINUTES))
+                }
+                for first, last in windows
+            ]
+        })
+    return available
@@ -3,31 +3,38 @@ from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import generate_password_hash
 
 from ..utils.config import get_connection
+from ..utils.helper import format_row, select_columns
+from .q_therapist import therapist_cache
 
-def get_all_users():
+# Allow-list fields= untuk list user: nama field -> (ekspresi SQL, formatter)
+USER_LIST_COLUMNS = {
+    "id_user": ("id", None),
+    "name": ("name", None),
+    "email": ("email", None),
+    "phone": ("phone", None),
+    "role": ("role", None),
+    "status": ("status", None),
+    "created_at": ("created_at", str),
+}
+USER_LIST_PRESETS = {
+    "lean": ["id_user", "name"],
+}
+
+
+def get_all_users(fields=None):
+    fields = fields or list(USER_LIST_COLUMNS)
     engine = get_connection()
     try:
         with engine.connect() as connection:
             results = connection.execute(
-                text("""
-                    SELECT id, name, email, phone, role, status, created_at
+                text(f"""
+                    SELECT {select_columns(fields, USER_LIST_COLUMNS)}
                     FROM users
                     WHERE role = 'user' AND status = 1
                     ORDER BY created_at DESC;
                 """)
             ).mappings().fetchall()
-            users = []
-            for row in results:
-                users.append({
-                    "id_user": row["id"],
-                    "name": row["name"],
-                    "email": row["email"],
-                    "phone": row["phone"],
-                    "role": row["role"],
-                    "status": row["status"],
-                    "created_at": str(row["created_at"])
-                })
-            return users
+            return [format_row(row, fields, USER_LIST_COLUMNS) for row in results]
     except SQLAlchemyError as e:
         print(f"Error occurred: {str(e)}")
         return None
@@ -94,6 +101,7 @@ def get_user_by_id(id_user):
         print(f"Error occurred: {str(e)}")
         return None
 
+@therapist_cache.invalidates
 def update_user_by_id(id_user, payload):
     engine = get_connection()
     try:
@@ -123,7 +131,7 @@ def update_user_by_id(id_user, payload):
                     return None  # tidak ada data untuk update
                 query = f"""
                     UPDATE users
-                    SET {", ".join(fields)}
+                    SET {", ".join(fields)}, updated_at = NOW()
                     WHERE id = :id_user
                     RETURNING id, name, email, phone, role, status, created_at;
                 """
@@ -143,6 +151,7 @@ def update_user_by_id(id_user, payload):
         print(f"Error occurred: {str(e)}")
         return None
     
+@therapist_cache.invalidates
 def soft_delete_user_by_id(id_user):
     engine = get_connection()
     try:
@@ -151,7 +160,7 @@ def soft_delete_user_by_id(id_user):
                 result = connection.execute(
                     text("""
                         UPDATE users
-                        SET status = 0
+                        SET status = 0, updated_at = NOW()
                         WHERE id = :id_user AND status = 1
                         RETURNING id, name, email, phone, role, status, created_at;
                     """),
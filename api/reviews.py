@@ -4,22 +4,58 @@ from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from sqlalchemy.exc import SQLAlchemyError
 
 from .utils.response import success_response, error_response
-from .query.q_reviews import create_review, get_review_by_id, get_reviews_by_therapist
+from .query.q_reviews import create_review, get_review_by_id, get_reviews_by_therapist, insert_review
+from .query.q_idempotency import idempotent_response
+from .query.q_therapist import therapist_cache
 
 reviews_ns = Namespace('reviews', description='Endpoint untuk manajemen review')
 
+review_list_parser = reviews_ns.parser()
+review_list_parser.add_argument(
+    "limit", type=int, required=False, location="args",
+    help="Jumlah review per halaman (default 20, maks 100)"
+)
+review_list_parser.add_argument(
+    "cursor", type=str, required=False, location="args",
+    help="Cursor halaman berikutnya (ambil dari meta.next_cursor)"
+)
+
 review_model = reviews_ns.model('CreateReview', {
     "booking_id": fields.Integer(required=True, description="ID Booking yang akan direview"),
     "rating": fields.Integer(required=True, description="Rating (1-5)"),
     "comment": fields.String(required=False, description="Komentar tambahan")
 })
 
+def review_page_response(therapist_id):
+    args = review_list_parser.parse_args()
+    try:
+        page = get_reviews_by_therapist(therapist_id, limit=args.get("limit"), cursor=args.get("cursor"))
+        if page is None:
+            return error_response("Failed to fetch reviews", 500)
+        reviews, next_cursor, summary = page
+        meta = {"next_cursor": next_cursor, "summary": summary}
+        if not reviews:
+            return success_response("No reviews found", [], 200, meta=meta)
+        return success_response("Reviews retrieved successfully", reviews, 200, meta=meta)
+    except ValueError:
+        return error_response("Invalid cursor", 400)
+    except SQLAlchemyError as e:
+        reviews_ns.logger.error(f"Database error: {str(e)}")
+        return error_response("Internal server error", 500)
+
+
+def review_created_response(new_review):
+    if not new_review:
+        return error_response("Booking not found, not completed, or already reviewed", 400)
+    return success_response("Review created successfully", new_review, 201)
+
+
 @reviews_ns.route('')
 class ReviewCreateResource(Resource):
     @jwt_required()
     @reviews_ns.expect(review_model)
     def post(self):
-        """User buat review untuk booking yang sudah completed"""
+        """User buat review untuk booking yang sudah completed, mendukung header Idempotency-Key"""
         claims = get_jwt()
         user_id = get_jwt_identity()
         role = claims.get("role")
@@ -42,10 +78,16 @@ class ReviewCreateResource(Resource):
             return error_response("Rating must be between 1 and 5", 400)
 
         try:
-            new_review = create_review(user_id, booking_id, rating, comment)
-            if not new_review:
-                return error_response("Booking not found, not completed, or already reviewed", 400)
-            return success_response("Review created successfully", new_review, 201)
+            key = request.headers.get("Idempotency-Key")
+            if key:
+                return idempotent_response(
+                    user_id, "POST /reviews", key, payload,
+                    lambda connection: review_created_response(
+                        insert_review(connection, user_id, booking_id, rating, comment)
+                    ),
+                    after_commit=therapist_cache.clear
+                )
+            return review_created_response(create_review(user_id, booking_id, rating, comment))
         except SQLAlchemyError as e:
             reviews_ns.logger.error(f"Database error: {str(e)}")
             return error_response("Internal server error", 500)
@@ -54,32 +96,19 @@ class ReviewCreateResource(Resource):
 @reviews_ns.route('/therapist/<int:therapist_id>')
 class ReviewListByTherapistResource(Resource):
     @jwt_required()
+    @reviews_ns.expect(review_list_parser)
     def get(self, therapist_id):
-        """List review untuk terapis tertentu"""
-        try:
-            reviews = get_reviews_by_therapist(therapist_id)
-            if not reviews:
-                return success_response("No reviews found", [], 200)
-            return success_response("Reviews retrieved successfully", reviews, 200)
-        except SQLAlchemyError as e:
-            reviews_ns.logger.error(f"Database error: {str(e)}")
-            return error_response("Internal server error", 500)
+        """List review untuk terapis tertentu (per halaman + ringkasan rating)"""
+        return review_page_response(therapist_id)
 
 
 @reviews_ns.route('/me')
 class MyDetailResource(Resource):
     @jwt_required()
+    @reviews_ns.expect(review_list_parser)
     def get(self):
-        """Detail profil therapist by ID (admin & user)"""
-        id_therapist = get_jwt_identity()
-        try:
-            reviews = get_reviews_by_therapist(id_therapist)
-            if not reviews:
-                return success_response("No reviews found", [], 200)
-            return success_response("Reviews retrieved successfully", reviews, 200)
-        except SQLAlchemyError as e:
-            reviews_ns.logger.error(f"Database error: {str(e)}")
-            return error_response("Internal server error", 500)
+        """List review milik therapist yang sedang login (per halaman + ringkasan rating)"""
+        return review_page_response(get_jwt_identity())
         
 
 @reviews_ns.route('/<int:id_review>')
@@ -1,10 +1,13 @@
+from datetime import timedelta
 from flask import request
 from flask_restx import Namespace, Resource, fields, reqparse
 from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from sqlalchemy.exc import SQLAlchemyError
 
-from .utils.response import success_response, error_response
-from .query.q_therapist import add_therapist, get_therapist_by_id, get_therapists, soft_delete_therapist_by_id, update_therapist_by_id, update_therapist_status
+from .utils.helper import parse_datetime, parse_fields
+from .utils.response import etag_headers, is_not_modified, not_modified_response, success_response, error_response
+from .query.q_bookings import get_agenda_version, get_therapist_agenda
+from .query.q_therapist import BULK_STATUS_MAX, THERAPIST_LIST_COLUMNS, THERAPIST_LIST_PRESETS, THERAPIST_STATUSES, add_therapist, bulk_update_therapist_status, get_available_therapists, get_therapist_by_id, get_therapist_version, get_therapists, get_top_therapists, search_therapists, soft_delete_therapist_by_id, therapist_cache, update_therapist_by_id, update_therapist_status
 
 therapists_ns = Namespace('therapists', description='Endpoint untuk manajemen therapist')
 
@@ -16,6 +19,79 @@ therapist_parser.add_argument(
     required=False,
     help="Filter therapist by status (contoh: available, busy, off)"
 )
+therapist_parser.add_argument(
+    'limit',
+    type=int,
+    required=False,
+    help="Jumlah therapist per halaman (default 20, maks 100)"
+)
+therapist_parser.add_argument(
+    'cursor',
+    type=str,
+    required=False,
+    help="Cursor halaman berikutnya (ambil dari meta.next_cursor)"
+)
+therapist_parser.add_argument(
+    'fields',
+    type=str,
+    required=False,
+    help="Field yang dikembalikan, pisahkan dengan koma (atau preset 'lean')"
+)
+# Parameter mode search, jika salah satu diisi maka hasil di-rank dan ada facet count
+therapist_parser.add_argument(
+    'q',
+    type=str,
+    required=False,
+    help="Kata kunci pencarian (nama, bio, spesialisasi)"
+)
+therapist_parser.add_argument(
+    'specialization',
+    type=str,
+    required=False,
+    help="Filter spesialisasi (tidak case sensitive)"
+)
+therapist_parser.add_argument(
+    'min_rating',
+    type=float,
+    required=False,
+    help="Rating minimal"
+)
+therapist_parser.add_argument(
+    'min_experience_years',
+    type=int,
+    required=False,
+    help="Pengalaman minimal (tahun)"
+)
+
+availability_parser = reqparse.RequestParser()
+availability_parser.add_argument(
+    'from', type=parse_datetime, required=True, location='args',
+    help="Awal window pencarian (YYYY-MM-DDTHH:MM)"
+)
+availability_parser.add_argument(
+    'to', type=parse_datetime, required=True, location='args',
+    help="Akhir window pencarian (YYYY-MM-DDTHH:MM), maksimal 7 hari dari 'from'"
+)
+availability_parser.add_argument(
+    'duration', type=int, required=False, default=60, location='args',
+    help="Durasi sesi dalam menit (default 60)"
+)
+
+agenda_parser = reqparse.RequestParser()
+agenda_parser.add_argument(
+    'from', type=parse_datetime, required=True, location='args',
+    help="Awal agenda (YYYY-MM-DD atau YYYY-MM-DDTHH:MM)"
+)
+agenda_parser.add_argument(
+    'to', type=parse_datetime, required=True, location='args',
+    help="Akhir agenda (eksklusif), maksimal 31 hari dari 'from'"
+)
+
+top_parser = reqparse.RequestParser()
+top_parser.add_argument(
+    'limit', type=int, required=False, location='args',
+    help="Jumlah therapist teratas (default 10, maks 100)"
+)
 
 
 therapist_model = therapists_ns.model('Therapist', {
@@ -48,17 +124,59 @@ therapist_status_model = therapists_ns.model('UpdateTherapistStatus', {
         enum=['available', 'busy', 'off']
     )
 })
+bulk_therapist_status_item_model = therapists_ns.model('BulkTherapistStatusItem', {
+    "id_therapist": fields.Integer(required=True, description="ID user therapist"),
+    "status_therapist": fields.String(
+        required=True,
+        description="Status therapist",
+        enum=['available', 'busy', 'off']
+    )
+})
+
+bulk_therapist_status_model = therapists_ns.model('BulkUpdateTherapistStatus', {
+    "items": fields.List(fields.Nested(bulk_therapist_status_item_model), required=True)
+})
 
 @therapists_ns.route('')
 class TherapistResource(Resource):
     @therapists_ns.expect(therapist_parser)
     @jwt_required()
     def get(self):
-        """List semua therapist (opsional filter by status_therapist)"""
+        """List therapist per halaman (opsional filter by status_therapist, atau mode search)"""
         args = therapist_parser.parse_args()
         try:
-            therapists = get_therapists(status_therapist=args.get("status_therapist"))
-            return success_response("Therapists fetched successfully", therapists, 200)
+            fields = parse_fields(args.get("fields"), THERAPIST_LIST_COLUMNS, THERAPIST_LIST_PRESETS)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        search_mode = any(
+            args.get(key) is not None
+            for key in ("q", "specialization", "min_rating", "min_experience_years")
+        )
+        try:
+            if search_mode:
+                therapists, next_cursor, facets = search_therapists(
+                    q=args.get("q"),
+                    specialization=args.get("specialization"),
+                    min_rating=args.get("min_rating"),
+                    min_experience_years=args.get("min_experience_years"),
+                    status_therapist=args.get("status_therapist"),
+                    limit=args.get("limit"),
+                    cursor=args.get("cursor"),
+                    fields=fields
+                )
+                return success_response(
+                    "Therapists fetched successfully", therapists, 200,
+                    meta={"next_cursor": next_cursor, "facets": facets}
+                )
+            therapists, next_cursor = get_therapists(
+                status_therapist=args.get("status_therapist"),
+                limit=args.get("limit"),
+                cursor=args.get("cursor"),
+                fields=fields
+            )
+            return success_response("Therapists fetched successfully", therapists, 200, meta={"next_cursor": next_cursor})
+        except ValueError:
+            return error_response("Invalid cursor", 400)
         except SQLAlchemyError as e:
             therapists_ns.logger.error(f"Database error: {str(e)}")
             return error_response("Internal server error", 500)
@@ -81,17 +199,134 @@ class TherapistResource(Resource):
             return error_response("Internal server error", 500)
         
         
+@therapists_ns.route('/status')
+class TherapistBulkStatusResource(Resource):
+    @jwt_required()
+    @therapists_ns.expect(bulk_therapist_status_model)
+    def put(self):
+        """Update status banyak therapist sekaligus (admin only)"""
+        claims = get_jwt()
+        if claims.get("role") != "admin":
+            return error_response("Forbidden: only admin can bulk update status", 403)
+
+        payload = request.get_json()
+        items = payload.get("items") if isinstance(payload, dict) else None
+        if not items or not isinstance(items, list):
+            return error_response("items is required", 400)
+        if len(items) > BULK_STATUS_MAX:
+            return error_response(f"Maximum {BULK_STATUS_MAX} items per request", 400)
+
+        # validasi per item, id yang sama dipakai item terakhir (berdasarkan posisi di list)
+        results = []
+        changes = {}
+        last_index = {}
+        for item in items:
+            id_therapist = item.get("id_therapist") if isinstance(item, dict) else None
+            status_therapist = item.get("status_therapist") if isinstance(item, dict) else None
+            # bool adalah subclass int di Python, true/false bukan id yang valid
+            if (
+                isinstance(id_therapist, bool) or not isinstance(id_therapist, int)
+                or status_therapist not in THERAPIST_STATUSES
+            ):
+                results.append({"id_therapist": id_therapist, "status_therapist": status_therapist, "result": "invalid"})
+                continue
+            changes[id_therapist] = status_therapist
+            last_index[id_therapist] = len(results)
+            results.append({"id_therapist": id_therapist, "status_therapist": status_therapist})
+
+        try:
+            updated = bulk_update_therapist_status(list(changes.items())) if changes else {}
+            if updated is None:
+                return error_response("Failed to update therapist status", 500)
+            for index, result in enumerate(results):
+                if "result" in result:
+                    continue
+                if last_index[result["id_therapist"]] != index:
+                    result["result"] = "superseded"
+                elif result["id_therapist"] in updated:
+                    result["result"] = "updated"
+                    result["updated_at"] = updated[result["id_therapist"]]["updated_at"]
+                else:
+                    result["result"] = "not_found"
+            return success_response(
+                "Therapist status bulk update finished",
+                {"updated": len(updated), "items": results},
+                200
+            )
+        except SQLAlchemyError as e:
+            therapists_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+@therapists_ns.route('/top')
+class TherapistTopResource(Resource):
+    @therapists_ns.expect(top_parser)
+    @jwt_required()
+    def get(self):
+        """Leaderboard therapist berdasarkan Bayesian average rating"""
+        args = top_parser.parse_args()
+        try:
+            therapists = get_top_therapists(args.get("limit"))
+            if therapists is None:
+                return error_response("Failed to fetch leaderboard", 500)
+            return success_response("Top therapists fetched successfully", therapists, 200)
+        except SQLAlchemyError as e:
+            therapists_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+@therapists_ns.route('/availability')
+class TherapistAvailabilityResource(Resource):
+    @therapists_ns.expect(availability_parser)
+    @jwt_required()
+    def get(self):
+        """Cari therapist yang punya slot kosong di window waktu tertentu"""
+        args = availability_parser.parse_args()
+        start, end, duration = args["from"], args["to"], args["duration"]
+        if end <= start:
+            return error_response("'to' must be after 'from'", 400)
+        if end - start > timedelta(days=7):
+            return error_response("Window cannot be longer than 7 days", 400)
+        if duration < 1 or duration > 8 * 60:
+            return error_response("duration must be between 1 and 480 minutes", 400)
+        try:
+            therapists = get_available_therapists(start, end, duration)
+            if therapists is None:
+                return error_response("Failed to fetch availability", 500)
+            return success_response("Available therapists fetched successfully", therapists, 200)
+        except SQLAlchemyError as e:
+            therapists_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
+@therapists_ns.route('/cache-stats')
+class TherapistCacheStatsResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Statistik hit/miss cache daftar therapist di worker ini (admin only)"""
+        claims = get_jwt()
+        if claims.get("role") != "admin":
+            return error_response("Forbidden: admin only", 403)
+        return success_response("Therapist cache stats fetched successfully", therapist_cache.stats(), 200)
+
+
 @therapists_ns.route('/<int:id_therapist>')
 @therapists_ns.param('id_therapist', 'ID user therapist yang ingin diambil')
 class TherapistDetailResource(Resource):
     @jwt_required()
     def get(self, id_therapist):
-        """Detail profil therapist by ID (admin & user)"""
+        """Detail profil therapist by ID (admin & user), mendukung If-None-Match"""
         try:
+            etag = get_therapist_version(id_therapist)
+            if is_not_modified(etag):
+                return not_modified_response(etag)
             therapist = get_therapist_by_id(id_therapist)
             if not therapist:
                 return error_response("Therapist not found", 404)
-            return success_response("Therapist detail fetched successfully", therapist, 200)
+            return success_response(
+                "Therapist detail fetched successfully", therapist, 200,
+                headers=etag_headers(etag) if etag else None
+            )
         except SQLAlchemyError as e:
             therapists_ns.logger.error(f"Database error: {str(e)}")
             return error_response("Internal server error", 500)
@@ -139,6 +374,41 @@ class TherapistDetailResource(Resource):
             return error_response("Internal server error", 500)
         
 
+@therapists_ns.route('/<int:id_therapist>/agenda')
+@therapists_ns.param('id_therapist', 'ID user therapist')
+class TherapistAgendaResource(Resource):
+    @jwt_required()
+    @therapists_ns.expect(agenda_parser)
+    def get(self, id_therapist):
+        """Agenda booking therapist per hari beserta jumlah per status (admin atau therapist sendiri)"""
+        claims = get_jwt()
+        user_id = get_jwt_identity()
+        if claims.get("role") != "admin" and not (
+            claims.get("role") == "therapist" and int(user_id) == id_therapist
+        ):
+            return error_response("Forbidden: only admin or the therapist can view this agenda", 403)
+        args = agenda_parser.parse_args()
+        start, end = args["from"], args["to"]
+        if end <= start:
+            return error_response("'to' must be after 'from'", 400)
+        if end - start > timedelta(days=31):
+            return error_response("Window cannot be longer than 31 days", 400)
+        try:
+            etag = get_agenda_version(id_therapist, start, end)
+            if is_not_modified(etag):
+                return not_modified_response(etag)
+            agenda = get_therapist_agenda(id_therapist, start, end)
+            if agenda is None:
+                return error_response("Failed to fetch agenda", 500)
+            return success_response(
+                "Therapist agenda fetched successfully", agenda, 200,
+                headers=etag_headers(etag) if etag else None
+            )
+        except SQLAlchemyError as e:
+            therapists_ns.logger.error(f"Database error: {str(e)}")
+            return error_response("Internal server error", 500)
+
+
 @therapists_ns.route('/<int:id_therapist>/status')
 @therapists_ns.param('id_therapist', 'ID therapist yang ingin diupdate statusnya')
 class TherapistStatusResource(Resource):
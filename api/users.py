@@ -3,8 +3,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from flask_restx import Namespace, Resource, fields
 from sqlalchemy.exc import SQLAlchemyError
 
+from .utils.helper import parse_fields
 from .utils.response import success_response, error_response
-from .query.q_users import create_user, get_all_users, get_user_by_id, soft_delete_user_by_id, update_user_by_id
+from .query.q_users import USER_LIST_COLUMNS, USER_LIST_PRESETS, create_user, get_all_users, get_user_by_id, soft_delete_user_by_id, update_user_by_id
 from .query.q_auth import get_user_profile
 
 users_ns = Namespace('users', description='Endpoint untuk manajemen users (admin only)')
@@ -25,9 +26,16 @@ user_update_model = users_ns.model('UserUpdate', {
     'password': fields.String(required=False, description="Password baru (opsional)")
 })
 
+user_list_parser = users_ns.parser()
+user_list_parser.add_argument(
+    "fields", type=str, required=False, location="args",
+    help="Field yang dikembalikan, pisahkan dengan koma (atau preset 'lean')"
+)
+
 @users_ns.route('')
 class UsersResource(Resource):
     @jwt_required()
+    @users_ns.expect(user_list_parser)
     def get(self):
         """List semua user (admin only)"""
         claims = get_jwt()
@@ -35,8 +43,13 @@ class UsersResource(Resource):
         # Hanya admin yang boleh mengakses
         if role != "admin":
             return error_response("Unauthorized: Admin only", 403)
+        args = user_list_parser.parse_args()
+        try:
+            fields = parse_fields(args.get("fields"), USER_LIST_COLUMNS, USER_LIST_PRESETS)
+        except ValueError as e:
+            return error_response(str(e), 400)
         try:
-            users = get_all_users()
+            users = get_all_users(fields=fields)
             if users is None:
                 return error_response("Failed to fetch users", 500)
             return success_response("Users fetched successfully", users, 200)
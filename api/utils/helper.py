@@ -1,3 +1,6 @@
+import base64
+import hashlib
+import json
 from decimal import Decimal
 from datetime import date, datetime
 
@@ -19,4 +22,94 @@ def serialize_row(row):
             else value
         )
         for key, value in row.items()
-    }
\ No newline at end of file
+    }
+
+def encode_cursor(*values):
+    """
+    Encode posisi terakhir sebuah halaman (keyset) menjadi cursor opaque.
+    Decimal disimpan sebagai string supaya tidak kehilangan presisi.
+    """
+    payload = json.dumps([
+        value.isoformat() if isinstance(value, (datetime, date))
+        else str(value) if isinstance(value, Decimal)
+        else value
+        for value in values
+    ], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, size):
+    """
+    Kebalikan dari encode_cursor. Raise ValueError jika cursor tidak valid.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def clamp_limit(limit, default, maximum):
+    """
+    Batasi jumlah data per halaman ke range 1..maximum
+    """
+    if not limit:
+        return default
+    return max(1, min(int(limit), maximum))
+
+def parse_datetime(value):
+    """
+    Parse query parameter tanggal/waktu ISO 8601 (dipakai sebagai type di reqparse).
+    Timezone dibuang, semua waktu diperlakukan sebagai waktu lokal seperti di database.
+    """
+    return datetime.fromisoformat(str(value).strip()).replace(tzinfo=None)
+
+def make_etag(*parts):
+    """
+    Strong ETag dari versi data, misal ("booking", id, updated_at)
+    """
+    raw = "|".join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def parse_fields(raw, columns, presets=None):
+    """
+    Parse parameter `fields=a,b,c` terhadap allow-list `columns` milik endpoint.
+    Kosong = semua field. Nama preset (misal "lean") diexpand ke daftar field-nya.
+    Raise ValueError jika ada field yang tidak dikenal.
+    """
+    if not raw:
+        return list(columns)
+    requested = []
+    for name in raw.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if presets and name in presets:
+            requested.extend(presets[name])
+        elif name in columns:
+            requested.append(name)
+        else:
+            raise ValueError(f"Unknown field '{name}', allowed: {', '.join(columns)}")
+    return list(dict.fromkeys(requested)) or list(columns)
+
+def select_columns(fields, columns):
+    """
+    SELECT list hanya untuk field yang diminta, alias = nama field di response
+    """
+    return ", ".join(f"{columns[name][0]} AS {name}" for name in fields)
+
+def format_row(row, fields, columns):
+    """
+    Bentuk dict response dari row, memakai formatter per field (jika ada)
+    """
+    return {
+        name: columns[name][1](row[name]) if columns[name][1] else row[name]
+        for name in fields
+    }
+
+def str_or_none(value):
+    return str(value) if value else None
+
+def float_or_none(value):
+    return float(value) if value else None
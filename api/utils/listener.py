@@ -0,0 +1,104 @@
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from . import config
+
+
+NOTIFICATION_CHANNEL = "notifications"
+
+
+class NotificationListener:
+    """
+    Satu koneksi LISTEN per proses worker yang dipakai bersama oleh semua stream SSE.
+    Koneksi dibuat langsung dengan psycopg2 (di luar pool engine) karena dipegang terus;
+    stream yang idle hanya menunggu di queue, tidak memegang koneksi pool.
+
+    Queue tiap subscriber hanya sinyal "ada yang baru" (maxsize 1, sinyal beruntun digabung),
+    stream sendiri yang mengambil notifikasi setelah id terakhir yang sudah dikirim.
+    """
+
+    def __init__(self, channel, poll_timeout=5, reconnect_delay=3):
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def subscribe(self, user_id):
+        signal = queue.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(int(user_id), set()).add(signal)
+            self._ensure_started()
+        return signal
+
+    def unsubscribe(self, user_id, signal):
+        with self._lock:
+            signals = self._subscribers.get(int(user_id))
+            if signals:
+                signals.discard(signal)
+                if not signals:
+                    del self._subscribers[int(user_id)]
+
+    def _ensure_started(self):
+        # thread tidak ikut ter-fork (gunicorn --preload), start ulang per proses
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="notification-listener", daemon=True)
+            self._thread.start()
+
+    def _wake(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                signals = [signal for group in self._subscribers.values() for signal in group]
+            else:
+                signals = [signal for user_id in user_ids for signal in self._subscribers.get(user_id, ())]
+        for signal in signals:
+            try:
+                signal.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(
+                    host=config.host, port=config.port, dbname=config.dbname,
+                    user=config.username, password=config.password
+                )
+                connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                # setelah (re)connect semua stream mengejar notifikasi yang mungkin terlewat
+                self._wake()
+                while True:
+                    if select.select([connection], [], [], self.poll_timeout) == ([], [], []):
+                        continue
+                    connection.poll()
+                    user_ids = set()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            user_ids.add(int(json.loads(notify.payload)["user_id"]))
+                        except (ValueError, KeyError, TypeError):
+                            continue
+                    if user_ids:
+                        self._wake(user_ids)
+            except (psycopg2.Error, OSError) as e:
+                print(f"Error occurred: {str(e)}")
+            finally:
+                if connection is not None:
+                    connection.close()
+            time.sleep(self.reconnect_delay)
+
+
+notification_listener = NotificationListener(NOTIFICATION_CHANNEL)
@@ -1,9 +1,18 @@
-def success_response(message, data=None, status_code=200):
-    return {
+from flask import Response, request
+from werkzeug.http import quote_etag
+
+
+def success_response(message, data=None, status_code=200, meta=None, headers=None):
+    response = {
         "status": "success",
         "message": message,
         "data": data
-    }, status_code
+    }
+    if meta is not None:
+        response["meta"] = meta
+    if headers:
+        return response, status_code, headers
+    return response, status_code
 
 
 def error_response(message, status_code=400, data=None):
@@ -12,3 +21,16 @@ def error_response(message, status_code=400, data=None):
         "message": message,
         "data": data
     }, status_code
+
+
+def etag_headers(etag):
+    # no-cache: client boleh simpan, tapi wajib revalidate pakai If-None-Match
+    return {"ETag": quote_etag(etag), "Cache-Control": "private, no-cache"}
+
+
+def is_not_modified(etag):
+    return etag is not None and request.if_none_match.contains(etag)
+
+
+def not_modified_response(etag):
+    return Response(status=304, headers=etag_headers(etag))
@@ -0,0 +1,161 @@
+import json
+from datetime import timedelta
+
+
+# Satu minggu dipecah menjadi slot 15 menit: 7 x 96 = 672 bit per therapist
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+
+# Durasi sesi (menit) per session_type booking, default jika session_type tidak diisi
+DEFAULT_SESSION_MINUTES = 60
+SESSION_DURATIONS = {
+    "short": 30,
+    "regular": 60,
+    "extended": 90,
+    "full": 120,
+}
+MAX_SESSION_MINUTES = max(SESSION_DURATIONS.values())
+
+DAY_INDEX = {
+    "monday": 0, "mon": 0, "senin": 0,
+    "tuesday": 1, "tue": 1, "selasa": 1,
+    "wednesday": 2, "wed": 2, "rabu": 2,
+    "thursday": 3, "thu": 3, "kamis": 3,
+    "friday": 4, "fri": 4, "jumat": 4, "jum'at": 4,
+    "saturday": 5, "sat": 5, "sabtu": 5,
+    "sunday": 6, "sun": 6, "minggu": 6,
+}
+EVERY_DAY = {"daily", "everyday", "all", "setiap hari", "*"}
+
+
+def _parse_clock(value):
+    """'09:30' -> menit sejak tengah malam"""
+    hour, minute = str(value).strip().split(":")[:2]
+    minutes = int(hour) * 60 + int(minute)
+    if minutes < 0 or minutes > 24 * 60:
+        raise ValueError(f"Invalid time: {value}")
+    return minutes
+
+def _to_slots(start, end):
+    """Range menit -> range slot, jam mulai dibulatkan ke atas dan jam selesai ke bawah"""
+    return -(-start // SLOT_MINUTES), end // SLOT_MINUTES
+
+def _parse_ranges(value):
+    """Terima '09:00-17:00', {'start','end'} atau list dari keduanya"""
+    if isinstance(value, list):
+        ranges = []
+        for item in value:
+            ranges.extend(_parse_ranges(item))
+        return ranges
+    if isinstance(value, dict):
+        return [_to_slots(_parse_clock(value["start"]), _parse_clock(value["end"]))]
+    if isinstance(value, str) and "-" in value:
+        start, end = value.split("-", 1)
+        return [_to_slots(_parse_clock(start), _parse_clock(end))]
+    return []
+
+def _day_mask(day, start, end):
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << (day * SLOTS_PER_DAY + start)
+
+def compile_working_hours(working_hours):
+    """
+    Compile working_hours (JSON/string) menjadi bitmap mingguan (int 672 bit).
+    Bit ke-(hari * 96 + slot) bernilai 1 jika therapist bekerja pada slot tersebut,
+    hari 0 = Senin. Format yang tidak dikenali dianggap tidak punya jam kerja.
+
+    Format yang didukung:
+        {"monday": "09:00-17:00", "selasa": ["09:00-12:00", "13:00-17:00"]}
+        [{"day": "monday", "start": "09:00", "end": "17:00"}]
+        "09:00-17:00"  (berlaku setiap hari)
+    """
+    if not working_hours:
+        return 0
+    if isinstance(working_hours, str):
+        try:
+            working_hours = json.loads(working_hours)
+        except ValueError:
+            pass
+    mask = 0
+    try:
+        if isinstance(working_hours, str):
+            for start, end in _parse_ranges(working_hours):
+                for day in range(7):
+                    mask |= _day_mask(day, start, end)
+        elif isinstance(working_hours, dict):
+            for key, value in working_hours.items():
+                key = str(key).strip().lower()
+                days = range(7) if key in EVERY_DAY else [DAY_INDEX[key]] if key in DAY_INDEX else []
+                for start, end in _parse_ranges(value):
+                    for day in days:
+                        mask |= _day_mask(day, start, end)
+        elif isinstance(working_hours, list):
+            for item in working_hours:
+                if not isinstance(item, dict):
+                    continue
+                key = str(item.get("day", "")).strip().lower()
+                days = range(7) if key in EVERY_DAY else [DAY_INDEX[key]] if key in DAY_INDEX else []
+                for start, end in _parse_ranges(item):
+                    for day in days:
+                        mask |= _day_mask(day, start, end)
+    except (KeyError, TypeError, ValueError):
+        return 0
+    return mask
+
+def align_up(value):
+    """Bulatkan datetime ke atas ke batas slot terdekat"""
+    floored = value.replace(second=0, microsecond=0) - timedelta(minutes=value.minute % SLOT_MINUTES)
+    return floored if floored == value else floored + timedelta(minutes=SLOT_MINUTES)
+
+def slot_offset(value, origin):
+    """Jumlah slot (dibulatkan ke bawah) dari origin ke value"""
+    return int((value - origin).total_seconds() // (SLOT_MINUTES * 60))
+
+def slot_offset_ceil(value, origin):
+    """Jumlah slot (dibulatkan ke atas) dari origin ke value"""
+    return -int(-(value - origin).total_seconds() // (SLOT_MINUTES * 60))
+
+def window_mask(weekly_mask, start, slots):
+    """
+    Proyeksikan bitmap mingguan ke window [start, start + slots), maksimal satu minggu.
+    Bit ke-i = slot ke-i sejak start. start harus sudah di-align ke slot.
+    """
+    offset = start.weekday() * SLOTS_PER_DAY + (start.hour * 60 + start.minute) // SLOT_MINUTES
+    rotated = (weekly_mask >> offset) | (weekly_mask << (SLOTS_PER_WEEK - offset))
+    return rotated & ((1 << slots) - 1)
+
+def clear_range(mask, first, last):
+    """Nol-kan bit [first, last) pada mask"""
+    if last <= first:
+        return mask
+    return mask & ~(((1 << (last - first)) - 1) << first)
+
+def free_windows(mask, length):
+    """
+    Cari semua rentang bebas yang muat untuk `length` slot berturut-turut.
+    Return list (slot_awal, slot_akhir) dengan slot_akhir eksklusif.
+    """
+    starts = mask
+    for shift in range(1, length):
+        starts &= mask >> shift
+    windows = []
+    while starts:
+        first = (starts & -starts).bit_length() - 1
+        run = starts >> first
+        run_length = (run ^ (run + 1)).bit_length() - 1
+        windows.append((first, first + run_length - 1 + length))
+        starts = clear_range(starts, first, first + run_length)
+    return windows
+
+# Frekuensi recurrence booking series -> jarak satu langkah
+RECURRENCE_STEPS = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+}
+
+def expand_recurrence(start, frequency, interval=1, count=1):
+    """Expand recurrence rule menjadi list waktu booking, mis. weekly x 10 sesi"""
+    step = RECURRENCE_STEPS[frequency] * interval
+    return [start + step * i for i in range(count)]
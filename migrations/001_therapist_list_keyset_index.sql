@@ -0,0 +1,10 @@
+-- Index untuk keyset pagination GET /therapists
+-- Urutan index sama persis dengan ORDER BY di get_therapists() sehingga
+-- setiap halaman cukup membaca `limit` baris dari index, berapapun dalamnya.
+CREATE INDEX IF NOT EXISTS idx_therapist_profiles_rating_keyset
+    ON therapist_profiles ((COALESCE(average_rating, 0)) DESC, created_at DESC, id DESC)
+    WHERE status = 1;
+
+CREATE INDEX IF NOT EXISTS idx_therapist_profiles_status_rating_keyset
+    ON therapist_profiles (status_therapist, (COALESCE(average_rating, 0)) DESC, created_at DESC, id DESC)
+    WHERE status = 1;
@@ -0,0 +1,4 @@
+-- Range query booking aktif per window waktu (GET /therapists/availability)
+CREATE INDEX IF NOT EXISTS idx_bookings_active_time
+    ON bookings (booking_time, therapist_id)
+    WHERE status = 1 AND status_booking IN ('pending', 'accepted');
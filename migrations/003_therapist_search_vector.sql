@@ -0,0 +1,55 @@
+-- Full-text search therapist (bio, specialization, users.name)
+-- search_vector disimpan di therapist_profiles dan dijaga oleh trigger,
+-- karena generated column tidak bisa membaca kolom dari tabel users.
+ALTER TABLE therapist_profiles ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION therapist_search_vector(p_name text, p_specialization text, p_bio text)
+RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('simple', COALESCE(p_name, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(p_specialization, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(p_bio, '')), 'B')
+$$;
+
+CREATE OR REPLACE FUNCTION therapist_profiles_search_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := therapist_search_vector(
+        (SELECT name FROM users WHERE id = NEW.user_id), NEW.specialization, NEW.bio
+    );
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_therapist_profiles_search ON therapist_profiles;
+CREATE TRIGGER trg_therapist_profiles_search
+    BEFORE INSERT OR UPDATE OF bio, specialization, user_id ON therapist_profiles
+    FOR EACH ROW EXECUTE FUNCTION therapist_profiles_search_refresh();
+
+CREATE OR REPLACE FUNCTION users_name_search_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE therapist_profiles
+    SET search_vector = therapist_search_vector(NEW.name, specialization, bio)
+    WHERE user_id = NEW.id;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_users_name_search ON users;
+CREATE TRIGGER trg_users_name_search
+    AFTER UPDATE OF name ON users
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION users_name_search_refresh();
+
+-- backfill data lama
+UPDATE therapist_profiles tp
+SET search_vector = therapist_search_vector(u.name, tp.specialization, tp.bio)
+FROM users u
+WHERE u.id = tp.user_id;
+
+CREATE INDEX IF NOT EXISTS idx_therapist_profiles_search
+    ON therapist_profiles USING GIN (search_vector)
+    WHERE status = 1;
+
+-- filter tambahan di mode search
+CREATE INDEX IF NOT EXISTS idx_therapist_profiles_specialization
+    ON therapist_profiles (lower(specialization))
+    WHERE status = 1;
@@ -0,0 +1,17 @@
+-- Leaderboard therapist dengan Bayesian average
+-- rank_score = (weight * mean_rating + average_rating * total_reviews) / (weight + total_reviews)
+-- Prior (mean_rating, weight) dihitung ulang oleh `flask --app api refresh-leaderboard`
+-- dan dipakai create_review untuk update incremental satu therapist.
+ALTER TABLE therapist_profiles ADD COLUMN IF NOT EXISTS rank_score double precision NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS leaderboard_prior (
+    id smallint PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    mean_rating double precision NOT NULL DEFAULT 0,
+    weight double precision NOT NULL DEFAULT 1,
+    refreshed_at timestamp NOT NULL DEFAULT NOW()
+);
+INSERT INTO leaderboard_prior (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_therapist_profiles_rank_score
+    ON therapist_profiles (rank_score DESC, id DESC)
+    WHERE status = 1;
@@ -0,0 +1,19 @@
+-- Agregat rating incremental: create_review cukup increment rating_sum & total_reviews
+-- (O(1) per review), average_rating = rating_sum / total_reviews.
+-- Drift diperiksa/diperbaiki oleh `flask --app api reconcile-ratings`.
+ALTER TABLE therapist_profiles ADD COLUMN IF NOT EXISTS rating_sum bigint NOT NULL DEFAULT 0;
+
+UPDATE therapist_profiles tp
+SET rating_sum = a.rating_sum, total_reviews = a.total_reviews
+FROM (
+    SELECT therapist_id, SUM(rating) AS rating_sum, COUNT(*) AS total_reviews
+    FROM reviews
+    WHERE status = 1
+    GROUP BY therapist_id
+) a
+WHERE a.therapist_id = tp.user_id;
+
+CREATE INDEX IF NOT EXISTS idx_reviews_therapist_active
+    ON reviews (therapist_id)
+    INCLUDE (rating)
+    WHERE status = 1;
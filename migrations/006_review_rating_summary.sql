@@ -0,0 +1,31 @@
+-- Ringkasan rating per therapist (histogram bintang 1-5), diupdate oleh create_review
+-- sehingga halaman review tidak perlu GROUP BY setiap kali dibuka.
+CREATE TABLE IF NOT EXISTS therapist_rating_summary (
+    therapist_id integer PRIMARY KEY,
+    rating_1 integer NOT NULL DEFAULT 0,
+    rating_2 integer NOT NULL DEFAULT 0,
+    rating_3 integer NOT NULL DEFAULT 0,
+    rating_4 integer NOT NULL DEFAULT 0,
+    rating_5 integer NOT NULL DEFAULT 0,
+    total_reviews integer NOT NULL DEFAULT 0,
+    updated_at timestamp NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO therapist_rating_summary AS s
+    (therapist_id, rating_1, rating_2, rating_3, rating_4, rating_5, total_reviews, updated_at)
+SELECT therapist_id,
+       COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2),
+       COUNT(*) FILTER (WHERE rating = 3), COUNT(*) FILTER (WHERE rating = 4),
+       COUNT(*) FILTER (WHERE rating = 5), COUNT(*), NOW()
+FROM reviews
+WHERE status = 1
+GROUP BY therapist_id
+ON CONFLICT (therapist_id) DO UPDATE
+SET rating_1 = EXCLUDED.rating_1, rating_2 = EXCLUDED.rating_2, rating_3 = EXCLUDED.rating_3,
+    rating_4 = EXCLUDED.rating_4, rating_5 = EXCLUDED.rating_5,
+    total_reviews = EXCLUDED.total_reviews, updated_at = NOW();
+
+-- keyset pagination review per therapist: ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_reviews_therapist_keyset
+    ON reviews (therapist_id, created_at DESC, id DESC)
+    WHERE status = 1;
@@ -0,0 +1,23 @@
+-- Cegah double booking di level database.
+-- Setiap booking adalah range [booking_time, booking_time + duration_minutes),
+-- booking aktif (pending/accepted) milik therapist yang sama tidak boleh overlap.
+-- Cek konflik lama sebelum menjalankan migration ini:
+--   SELECT a.id, b.id FROM bookings a JOIN bookings b
+--     ON a.therapist_id = b.therapist_id AND a.id < b.id
+--    AND tsrange(a.booking_time, a.booking_time + interval '60 minutes')
+--     && tsrange(b.booking_time, b.booking_time + interval '60 minutes')
+--   WHERE a.status = 1 AND b.status = 1
+--     AND a.status_booking IN ('pending', 'accepted') AND b.status_booking IN ('pending', 'accepted');
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS session_type varchar(20);
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS duration_minutes integer NOT NULL DEFAULT 60;
+
+ALTER TABLE bookings DROP CONSTRAINT IF EXISTS bookings_duration_positive;
+ALTER TABLE bookings ADD CONSTRAINT bookings_duration_positive CHECK (duration_minutes > 0);
+
+ALTER TABLE bookings DROP CONSTRAINT IF EXISTS bookings_no_overlap;
+ALTER TABLE bookings ADD CONSTRAINT bookings_no_overlap EXCLUDE USING gist (
+    therapist_id WITH =,
+    tsrange(booking_time, booking_time + duration_minutes * interval '1 minute') WITH &&
+) WHERE (status = 1 AND status_booking IN ('pending', 'accepted'));
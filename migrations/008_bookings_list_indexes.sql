@@ -0,0 +1,18 @@
+-- Keyset pagination list booking (GET /bookings): ORDER BY booking_time DESC, id DESC
+-- per scope role/filter, hanya booking yang belum di-soft delete.
+CREATE INDEX IF NOT EXISTS idx_bookings_therapist_time
+    ON bookings (therapist_id, booking_time DESC, id DESC)
+    WHERE status = 1;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_user_time
+    ON bookings (user_id, booking_time DESC, id DESC)
+    WHERE status = 1;
+
+-- admin tanpa filter user/therapist, opsional filter status_booking
+CREATE INDEX IF NOT EXISTS idx_bookings_time
+    ON bookings (booking_time DESC, id DESC)
+    WHERE status = 1;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_status_time
+    ON bookings (status_booking, booking_time DESC, id DESC)
+    WHERE status = 1;
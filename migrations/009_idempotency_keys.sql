@@ -0,0 +1,17 @@
+-- Idempotency-Key untuk POST /bookings dan POST /reviews.
+-- Response pertama disimpan per (user, endpoint, key) dan di-replay untuk retry
+-- sampai expires_at, lalu dibersihkan oleh `flask --app api purge-idempotency-keys`.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id integer NOT NULL,
+    endpoint varchar(50) NOT NULL,
+    key varchar(255) NOT NULL,
+    request_hash char(40) NOT NULL,
+    response_status smallint NOT NULL,
+    response_body jsonb NOT NULL,
+    created_at timestamp NOT NULL DEFAULT NOW(),
+    expires_at timestamp NOT NULL,
+    PRIMARY KEY (user_id, endpoint, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires
+    ON idempotency_keys (expires_at);
@@ -0,0 +1,14 @@
+-- Transactional outbox: event booking/review ditulis di transaksi yang sama dengan datanya,
+-- lalu di-fan-out ke notifications oleh `flask --app api dispatch-outbox`.
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id bigserial PRIMARY KEY,
+    event_type varchar(50) NOT NULL,
+    payload jsonb NOT NULL,
+    created_at timestamp NOT NULL DEFAULT NOW(),
+    dispatched_at timestamp
+);
+
+-- antrian event yang belum dikirim, dibaca dispatcher urut id
+CREATE INDEX IF NOT EXISTS idx_outbox_events_pending
+    ON outbox_events (id)
+    WHERE dispatched_at IS NULL;
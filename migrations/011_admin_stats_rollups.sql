@@ -0,0 +1,39 @@
+-- Rollup dashboard admin (GET /admin/stats), di-refresh incremental oleh
+-- `flask --app api refresh-stats`: hanya bucket yang punya row berubah sejak watermark.
+CREATE TABLE IF NOT EXISTS stats_bookings_daily (
+    day date NOT NULL,
+    status_booking varchar(20) NOT NULL,
+    total integer NOT NULL,
+    PRIMARY KEY (day, status_booking)
+);
+
+CREATE TABLE IF NOT EXISTS stats_users_daily (
+    day date NOT NULL,
+    role varchar(20) NOT NULL,
+    total integer NOT NULL,
+    PRIMARY KEY (day, role)
+);
+
+-- week = Senin awal minggu (date_trunc('week'))
+CREATE TABLE IF NOT EXISTS stats_reviews_weekly (
+    week date NOT NULL,
+    therapist_id integer NOT NULL,
+    total_reviews integer NOT NULL,
+    rating_sum integer NOT NULL,
+    PRIMARY KEY (week, therapist_id)
+);
+
+CREATE TABLE IF NOT EXISTS stats_watermarks (
+    name varchar(50) PRIMARY KEY,
+    refreshed_at timestamp NOT NULL
+);
+INSERT INTO stats_watermarks (name, refreshed_at)
+VALUES ('admin_stats', '-infinity')
+ON CONFLICT (name) DO NOTHING;
+
+-- mencari row yang berubah sejak watermark
+CREATE INDEX IF NOT EXISTS idx_bookings_updated_at ON bookings (updated_at);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at);
+CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users (updated_at);
+CREATE INDEX IF NOT EXISTS idx_reviews_created_at ON reviews (created_at);
+CREATE INDEX IF NOT EXISTS idx_reviews_updated_at ON reviews (updated_at);
@@ -0,0 +1,198 @@
+-- Partisi bulanan bookings berdasarkan booking_time.
+-- Query dengan filter booking_time (list, agenda, availability, export) hanya membaca
+-- partisi bulan yang relevan, partisi lama bisa di-archive lalu di-drop utuh
+-- (`flask --app api archive-partitions`).
+--
+-- Catatan:
+--   * primary key menjadi (id, booking_time) karena harus memuat partition key,
+--     id tetap unik lewat sequence yang sama
+--   * foreign key keluar (user_id/therapist_id -> users) disalin ke tabel baru,
+--     foreign key yang menunjuk bookings (mis. reviews.booking_id) di-drop karena
+--     harus memuat booking_time; validasi booking dilakukan di aplikasi (insert_review).
+--     purge-deleted tidak menghapus booking yang masih direview, archive-partitions
+--     melewati partisi yang booking-nya masih dirujuk review aktif
+--   * exclusion constraint no-overlap dipasang per partisi, overlap lintas partisi
+--     (booking yang melewati pergantian bulan) dijaga trigger bookings_cross_month_guard
+--   * durasi booking dibatasi maksimal 1 hari supaya cek lintas bulan tetap sempit
+--   * butuh PostgreSQL 13+ (BEFORE ROW trigger di tabel partisi)
+-- Jalankan di jam sepi: seluruh isi bookings disalin dalam satu transaksi.
+BEGIN;
+
+ALTER TABLE bookings RENAME TO bookings_legacy;
+
+-- sequence id dipakai ulang oleh tabel baru, jangan ikut ter-drop bersama tabel lama
+DO $$
+DECLARE
+    seq text := pg_get_serial_sequence('bookings_legacy', 'id');
+BEGIN
+    IF seq IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', seq);
+    END IF;
+END $$;
+
+DO $$
+DECLARE
+    fk record;
+BEGIN
+    FOR fk IN
+        SELECT conrelid::regclass AS table_name, conname
+        FROM pg_constraint
+        WHERE confrelid = 'bookings_legacy'::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.table_name, fk.conname);
+    END LOOP;
+END $$;
+
+CREATE TABLE bookings (LIKE bookings_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    PARTITION BY RANGE (booking_time);
+ALTER TABLE bookings ADD PRIMARY KEY (id, booking_time);
+ALTER TABLE bookings ADD CONSTRAINT bookings_duration_max CHECK (duration_minutes <= 1440);
+
+-- Buat partisi satu bulan (idempotent) beserta exclusion constraint no-overlap-nya.
+-- Dipanggil juga oleh `flask --app api create-partitions`. Booking bulan tersebut yang
+-- sudah terlanjur masuk bookings_default dipindah ke partisi baru (default di-detach
+-- sementara, karena partisi baru tidak bisa dibuat selama default memuat row rentangnya).
+CREATE OR REPLACE FUNCTION create_bookings_partition(month date) RETURNS text AS $$
+DECLARE
+    start_month date := date_trunc('month', month)::date;
+    end_month date := (date_trunc('month', month) + interval '1 month')::date;
+    partition_name text := 'bookings_' || to_char(start_month, 'YYYY_MM');
+    has_default boolean := to_regclass('bookings_default') IS NOT NULL;
+    move_rows boolean := false;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+    IF has_default THEN
+        EXECUTE 'SELECT EXISTS (SELECT 1 FROM bookings_default WHERE booking_time >= $1 AND booking_time < $2)'
+            INTO move_rows USING start_month, end_month;
+    END IF;
+    IF move_rows THEN
+        ALTER TABLE bookings DETACH PARTITION bookings_default;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF bookings FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_month, end_month
+    );
+    IF move_rows THEN
+        EXECUTE format(
+            'INSERT INTO %I SELECT * FROM bookings_default WHERE booking_time >= $1 AND booking_time < $2',
+            partition_name
+        ) USING start_month, end_month;
+        DELETE FROM bookings_default WHERE booking_time >= start_month AND booking_time < end_month;
+        ALTER TABLE bookings ATTACH PARTITION bookings_default DEFAULT;
+    END IF;
+    EXECUTE format(
+        'ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist ('
+        '    therapist_id WITH =,'
+        '    tsrange(booking_time, booking_time + duration_minutes * interval ''1 minute'') WITH &&'
+        ') WHERE (status = 1 AND status_booking IN (''pending'', ''accepted''))',
+        partition_name, partition_name || '_no_overlap'
+    );
+    RETURN partition_name;
+END $$ LANGUAGE plpgsql;
+
+-- Exclusion constraint hanya berlaku di dalam satu partisi. Booking aktif yang melewati
+-- akhir bulan, atau dimulai di hari pertama bulan (bisa ditimpa booking bulan sebelumnya),
+-- dicek terhadap partisi lain di bawah advisory lock per therapist; kedua sisi pasangan
+-- lintas bulan selalu masuk kondisi ini sehingga saling menunggu, bukan saling lolos.
+CREATE OR REPLACE FUNCTION bookings_cross_month_guard() RETURNS trigger AS $$
+DECLARE
+    month_start timestamp := date_trunc('month', NEW.booking_time);
+    booking_end timestamp := NEW.booking_time + NEW.duration_minutes * interval '1 minute';
+BEGIN
+    IF NEW.status <> 1 OR NEW.status_booking NOT IN ('pending', 'accepted') THEN
+        RETURN NEW;
+    END IF;
+    IF booking_end <= month_start + interval '1 month' AND NEW.booking_time >= month_start + interval '1 day' THEN
+        RETURN NEW;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtext('bookings_no_overlap'), NEW.therapist_id);
+    IF EXISTS (
+        SELECT 1
+        FROM bookings b
+        WHERE b.therapist_id = NEW.therapist_id AND b.id <> NEW.id
+          AND b.status = 1 AND b.status_booking IN ('pending', 'accepted')
+          AND date_trunc('month', b.booking_time) <> month_start
+          AND b.booking_time >= NEW.booking_time - interval '1 day' AND b.booking_time < booking_end
+          AND tsrange(b.booking_time, b.booking_time + b.duration_minutes * interval '1 minute')
+              && tsrange(NEW.booking_time, booking_end)
+    ) THEN
+        RAISE EXCEPTION 'booking overlaps another active booking of therapist %', NEW.therapist_id
+            USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'bookings_no_overlap';
+    END IF;
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+-- partisi dari bulan booking tertua sampai 3 bulan ke depan
+DO $$
+DECLARE
+    month date := date_trunc('month', COALESCE((SELECT MIN(booking_time) FROM bookings_legacy), NOW()))::date;
+BEGIN
+    WHILE month <= date_trunc('month', NOW() + interval '3 months')::date LOOP
+        PERFORM create_bookings_partition(month);
+        month := (month + interval '1 month')::date;
+    END LOOP;
+END $$;
+
+-- penampung booking di luar partisi yang ada (mis. import data sangat lama)
+CREATE TABLE IF NOT EXISTS bookings_default PARTITION OF bookings DEFAULT;
+ALTER TABLE bookings_default ADD CONSTRAINT bookings_default_no_overlap EXCLUDE USING gist (
+    therapist_id WITH =,
+    tsrange(booking_time, booking_time + duration_minutes * interval '1 minute') WITH &&
+) WHERE (status = 1 AND status_booking IN ('pending', 'accepted'));
+
+INSERT INTO bookings SELECT * FROM bookings_legacy;
+
+-- foreign key keluar (mis. user_id/therapist_id -> users) tidak ikut LIKE, salin dari tabel lama
+DO $$
+DECLARE
+    fk record;
+BEGIN
+    FOR fk IN
+        SELECT conname, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE conrelid = 'bookings_legacy'::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE bookings ADD CONSTRAINT %I %s', fk.conname, fk.definition);
+    END LOOP;
+END $$;
+
+DROP TABLE bookings_legacy;
+
+-- trigger dipasang setelah salin data: data lama sudah lolos exclusion constraint 007
+CREATE TRIGGER bookings_cross_month_guard
+    BEFORE INSERT OR UPDATE OF booking_time, duration_minutes, status, status_booking ON bookings
+    FOR EACH ROW
+    EXECUTE FUNCTION bookings_cross_month_guard();
+
+-- index dari migration 002, 008 dan 011, dibuat di parent sehingga ikut ke setiap partisi
+CREATE INDEX IF NOT EXISTS idx_bookings_active_time
+    ON bookings (booking_time, therapist_id)
+    WHERE status = 1 AND status_booking IN ('pending', 'accepted');
+CREATE INDEX IF NOT EXISTS idx_bookings_therapist_time
+    ON bookings (therapist_id, booking_time DESC, id DESC)
+    WHERE status = 1;
+CREATE INDEX IF NOT EXISTS idx_bookings_user_time
+    ON bookings (user_id, booking_time DESC, id DESC)
+    WHERE status = 1;
+CREATE INDEX IF NOT EXISTS idx_bookings_time
+    ON bookings (booking_time DESC, id DESC)
+    WHERE status = 1;
+CREATE INDEX IF NOT EXISTS idx_bookings_status_time
+    ON bookings (status_booking, booking_time DESC, id DESC)
+    WHERE status = 1;
+CREATE INDEX IF NOT EXISTS idx_bookings_updated_at
+    ON bookings (updated_at);
+-- purge soft delete (flask --app api purge-deleted)
+CREATE INDEX IF NOT EXISTS idx_bookings_deleted
+    ON bookings (updated_at)
+    WHERE status = 0;
+CREATE INDEX IF NOT EXISTS idx_reviews_deleted
+    ON reviews (updated_at)
+    WHERE status = 0;
+CREATE INDEX IF NOT EXISTS idx_notifications_deleted
+    ON notifications (created_at)
+    WHERE status = 0;
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- Badge unread per user (GET /notifications/unread-count), dijaga oleh
+-- create_notification, mark_notification_as_read dan dispatcher outbox.
+CREATE TABLE IF NOT EXISTS notification_counters (
+    user_id integer PRIMARY KEY,
+    unread_count integer NOT NULL DEFAULT 0,
+    updated_at timestamp NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO notification_counters (user_id, unread_count, updated_at)
+SELECT user_id, COUNT(*), NOW()
+FROM notifications
+WHERE status = 1 AND is_read = 0
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE
+SET unread_count = EXCLUDED.unread_count, updated_at = NOW();
+
+-- paging since_id/before_id per user
+CREATE INDEX IF NOT EXISTS idx_notifications_user_id
+    ON notifications (user_id, id DESC)
+    WHERE status = 1;
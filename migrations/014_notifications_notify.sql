@@ -0,0 +1,17 @@
+-- Bangunkan stream SSE (GET /notifications/stream) setiap ada notifikasi baru.
+-- Statement-level: insert multi-row (dispatcher outbox, broadcast) hanya mengirim
+-- satu NOTIFY per penerima, payload berisi user_id dan id notifikasi terbaru.
+CREATE OR REPLACE FUNCTION notify_new_notifications() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('notifications', json_build_object('user_id', user_id, 'id', MAX(id))::text)
+    FROM inserted
+    GROUP BY user_id;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notifications_notify ON notifications;
+CREATE TRIGGER notifications_notify
+    AFTER INSERT ON notifications
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_new_notifications();
@@ -0,0 +1,31 @@
+-- Job broadcast notifikasi (POST /notifications/broadcast).
+-- Fan-out dijalankan dispatcher (`flask --app api dispatch-outbox`) per chunk user id,
+-- last_user_id adalah checkpoint yang di-commit bersama notifikasi chunk tersebut,
+-- max_user_id membatasi penerima ke user yang sudah ada saat job dibuat (sesuai total_recipients).
+CREATE TABLE IF NOT EXISTS notification_broadcasts (
+    id serial PRIMARY KEY,
+    created_by integer NOT NULL,
+    message text NOT NULL,
+    target_role varchar(20) NOT NULL,
+    status_therapist varchar(20),
+    status varchar(20) NOT NULL DEFAULT 'queued',
+    total_recipients integer NOT NULL DEFAULT 0,
+    sent_count integer NOT NULL DEFAULT 0,
+    last_user_id integer NOT NULL DEFAULT 0,
+    max_user_id integer NOT NULL DEFAULT 0,
+    created_at timestamp NOT NULL DEFAULT NOW(),
+    started_at timestamp,
+    finished_at timestamp
+);
+
+-- database yang sudah menjalankan versi awal migration ini
+ALTER TABLE notification_broadcasts ADD COLUMN IF NOT EXISTS max_user_id integer;
+UPDATE notification_broadcasts SET max_user_id = (SELECT COALESCE(MAX(id), 0) FROM users)
+WHERE max_user_id IS NULL;
+ALTER TABLE notification_broadcasts
+    ALTER COLUMN max_user_id SET DEFAULT 0,
+    ALTER COLUMN max_user_id SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_notification_broadcasts_pending
+    ON notification_broadcasts (id)
+    WHERE status IN ('queued', 'running');
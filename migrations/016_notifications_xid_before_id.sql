@@ -0,0 +1,13 @@
+-- Stream SSE (GET /notifications/stream) memajukan cursor berdasarkan xmin/xmax snapshot.
+-- Itu hanya aman kalau transaksi yang memegang id notifikasi sudah punya xid SEBELUM
+-- id-nya diambil: nextval() jalan sebelum heap insert memberi xid, sehingga transaksi
+-- dengan id kecil bisa mendapat xid di atas xmax snapshot yang sudah melihat id lebih besar.
+-- Default kolom id dipaksa meminta xid dulu (pg_current_xact_id) baru nextval, berlaku
+-- untuk semua jalur insert yang memakai default (create_notification, outbox, broadcast).
+CREATE OR REPLACE FUNCTION notifications_next_id() RETURNS integer AS $$
+BEGIN
+    PERFORM pg_current_xact_id();
+    RETURN nextval(pg_get_serial_sequence('notifications', 'id'));
+END $$ LANGUAGE plpgsql VOLATILE;
+
+ALTER TABLE notifications ALTER COLUMN id SET DEFAULT notifications_next_id();
@@ -0,0 +1,48 @@
+-- Lookup id -> booking_time untuk tabel bookings yang dipartisi per bulan (migration 012).
+-- Detail, soft delete, update status dan validasi review mencari booking berdasarkan id saja;
+-- tanpa booking_time planner harus memeriksa semua partisi. Aplikasi membaca booking_time dari
+-- sini dulu lalu memfilter bookings dengan (id, booking_time) sehingga hanya satu partisi dibaca.
+-- Dijaga trigger statement-level di parent. Insert/delete langsung ke partisi (pemindahan row
+-- bookings_default di create_bookings_partition) tidak mengubah pasangan id/booking_time,
+-- partisi yang di-drop oleh archive-partitions dibersihkan oleh aplikasi.
+-- booking_time tidak pernah di-update oleh aplikasi (reschedule = booking baru).
+CREATE TABLE IF NOT EXISTS booking_keys (
+    id integer PRIMARY KEY,
+    booking_time timestamp NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_booking_keys_booking_time ON booking_keys (booking_time);
+
+CREATE OR REPLACE FUNCTION booking_keys_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO booking_keys (id, booking_time)
+    SELECT id, booking_time FROM inserted
+    ON CONFLICT (id) DO UPDATE SET booking_time = EXCLUDED.booking_time;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION booking_keys_delete() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM booking_keys k
+    USING deleted d
+    WHERE k.id = d.id AND k.booking_time = d.booking_time;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bookings_keys_insert ON bookings;
+CREATE TRIGGER bookings_keys_insert
+    AFTER INSERT ON bookings
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION booking_keys_insert();
+
+DROP TRIGGER IF EXISTS bookings_keys_delete ON bookings;
+CREATE TRIGGER bookings_keys_delete
+    AFTER DELETE ON bookings
+    REFERENCING OLD TABLE AS deleted
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION booking_keys_delete();
+
+INSERT INTO booking_keys (id, booking_time)
+SELECT id, booking_time FROM bookings
+ON CONFLICT (id) DO NOTHING;
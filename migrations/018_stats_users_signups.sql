@@ -0,0 +1,3 @@
+-- stats_users_daily sekarang menghitung semua signup (tanpa filter status user).
+-- Watermark di-reset supaya refresh berikutnya menghitung ulang semua bucket.
+UPDATE stats_watermarks SET refreshed_at = '-infinity' WHERE name = 'admin_stats';
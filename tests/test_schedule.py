@@ -0,0 +1,132 @@
+import unittest
+from datetime import datetime
+
+from api.utils.schedule import (
+    SLOTS_PER_DAY, align_up, clear_range, compile_working_hours, free_windows, slot_offset,
+    slot_offset_ceil, window_mask
+)
+
+
+def slot(day, hour, minute=0):
+    """Index bit bitmap mingguan untuk hari (0 = Senin) dan jam tertentu"""
+    return day * SLOTS_PER_DAY + (hour * 60 + minute) // 15
+
+def bits(*ranges):
+    """Bitmap dari range bit [start, end)"""
+    mask = 0
+    for start, end in ranges:
+        mask |= ((1 << (end - start)) - 1) << start
+    return mask
+
+
+class CompileWorkingHoursTest(unittest.TestCase):
+    def test_daily_string_applies_to_every_day(self):
+        mask = compile_working_hours("09:00-17:00")
+        expected = 0
+        for day in range(7):
+            expected |= bits((slot(day, 9), slot(day, 17)))
+        self.assertEqual(mask, expected)
+
+    def test_day_names_and_multiple_ranges(self):
+        mask = compile_working_hours({"senin": ["09:00-12:00", "13:00-15:00"], "sunday": "08:00-09:00"})
+        self.assertEqual(mask, bits(
+            (slot(0, 9), slot(0, 12)), (slot(0, 13), slot(0, 15)), (slot(6, 8), slot(6, 9))
+        ))
+
+    def test_partial_slots_shrink_inward(self):
+        # mulai dibulatkan ke atas (09:10 -> 09:15), selesai ke bawah (10:50 -> 10:45)
+        mask = compile_working_hours([{"day": "monday", "start": "09:10", "end": "10:50"}])
+        self.assertEqual(mask, bits((slot(0, 9, 15), slot(0, 10, 45))))
+
+    def test_range_shorter_than_a_slot_is_empty(self):
+        self.assertEqual(compile_working_hours({"monday": "09:05-09:14"}), 0)
+
+    def test_json_string_is_parsed(self):
+        self.assertEqual(
+            compile_working_hours('{"tuesday": "10:00-11:00"}'),
+            bits((slot(1, 10), slot(1, 11)))
+        )
+
+    def test_malformed_values_fall_back_to_zero(self):
+        for working_hours in (
+            None,
+            "",
+            "by appointment",
+            {"monday": "9am-5pm"},
+            {"monday": {"start": "09:00"}},
+            [{"day": "monday", "start": "25:00", "end": "26:00"}],
+            {"monday": "09:00-17:00", "tuesday": "nine-five"},
+            42,
+        ):
+            with self.subTest(working_hours=working_hours):
+                self.assertEqual(compile_working_hours(working_hours), 0)
+
+    def test_unknown_day_is_ignored(self):
+        self.assertEqual(compile_working_hours({"funday": "09:00-17:00"}), 0)
+
+
+class WindowMaskTest(unittest.TestCase):
+    # 2024-01-07 adalah hari Minggu
+    SUNDAY = datetime(2024, 1, 7)
+
+    def test_window_wraps_from_sunday_to_monday(self):
+        weekly = compile_working_hours({"sunday": "22:00-24:00", "monday": "00:00-01:00"})
+        window = window_mask(weekly, self.SUNDAY.replace(hour=23), 12)
+        # 23:00-24:00 Minggu (bit 0-3) dan 00:00-01:00 Senin (bit 4-7), 01:00-02:00 kosong
+        self.assertEqual(window, bits((0, 8)))
+
+    def test_window_is_truncated_to_slots(self):
+        weekly = compile_working_hours("00:00-24:00")
+        self.assertEqual(window_mask(weekly, self.SUNDAY.replace(hour=12), 10), bits((0, 10)))
+
+    def test_window_starting_mid_day(self):
+        weekly = compile_working_hours({"monday": "09:00-10:00"})
+        window = window_mask(weekly, datetime(2024, 1, 8, 8, 30), 8)
+        self.assertEqual(window, bits((2, 6)))
+
+
+class FreeWindowsTest(unittest.TestCase):
+    def test_single_run(self):
+        # 8 slot bebas, sesi 4 slot: bisa mulai di slot 0-4
+        self.assertEqual(free_windows(bits((0, 8)), 4), [(0, 8)])
+
+    def test_run_exactly_as_long_as_length(self):
+        self.assertEqual(free_windows(bits((3, 7)), 4), [(3, 7)])
+
+    def test_length_longer_than_any_run(self):
+        self.assertEqual(free_windows(bits((0, 4), (6, 10)), 5), [])
+
+    def test_multiple_runs(self):
+        self.assertEqual(free_windows(bits((0, 4), (6, 10)), 2), [(0, 4), (6, 10)])
+
+    def test_booked_slots_split_a_run(self):
+        mask = clear_range(bits((0, 8)), 2, 4)
+        self.assertEqual(mask, bits((0, 2), (4, 8)))
+        self.assertEqual(free_windows(mask, 2), [(0, 2), (4, 8)])
+        self.assertEqual(free_windows(mask, 3), [(4, 8)])
+
+    def test_empty_mask(self):
+        self.assertEqual(free_windows(0, 1), [])
+
+
+class SlotArithmeticTest(unittest.TestCase):
+    def test_align_up(self):
+        self.assertEqual(align_up(datetime(2024, 1, 8, 9, 7)), datetime(2024, 1, 8, 9, 15))
+        self.assertEqual(align_up(datetime(2024, 1, 8, 9, 15)), datetime(2024, 1, 8, 9, 15))
+        self.assertEqual(align_up(datetime(2024, 1, 8, 9, 15, 30)), datetime(2024, 1, 8, 9, 30))
+        self.assertEqual(align_up(datetime(2024, 1, 7, 23, 50)), datetime(2024, 1, 8, 0, 0))
+
+    def test_slot_offsets_round_in_opposite_directions(self):
+        origin = datetime(2024, 1, 8, 9, 0)
+        value = datetime(2024, 1, 8, 9, 20)
+        self.assertEqual(slot_offset(value, origin), 1)
+        self.assertEqual(slot_offset_ceil(value, origin), 2)
+        self.assertEqual(slot_offset(datetime(2024, 1, 8, 9, 30), origin), 2)
+        self.assertEqual(slot_offset_ceil(datetime(2024, 1, 8, 9, 30), origin), 2)
+
+    def test_clear_range_empty_range_is_noop(self):
+        self.assertEqual(clear_range(bits((0, 8)), 5, 5), bits((0, 8)))
+
+
+if __name__ == "__main__":
+    unittest.main()